@@ -0,0 +1,345 @@
+"""JSON API for the planner, served by a single asyncio process.
+
+One process serves any number of concurrent clients over HTTP/1.1 (TCP
+or a Unix socket) instead of one terminal process per user. Requests run
+the same operations as the menus (see service.py) on a small thread
+pool; requests for the same workspace run one at a time, in order.
+
+Usage:
+    python3 api_server.py [--host HOST] [--port PORT] [--socket PATH]
+
+Routes (bodies and replies are JSON):
+    GET    /trips?from=DATE&to=DATE, /trips?on=DATE
+    GET    /itinerary?trip_id=ID&from=DATE&to=DATE
+    GET    /expenses?trip_id=ID&category=NAME
+    POST   /trips, /itinerary, /expenses        {"id": ID, fields...}
+    GET    /trips/ID, /itinerary/ID, /expenses/ID
+    PATCH  /trips/ID, /itinerary/ID, /expenses/ID   {fields to change}
+    DELETE /trips/ID, /itinerary/ID, /expenses/ID
+    GET    /summary
+    GET    /search?q=TEXT
+    GET    /analytics?by=category|trip|day&trip_id=ID&category=NAME
+
+Lists and searches take ?offset=N&limit=N (100 by default, at most
+1000); search results come best first, each with its "collection".
+Analytics replies with the total spent and its breakdown by category
+(the default), trip or day, from the spending rollups, in USD, and the
+number of expenses "left_out" for want of an exchange rate to USD. Trips
+and expenses take an optional "currency" (see currency.py). POST
+assigns the next ID when "id" is left out, and replies with the record
+and its ID. When the
+data is split by tenant (see tenants.py), the X-Workspace header names
+the workspace of a request.
+"""
+import argparse
+import asyncio
+import json
+from collections import OrderedDict
+from functools import partial
+from itertools import islice
+from urllib.parse import parse_qsl, urlsplit
+
+import tenants
+from repository import Repository, open_store
+from service import NotFoundError, PlannerService, ServiceError, parse_date
+from storage import ConflictError, StorageError
+
+# Workspaces kept loaded; the least recently used one is dropped beyond
+MAX_OPEN_WORKSPACES = 256
+MAX_BODY_BYTES = 1 << 20
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+    413: "Payload Too Large", 500: "Internal Server Error",
+}
+
+# collection -> (list, get, add, update, delete) service methods
+ROUTES = {
+    "trips": (
+        "list_trips", "get_trip", "add_trip", "update_trip", "delete_trip"
+    ),
+    "itinerary": (
+        "list_itinerary", "get_itinerary_entry", "add_itinerary_entry",
+        "update_itinerary_entry", "delete_itinerary_entry"
+    ),
+    "expenses": (
+        "list_expenses", "get_expense", "add_expense", "update_expense",
+        "delete_expense"
+    ),
+}
+
+
+class HttpError(Exception):
+    """Raised to answer a request with an error status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _date(query, name):
+    value = query.get(name)
+    if not value:
+        return None
+    date = parse_date(value)
+    if date is None:
+        raise HttpError(400, f"Invalid {name} date. Use YYYY-MM-DD.")
+    return date
+
+
+def _number(query, name, default, maximum=None):
+    value = query.get(name, "")
+    if not value:
+        return default
+    if not value.isdigit():
+        raise HttpError(400, f"{name} must be a non-negative number.")
+    return min(int(value), maximum) if maximum else int(value)
+
+
+def list_filters(collection, query):
+    """Returns the list method's arguments for a query string."""
+    if collection == "trips":
+        if query.get("on"):
+            # The trips under way on a day
+            return _date(query, "on"), _date(query, "on")
+        return _date(query, "from"), _date(query, "to")
+    if collection == "itinerary":
+        return (
+            query.get("trip_id"), _date(query, "from"), _date(query, "to")
+        )
+    return query.get("trip_id"), query.get("category")
+
+
+def _plain(value):
+    """Converts numpy scalars for json.dumps."""
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def handle(service, method, path, query, body):
+    """Runs one request against a workspace; returns (status, reply).
+
+    Runs on a worker thread.
+    """
+    service.repo.refresh()
+    parts = [part for part in path.split("/") if part]
+    if parts == ["summary"]:
+        if method != "GET":
+            raise HttpError(405, "Use GET.")
+        return 200, [
+            {"id": trip_id, **result.record}
+            for trip_id, result in service.summary()
+        ]
+    if parts == ["search"]:
+        if method != "GET":
+            raise HttpError(405, "Use GET.")
+        if not query.get("q", "").strip():
+            raise HttpError(400, "Give the words to search for as q.")
+        offset = _number(query, "offset", 0)
+        limit = _number(query, "limit", DEFAULT_LIMIT, MAX_LIMIT)
+        return 200, [
+            {"collection": collection, "id": record_id, **record}
+            for collection, record_id, record in service.search(
+                query["q"], offset + limit
+            )[offset:]
+        ]
+    if parts == ["analytics"]:
+        if method != "GET":
+            raise HttpError(405, "Use GET.")
+        dimension = query.get("by", "category")
+        filters = query.get("trip_id"), query.get("category")
+        amount, count = service.spend_total(*filters)
+        return 200, {
+            "amount": amount,
+            "count": count,
+            "left_out": service.spend_left_out(*filters),
+            "by": [
+                {dimension: key, "amount": amount, "count": count}
+                for key, amount, count in service.spend_by(
+                    dimension, *filters
+                )
+            ],
+        }
+    if not parts or parts[0] not in ROUTES or len(parts) > 2:
+        raise HttpError(404, "No such route.")
+    list_name, get_name, add_name, update_name, delete_name = (
+        ROUTES[parts[0]]
+    )
+
+    if len(parts) == 1:
+        if method == "GET":
+            records = getattr(service, list_name)(
+                *list_filters(parts[0], query)
+            )
+            offset = _number(query, "offset", 0)
+            limit = _number(query, "limit", DEFAULT_LIMIT, MAX_LIMIT)
+            return 200, [
+                {"id": record_id, **record} for record_id, record
+                in islice(records, offset, offset + limit)
+            ]
+        if method == "POST":
+            record_id, record = getattr(service, add_name)(
+                str(body.get("id", "")), body
+            )
+            return 201, {"id": record_id, **record}
+        raise HttpError(405, "Use GET or POST.")
+
+    record_id = parts[1]
+    if method == "GET":
+        record = getattr(service, get_name)(record_id)
+    elif method == "PATCH":
+        body.pop("id", None)
+        record = getattr(service, update_name)(record_id, body)
+    elif method == "DELETE":
+        getattr(service, delete_name)(record_id)
+        return 204, None
+    else:
+        raise HttpError(405, "Use GET, PATCH or DELETE.")
+    return 200, {"id": record_id, **record}
+
+
+class ApiServer:
+    """Serves the API, keeping a loaded service per workspace."""
+
+    def __init__(self):
+        self.workspaces = OrderedDict()  # workspace -> (service, lock)
+
+    def _open(self, workspace):
+        return PlannerService(Repository(open_store(workspace or None)))
+
+    async def workspace(self, headers):
+        """Returns the (service, lock) of a request's workspace."""
+        workspace = ""
+        if tenants.tenant_root() is not None:
+            workspace = headers.get("x-workspace", "")
+            if not tenants.valid_tenant(workspace):
+                raise HttpError(
+                    400, "Name the workspace in the X-Workspace header."
+                )
+        if workspace in self.workspaces:
+            self.workspaces.move_to_end(workspace)
+            return self.workspaces[workspace]
+        service = await asyncio.get_running_loop().run_in_executor(
+            None, self._open, workspace
+        )
+        # Another request may have opened it meanwhile
+        entry = self.workspaces.setdefault(
+            workspace, (service, asyncio.Lock())
+        )
+        while len(self.workspaces) > MAX_OPEN_WORKSPACES:
+            self.workspaces.popitem(last=False)
+        return entry
+
+    async def respond(self, method, target, headers, body):
+        """Answers one request; returns (status, reply)."""
+        url = urlsplit(target)
+        query = dict(parse_qsl(url.query))
+        try:
+            if body:
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    raise HttpError(400, "The body is not valid JSON.")
+                if not isinstance(body, dict):
+                    raise HttpError(400, "The body must be a JSON object.")
+            else:
+                body = {}
+            service, lock = await self.workspace(headers)
+            async with lock:
+                return await asyncio.get_running_loop().run_in_executor(
+                    None,
+                    partial(handle, service, method, url.path, query, body)
+                )
+        except HttpError as e:
+            return e.status, {"error": str(e)}
+        except NotFoundError as e:
+            return 404, {"error": str(e)}
+        except ConflictError as e:
+            return 409, {"error": str(e)}
+        except (ServiceError, StorageError) as e:
+            return 400, {"error": str(e)}
+
+    async def serve_client(self, reader, writer):
+        """Serves the requests of one connection, keeping it alive."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = (
+                        request_line.decode("latin-1").split()
+                    )
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    status, reply = 413, {"error": "The body is too large."}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    try:
+                        status, reply = await self.respond(
+                            method.upper(), target, headers, body
+                        )
+                    except Exception as e:
+                        status, reply = 500, {"error": str(e)}
+                    keep_alive = (
+                        headers.get("connection", "").lower() != "close"
+                        and version == "HTTP/1.1"
+                    )
+
+                payload = b"" if reply is None else json.dumps(
+                    reply, default=_plain
+                ).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                    "\r\n\r\n".encode("latin-1") + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host, port, socket_path):
+    """Runs the API server until cancelled."""
+    api = ApiServer()
+    if socket_path:
+        server = await asyncio.start_unix_server(
+            api.serve_client, socket_path
+        )
+    else:
+        server = await asyncio.start_server(api.serve_client, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the planner API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--socket", help="listen on this Unix socket")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,58 @@
+"""Compares the memory used by expenses as dicts and as columns.
+
+Usage:
+    python benchmarks/expense_memory.py [expenses]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import ExpenseColumns  # noqa: E402
+from summary_scaling import make_data  # noqa: E402
+
+
+def measure(build):
+    """Returns (bytes allocated, seconds) for building an object."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size, seconds
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    # Round-trip through JSON so the dicts look like loaded data
+    text = json.dumps(make_data(count)[2])
+    dict_bytes, _ = measure(lambda: json.loads(text))
+    expenses = json.loads(text)
+    column_bytes, seconds = measure(lambda: ExpenseColumns(expenses))
+    print(f"{count} expenses")
+    print(f"dict of dicts: {dict_bytes / count:7.1f} bytes/expense")
+    print(f"columns:       {column_bytes / count:7.1f} bytes/expense "
+          f"(built in {seconds:.2f} s)")
+
+    columns = ExpenseColumns(expenses)
+    trip_id = expenses["1"]["trip_id"]
+    start = time.perf_counter()
+    sum(
+        float(expense["amount"]) for expense in expenses.values()
+        if expense["trip_id"] == trip_id
+    )
+    scan = time.perf_counter() - start
+    start = time.perf_counter()
+    columns.spent_cents(trip_id)
+    lookup = time.perf_counter() - start
+    print(f"remaining-budget scan: {scan * 1000:.1f} ms, "
+          f"column lookup: {lookup * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Times the planner's hot paths on synthetic data and reports JSON.
+
+For each size, a data set is generated (see synthetic_data.py) in a
+temporary directory and the following are timed, keeping every run:
+
+- load_data and save_data of each collection file
+- loading the repository, as a session does when it starts
+- searching, once the search index is built
+- add_expense (including its remaining-budget lookup), show_summary
+  (from scratch and from the summary cache) and the view functions,
+  driven through their prompts with scripted input and with their
+  output thrown away
+
+Expenses are skewed towards a few trips (--skew 1 by default). The
+results are written as JSON, together with the commit and Python
+version, so runs of different versions can be compared. Large sizes
+need memory in proportion: the repository holds every collection.
+
+Usage:
+    python benchmarks/hot_paths.py [--sizes 1k,10k,100k] [--skew S]
+        [--repeat N] [--output FILE]
+"""
+import argparse
+import builtins
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from functools import partial
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import codec  # noqa: E402
+import repository  # noqa: E402
+import run  # noqa: E402
+from storage import JsonStore, load_data, save_data  # noqa: E402
+from summary_cache import SummaryCache  # noqa: E402
+from synthetic_data import parse_count, write_data  # noqa: E402
+
+# Trip 1 gets the most expenses when the data is skewed
+BUSIEST_TRIP = "1"
+
+
+@contextmanager
+def scripted(answers):
+    """Feeds answers to input() and throws away what is printed."""
+    answers = iter(answers)
+
+    def scripted_input(prompt=""):
+        try:
+            return next(answers)
+        except StopIteration:
+            raise RuntimeError(f"No scripted answer for {prompt!r}")
+
+    real_input, real_file = builtins.input, run.console.file
+    builtins.input = scripted_input
+    run.console.file = io.StringIO()
+    try:
+        with redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        builtins.input, run.console.file = real_input, real_file
+
+
+def timings(function, repeat, setup=None):
+    """Returns the seconds taken by each of repeat calls of function."""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def menu(function, *answers):
+    """Returns a call of a menu function answering its prompts."""
+    def call():
+        with scripted(answers):
+            function()
+    return call
+
+
+def bench_size(directory, expense_count, skew, repeat):
+    """Yields (benchmark, seconds per run) for one data set."""
+    write_data(directory, expense_count, skew=skew)
+
+    for collection in ("trips", "itinerary", "expenses"):
+        path = os.path.join(directory, collection + ".json")
+        copy = os.path.join(directory, "copy-" + collection + ".json")
+        yield f"load_data {collection}", timings(
+            lambda: load_data(path), repeat
+        )
+        yield f"save_data {collection}", timings(
+            partial(save_data, copy, load_data(path)), repeat
+        )
+
+    # The first load also builds and stores the ledger
+    repository._repository = repository.Repository(JsonStore(directory))
+    yield "load repository", timings(
+        lambda: repository.Repository(JsonStore(directory)), repeat
+    )
+    repo = repository._repository
+
+    def clear_cache():
+        repo.summary_cache = SummaryCache()
+
+    yield "show_summary", timings(
+        menu(run.show_summary), repeat, clear_cache
+    )
+    yield "show_summary cached", timings(menu(run.show_summary), repeat)
+    yield "view_trips", timings(menu(run.view_trips, "", "", "q"), repeat)
+    yield "view_itineraries", timings(
+        menu(run.view_itineraries, "", "", "", "q"), repeat
+    )
+    yield "view_expenses", timings(
+        menu(run.view_expenses, "", "", "q"), repeat
+    )
+    yield "view_expenses one trip", timings(
+        menu(run.view_expenses, BUSIEST_TRIP, "", "q"), repeat
+    )
+    repo.search(BUSIEST_TRIP)  # Builds the search index
+    yield "search", timings(
+        lambda: repo.search(f"city {BUSIEST_TRIP}", run.MAX_SEARCH_RESULTS),
+        repeat
+    )
+
+    def clear_cube():
+        repo.spend_cube = None
+
+    yield "show_analytics", timings(
+        menu(run.show_analytics, "", "", "q"), repeat, clear_cube
+    )
+    yield "show_analytics cached", timings(
+        menu(run.show_analytics, "", "", "q"), repeat
+    )
+    yield "add_expense", timings(
+        menu(
+            run.add_expense, "", BUSIEST_TRIP, "", "12.50", "food",
+            "Benchmark", ""
+        ),
+        repeat
+    )
+    repository._repository = None
+
+
+def commit():
+    """Returns the checked-out commit, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the planner's hot paths on synthetic data."
+    )
+    parser.add_argument(
+        "--sizes", default="1k,10k,100k",
+        help="comma-separated expense counts, e.g. 1k,100k,10M"
+    )
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the JSON here")
+    args = parser.parse_args()
+
+    # The store is opened directly on the generated data
+    for name in (repository.tenants.TENANT_ROOT_ENV, "TRAVEL_PLANNER_DB"):
+        os.environ.pop(name, None)
+
+    results = []
+    for size in map(parse_count, args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, runs in bench_size(
+                directory, size, args.skew, args.repeat
+            ):
+                print(f"{size:>10} {name:<24} {min(runs):>9.4f}s",
+                      file=sys.stderr)
+                results.append({
+                    "expenses": size, "benchmark": name,
+                    "best": min(runs), "runs": runs,
+                })
+
+    report = json.dumps({
+        "commit": commit(),
+        "python": platform.python_version(),
+        "orjson": codec.orjson is not None,
+        "format": codec.snapshot_format(),
+        "skew": args.skew,
+        "repeat": args.repeat,
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compares loading expenses from the snapshot formats.
+
+For each format, synthetic expenses are saved as a snapshot, then the
+expense columns are built from it the way the repository does at start
+up (peak memory allocated, as traced by tracemalloc).
+
+Usage:
+    python benchmarks/record_file.py [expenses]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from columnar import ExpenseColumns  # noqa: E402
+from storage import JsonStore, save_data  # noqa: E402
+from summary_scaling import make_data  # noqa: E402
+
+
+def load_columns(store):
+    """Builds the expense columns the way the repository does."""
+    columns = ExpenseColumns()
+    for expense_id, expense in store.stream("expenses"):
+        columns.put(expense_id, expense)
+    return columns
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    expenses = make_data(count)[2]
+    print(f"{count} expenses")
+    print(f"{'format':<8} {'load peak':>12} {'load':>8}")
+
+    for name in ("table", "records"):
+        with tempfile.TemporaryDirectory() as directory:
+            os.environ[codec.FORMAT_ENV] = name
+            save_data(os.path.join(directory, "expenses.json"), expenses)
+
+            store = JsonStore(directory)
+            start = time.perf_counter()
+            load_columns(store)
+            seconds = time.perf_counter() - start
+            # Traced separately: tracing slows the load down many times
+            tracemalloc.start()
+            load_columns(store)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{name:<8} {peak / 2 ** 20:>9.1f} MB {seconds:>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
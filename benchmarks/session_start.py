@@ -0,0 +1,74 @@
+"""Measures the time to the first menu in a new terminal session.
+
+Compares a cold ``python3 run.py`` with a session from the warm session
+server's pool. Each run starts on a fresh pseudo-terminal, as the web
+terminal does, and stops the clock when the main menu prompt appears.
+
+Usage:
+    python benchmarks/session_start.py [runs]
+"""
+import os
+import pty
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = b"Choose an option: "
+
+
+def time_to_menu(args):
+    """Returns the seconds until the main menu prompt is shown."""
+    master, slave = pty.openpty()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        args, cwd=ROOT, stdin=slave, stdout=slave, stderr=slave,
+        start_new_session=True
+    )
+    os.close(slave)
+    output = b""
+    while PROMPT not in output:
+        output += os.read(master, 65536)
+    elapsed = time.perf_counter() - start
+    os.write(master, b"5\n")
+    try:
+        while os.read(master, 65536):
+            pass
+    except OSError:
+        pass  # EIO once the session has closed the terminal
+    process.wait()
+    os.close(master)
+    return elapsed
+
+
+def median_time(args, runs):
+    return statistics.median(time_to_menu(args) for _ in range(runs))
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    python = sys.executable
+    socket_path = os.path.join(tempfile.mkdtemp(), "planner.sock")
+    server = subprocess.Popen(
+        [python, "session_server.py", socket_path], cwd=ROOT
+    )
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.05)
+        results = {
+            "cold python3 run.py": median_time([python, "run.py"], runs),
+            "warm session": median_time(
+                [python, "session_client.py", socket_path], runs
+            ),
+        }
+    finally:
+        server.terminate()
+        server.wait()
+    for name, seconds in results.items():
+        print(f"{name:<22} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Measures how long the planner takes to import and to start up.
+
+Each measurement runs a fresh interpreter, so it includes everything a
+new terminal session pays before the user sees the main menu.
+
+Usage:
+    python benchmarks/startup.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(args, stdin="", runs=10):
+    """Returns the median wall time of a command over several runs."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            args, input=stdin, cwd=ROOT, text=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True
+        )
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    python = sys.executable
+    baseline = time_command([python, "-c", "pass"], runs=runs)
+    results = {
+        "bare interpreter": baseline,
+        "import run": time_command([python, "-c", "import run"], runs=runs),
+        "start and exit from menu": time_command(
+            [python, "run.py"], stdin="5\n", runs=runs
+        ),
+    }
+    for name, seconds in results.items():
+        print(f"{name:<26} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Compares the snapshot formats for size and save/load speed.
+
+Synthetic expenses are saved and loaded through storage.py in every
+format of codec.py. "indent=4 json" is how the files used to be written:
+indented JSON through the standard library.
+
+Usage:
+    python benchmarks/storage_formats.py [expenses]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from storage import load_data, save_data  # noqa: E402
+from summary_scaling import make_data  # noqa: E402
+
+
+def best_of(function, repeat=3):
+    """Returns the shortest of a few timings of a function, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def legacy_save(path, records):
+    with open(path, "w") as file:
+        file.write(json.dumps(records, indent=4))
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def legacy_load(path):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    expenses = make_data(count)[2]
+    print(f"{count} expenses, orjson "
+          + ("installed" if codec.orjson else "not installed"))
+    print(f"{'format':<16} {'size':>12} {'save':>9} {'load':>9}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "expenses.json")
+        save = best_of(lambda: legacy_save(path, expenses))
+        load = best_of(lambda: legacy_load(path))
+        size = os.path.getsize(path)
+        print(f"{'indent=4 json':<16} {size:>12,} {save:>8.3f}s {load:>8.3f}s")
+
+        for name in sorted(codec.ENCODERS):
+            os.environ[codec.FORMAT_ENV] = name
+            save = best_of(lambda: save_data(path, expenses))
+            load = best_of(lambda: load_data(path))
+            assert load_data(path) == expenses
+            size = os.path.getsize(path)
+            print(f"{name:<16} {size:>12,} {save:>8.3f}s {load:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
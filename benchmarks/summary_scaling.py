@@ -0,0 +1,78 @@
+"""Shows how the Summary screen scales with the number of expenses.
+
+Synthetic trips, itinerary entries and expenses are generated in memory
+(one trip per 100 expenses, one activity per 5) and the summary is built
+and rendered into a buffer, so only the computation is timed, not the
+terminal.
+
+Usage:
+    python benchmarks/summary_scaling.py [max_expenses]
+"""
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summary import build_summary, render_summary  # noqa: E402
+
+CATEGORIES = ["food", "transport", "accommodation", "sightseeing", "other"]
+
+
+def make_data(expense_count, seed=1):
+    """Returns synthetic (trips, itinerary, expenses) collections."""
+    rng = random.Random(seed)
+    trip_count = max(1, expense_count // 100)
+    trips = {
+        str(i): {
+            "destination": f"City {i}",
+            "start_date": "2030-01-01",
+            "end_date": "2030-01-10",
+            "budget": str(rng.randint(100, 10000))
+        }
+        for i in range(1, trip_count + 1)
+    }
+    itinerary = {
+        str(i): {
+            "trip_id": str(rng.randint(1, trip_count)),
+            "date": "2030-01-05",
+            "activity": f"Activity {i}"
+        }
+        for i in range(1, expense_count // 5 + 1)
+    }
+    expenses = {
+        str(i): {
+            "trip_id": str(rng.randint(1, trip_count)),
+            "amount": round(rng.uniform(1, 200), 2),
+            "category": rng.choice(CATEGORIES),
+            "description": f"Expense {i}"
+        }
+        for i in range(1, expense_count + 1)
+    }
+    return trips, itinerary, expenses
+
+
+def time_summary(trips, itinerary, expenses):
+    """Returns the seconds taken to build and render the summary."""
+    start = time.perf_counter()
+    summary = build_summary(trips, itinerary, expenses)
+    buffer = io.StringIO()
+    for block in render_summary(summary):
+        buffer.write(block)
+    return time.perf_counter() - start
+
+
+def main():
+    max_expenses = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    size = 1000
+    print(f"{'expenses':>10} {'seconds':>9} {'us/expense':>11}")
+    while size <= max_expenses:
+        seconds = time_summary(*make_data(size))
+        print(f"{size:>10} {seconds:>9.3f} {seconds / size * 1e6:>11.2f}")
+        size *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Generates synthetic trips, itinerary entries and expenses.
+
+By default there is one trip per 100 expenses and one itinerary entry
+per 5. Trips start on random days over two years from 2030 and last up
+to three weeks; activities and expenses fall inside their trip. With
+--skew above 0, expenses and activities go to trips by a Zipf-like law
+(trip N gets about 1 / N ** skew of the share of trip 1), so a few trips
+hold most of the data, as in a real planner; 0 spreads them evenly.
+
+Records are generated and written in chunks, so even 10 million
+expenses never need to be held in memory at once. The files are plain
+compact JSON, which the store reads whatever TRAVEL_PLANNER_FORMAT is.
+
+Usage:
+    python benchmarks/synthetic_data.py [--trips N] [--skew S]
+        [--seed N] EXPENSES DIR
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+from itertools import accumulate, islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import codec  # noqa: E402
+from repository import COLLECTIONS  # noqa: E402
+
+CATEGORIES = ["food", "transport", "accommodation", "sightseeing", "other"]
+FIRST_DAY = date(2030, 1, 1)
+CHUNK_SIZE = 100000
+
+
+def parse_count(text):
+    """Parses a row count such as 5000, 10k or 2M."""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+class SyntheticData:
+    """Streams the synthetic collections for one size and seed."""
+
+    def __init__(self, expense_count, trip_count=None, skew=0.0, seed=1):
+        self.expense_count = expense_count
+        self.trip_count = trip_count or max(1, expense_count // 100)
+        self.itinerary_count = expense_count // 5
+        self.rng = random.Random(seed)
+        self.starts = [
+            self.rng.randrange(730) for _ in range(self.trip_count)
+        ]
+        self.lengths = [
+            self.rng.randrange(1, 22) for _ in range(self.trip_count)
+        ]
+        self.cum_weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, self.trip_count + 1)
+        ))
+
+    def _trip_ids(self, count):
+        """Returns count trip numbers drawn by the trips' weights."""
+        return self.rng.choices(
+            range(1, self.trip_count + 1), cum_weights=self.cum_weights,
+            k=count
+        )
+
+    def _day(self, offset):
+        return (FIRST_DAY + timedelta(days=offset)).isoformat()
+
+    def trips(self):
+        """Yields (trip ID, trip) pairs."""
+        for number, (start, length) in enumerate(
+            zip(self.starts, self.lengths), start=1
+        ):
+            yield str(number), {
+                "destination": f"City {number}",
+                "start_date": self._day(start),
+                "end_date": self._day(start + length - 1),
+                "budget": str(self.rng.randint(100, 10000))
+            }
+
+    def itinerary(self):
+        """Yields (itinerary ID, entry) pairs."""
+        record_id = 0
+        for chunk_start in range(0, self.itinerary_count, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, self.itinerary_count - chunk_start)
+            for number in self._trip_ids(count):
+                record_id += 1
+                day = self.starts[number - 1] + self.rng.randrange(
+                    self.lengths[number - 1]
+                )
+                yield str(record_id), {
+                    "trip_id": str(number),
+                    "date": self._day(day),
+                    "activity": f"Activity {record_id}"
+                }
+
+    def expenses(self):
+        """Yields (expense ID, expense) pairs."""
+        record_id = 0
+        for chunk_start in range(0, self.expense_count, CHUNK_SIZE):
+            count = min(CHUNK_SIZE, self.expense_count - chunk_start)
+            for number in self._trip_ids(count):
+                record_id += 1
+                day = self.starts[number - 1] + self.rng.randrange(
+                    self.lengths[number - 1]
+                )
+                yield str(record_id), {
+                    "trip_id": str(number),
+                    "amount": round(self.rng.uniform(1, 200), 2),
+                    "category": self.rng.choice(CATEGORIES),
+                    "description": f"Expense {record_id}",
+                    "date": self._day(day)
+                }
+
+    def collections(self):
+        """Returns {collection: record pair iterator}, trips first."""
+        return {
+            "trips": self.trips(),
+            "itinerary": self.itinerary(),
+            "expenses": self.expenses(),
+        }
+
+
+def make_data(expense_count, trip_count=None, skew=0.0, seed=1):
+    """Returns synthetic (trips, itinerary, expenses) in memory."""
+    data = SyntheticData(expense_count, trip_count, skew, seed)
+    return tuple(dict(pairs) for pairs in data.collections().values())
+
+
+def write_collection(path, pairs):
+    """Writes (record ID, record) pairs as a JSON snapshot, in chunks."""
+    with open(path, "wb") as file:
+        file.write(b"{")
+        first = True
+        while True:
+            chunk = dict(islice(pairs, CHUNK_SIZE))
+            if not chunk:
+                break
+            if not first:
+                file.write(b",")
+            file.write(codec.dumps(chunk)[1:-1])
+            first = False
+        file.write(b"}")
+
+
+def write_data(directory, expense_count, trip_count=None, skew=0.0, seed=1):
+    """Writes a synthetic data set, replacing any data already there."""
+    os.makedirs(directory, exist_ok=True)
+    for collection in COLLECTIONS:
+        for suffix in (".json", ".json.wal", ".json.wal.old"):
+            path = os.path.join(directory, collection + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+    data = SyntheticData(expense_count, trip_count, skew, seed)
+    for collection, pairs in data.collections().items():
+        write_collection(
+            os.path.join(directory, collection + ".json"), pairs
+        )
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write synthetic planner data to a directory."
+    )
+    parser.add_argument("expenses", type=parse_count)
+    parser.add_argument("directory")
+    parser.add_argument("--trips", type=parse_count)
+    parser.add_argument("--skew", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    data = write_data(
+        args.directory, args.expenses, args.trips, args.skew, args.seed
+    )
+    print(f"Wrote {data.trip_count} trips, {data.itinerary_count} "
+          f"itinerary entries and {data.expense_count} expenses to "
+          f"{args.directory}.")
+
+
+if __name__ == "__main__":
+    main()
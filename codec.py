@@ -0,0 +1,187 @@
+"""Serialization of the stored collections.
+
+Snapshots can be written in several formats, chosen with
+TRAVEL_PLANNER_FORMAT and told apart when read, so a directory can hold
+files in any of them:
+
+- "table" (the default with orjson): compact columnar JSON. Each run of
+  records with the same fields is stored as the field list, the record
+  IDs and one array per field, so field names are not repeated and
+  decoding builds a few long arrays rather than an object per record.
+- "json": the collection as compact JSON, keyed by record ID.
+- "pretty" (the default without orjson): the indented JSON the files
+  used to be, which people can read.
+- "records": one line per record plus an offset index, which the store
+  reads through a memory map (see recordfile.py); for collections too
+  large to hold as dicts.
+
+orjson (see requirements.txt) makes encoding and decoding several times
+faster, and the write-ahead log lines go through the same fast path.
+Where it is not installed the standard library is used, which gains
+too little from the compact formats to give up readable files, so
+"pretty" is then the default.
+
+Usage:
+    python run.py export [--format NAME] DIR
+"""
+import gc
+import json
+import os
+from contextlib import contextmanager
+from itertools import groupby, repeat
+from operator import itemgetter
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up
+    orjson = None
+
+FORMAT_ENV = "TRAVEL_PLANNER_FORMAT"
+DEFAULT_FORMAT = "table" if orjson is not None else "pretty"
+
+
+if orjson is not None:
+    def dumps(value):
+        """Encodes a value as compact JSON bytes."""
+        return orjson.dumps(value)
+
+    loads = orjson.loads
+else:
+    def dumps(value):
+        """Encodes a value as compact JSON bytes."""
+        return json.dumps(
+            value, separators=(",", ":"), ensure_ascii=False
+        ).encode("utf-8")
+
+    loads = json.loads
+
+
+@contextmanager
+def _gc_paused():
+    """Pauses the cycle collector while a collection is built or encoded.
+
+    Records hold no reference cycles, and otherwise the collections set
+    off by creating many containers take most of the time.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _encode_json(records):
+    return dumps(records)
+
+
+def _encode_pretty(records):
+    return json.dumps(records, indent=4).encode("utf-8")
+
+
+def _encode_table(records):
+    tables = []
+    # The work per record is left to C-level map(), zip() and groupby()
+    values = list(records.values())
+    for fields, run in groupby(
+        zip(map(tuple, values), records, values), key=itemgetter(0)
+    ):
+        _, ids, run_values = zip(*run)
+        tables.append({
+            "fields": fields,
+            "ids": ids,
+            "columns": list(zip(*map(dict.values, run_values))),
+        })
+    return dumps({"format": "table", "tables": tables})
+
+
+def _decode_table(data):
+    records = {}
+    for table in data["tables"]:
+        if not table["fields"]:
+            # Empty records have no columns to take the count from
+            records.update((record_id, {}) for record_id in table["ids"])
+            continue
+        records.update(zip(
+            table["ids"],
+            map(dict, map(
+                zip, repeat(table["fields"]), zip(*table["columns"])
+            ))
+        ))
+    return records
+
+
+def _encode_records(records):
+    # Imported here: recordfile builds on this module
+    import recordfile
+    return recordfile.encode(records)
+
+
+ENCODERS = {
+    "table": _encode_table,
+    "json": _encode_json,
+    "pretty": _encode_pretty,
+    "records": _encode_records,
+}
+
+
+def snapshot_format():
+    """Returns the format new snapshots are written in."""
+    name = os.environ.get(FORMAT_ENV) or DEFAULT_FORMAT
+    if name not in ENCODERS:
+        raise ValueError(
+            f"Unknown {FORMAT_ENV} {name!r}; use one of "
+            f"{', '.join(sorted(ENCODERS))}."
+        )
+    return name
+
+
+def encode(records, name=None):
+    """Encodes a collection (keyed by record ID) in a format."""
+    encoder = ENCODERS[name or snapshot_format()]
+    with _gc_paused():
+        return encoder(records)
+
+
+def decode(content):
+    """Decodes a collection written in any of the formats."""
+    import recordfile
+    if content[:len(recordfile.MAGIC)] == recordfile.MAGIC:
+        with _gc_paused():
+            return recordfile.decode(content)
+    with _gc_paused():
+        data = loads(content)
+        # Records are dicts, so a string "format" value can only be a
+        # header
+        if data.get("format") == "table":
+            return _decode_table(data)
+        return data
+
+
+def export_command(argv):
+    """Runs the export command; returns the process exit status."""
+    import argparse
+
+    from repository import COLLECTIONS, open_store
+
+    parser = argparse.ArgumentParser(
+        prog="run.py export",
+        description="Write every collection to a directory in a format."
+    )
+    parser.add_argument("directory")
+    parser.add_argument(
+        "--format", choices=sorted(ENCODERS), default="pretty"
+    )
+    args = parser.parse_args(argv)
+
+    store = open_store()
+    os.makedirs(args.directory, exist_ok=True)
+    for collection in COLLECTIONS:
+        records = store.load(collection)
+        with open(
+            os.path.join(args.directory, collection + ".json"), "wb"
+        ) as file:
+            file.write(encode(records, args.format))
+        print(f"Exported {len(records)} {collection} record(s).")
+    return 0
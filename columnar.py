@@ -0,0 +1,373 @@
+"""Compact column-wise storage of expenses in integer cents.
+
+Instead of one dict per expense, every field is kept in its own
+contiguous array: amounts as int64 cents, trip IDs, categories and
+currencies as int32 codes into small interning tables, dates as int32
+day ordinals (0 for none) and descriptions as UTF-8 bytes in one shared
+buffer. Totals per trip and category are a single numpy pass over the
+arrays.
+"""
+from array import array
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+DELETED = -1
+# Stands in the extra fields of a row for a field its record does not
+# have
+MISSING = object()
+FIELDS = (
+    "trip_id", "amount", "category", "description", "date", "currency"
+)
+
+
+def to_cents(value):
+    """Converts an amount (number or numeric string) to integer cents.
+
+    Returns None if the value is not a valid number.
+    """
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int(amount.quantize(Decimal("0.01"), ROUND_HALF_UP) * 100)
+
+
+def to_day(value):
+    """Returns the day ordinal of a YYYY-MM-DD string, or None."""
+    if not isinstance(value, str) or len(value) != 10:
+        return None
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return None
+    # Other ISO forms of the same length (e.g. week dates) are not days
+    return day.toordinal() if day.isoformat() == value else None
+
+
+def _text(value):
+    """Returns the column text of a field; "" for None."""
+    return "" if value is None else str(value)
+
+
+def from_cents(cents):
+    """Converts integer cents back to a float amount."""
+    return cents / 100
+
+
+class Interner:
+    """Maps strings to small integer codes and back."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        """Returns the code of a value, assigning a new one if needed."""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class ExpenseColumns:
+    """Expenses keyed by ID and stored column-wise.
+
+    Behaves like a read-only dict of expense records: looking an expense
+    up builds its record on demand. Deleted rows are left as tombstones
+    and squeezed out once they make up half of the rows, which keeps the
+    remaining rows in insertion order.
+    """
+
+    def __init__(self, expenses=None):
+        self.trip_ids = Interner()
+        self.categories = Interner()
+        # "" for expenses in their trip's currency
+        self.currencies = Interner()
+        self._clear_rows()
+        for expense_id, expense in (expenses or {}).items():
+            self.put(expense_id, expense)
+
+    def _clear_rows(self):
+        self.row_of = {}
+        self.trip_codes = array("i")
+        self.category_codes = array("i")
+        self.currency_codes = array("i")
+        self.cents = array("q")
+        self.days = array("i")
+        self.text = bytearray()
+        self.text_ends = array("q")
+        self.text_starts = array("q")
+        # Fields other than the columns (and amounts that are not
+        # numbers, text fields that are not strings, dates that are not
+        # days or currencies that are not text), for the rare rows
+        # having any
+        self.extras = {}
+        self.deleted = 0
+
+    # --- Mapping interface ---
+    def __len__(self):
+        return len(self.row_of)
+
+    def __contains__(self, expense_id):
+        return expense_id in self.row_of
+
+    def __iter__(self):
+        return iter(self.row_of)
+
+    def __getitem__(self, expense_id):
+        return self._record(self.row_of[expense_id])
+
+    def get(self, expense_id, default=None):
+        row = self.row_of.get(expense_id)
+        return default if row is None else self._record(row)
+
+    def keys(self):
+        return self.row_of.keys()
+
+    def items(self):
+        return ((eid, self._record(row)) for eid, row in self.row_of.items())
+
+    def values(self):
+        return (self._record(row) for row in self.row_of.values())
+
+    def _record(self, row):
+        """Builds the dict record of a row."""
+        record = {
+            "trip_id": self.trip_ids.values[self.trip_codes[row]],
+            "amount": from_cents(self.cents[row]),
+            "category": self.categories.values[self.category_codes[row]],
+            "description": self.text[
+                self.text_starts[row]:self.text_ends[row]
+            ].decode("utf-8"),
+        }
+        if self.days[row]:
+            record["date"] = date.fromordinal(self.days[row]).isoformat()
+        currency = self.currencies.values[self.currency_codes[row]]
+        if currency:
+            record["currency"] = currency
+        extra = self.extras.get(row)
+        if extra:
+            record.update(extra)
+            for field, value in extra.items():
+                if value is MISSING:
+                    del record[field]
+        return record
+
+    # --- Mutations ---
+    def put(self, expense_id, expense):
+        """Adds or replaces an expense."""
+        if expense_id in self.row_of:
+            self.delete(expense_id)
+        self._append_row(expense_id, expense)
+
+    def _append_row(self, expense_id, expense):
+        """Appends an expense to the columns."""
+        row = len(self.cents)
+        trip_code = self.trip_ids.code(str(expense.get("trip_id")))
+        cents = to_cents(expense.get("amount", MISSING))
+        category = _text(expense.get("category"))
+        description = _text(expense.get("description")).encode("utf-8")
+        day = to_day(expense.get("date"))
+        currency = expense.get("currency")
+        if not isinstance(currency, str):
+            currency = ""
+
+        self.row_of[expense_id] = row
+        self.trip_codes.append(trip_code)
+        self.category_codes.append(self.categories.code(category))
+        self.currency_codes.append(self.currencies.code(currency))
+        self.cents.append(cents or 0)
+        self.days.append(day or 0)
+        self.text_starts.append(len(self.text))
+        self.text += description
+        self.text_ends.append(len(self.text))
+        extra = {k: v for k, v in expense.items() if k not in FIELDS}
+        # Values the columns cannot hold as they are: amounts that are
+        # not numbers (0 in the cents column) and text fields that are
+        # not strings
+        if cents is None:
+            extra["amount"] = expense.get("amount", MISSING)
+        for field in ("category", "description"):
+            if not isinstance(expense.get(field), str):
+                extra[field] = expense.get(field, MISSING)
+        if day is None and "date" in expense:
+            extra["date"] = expense["date"]
+        if not currency and "currency" in expense:
+            extra["currency"] = expense["currency"]
+        if extra:
+            self.extras[row] = extra
+
+    def delete(self, expense_id):
+        """Removes an expense."""
+        row = self.row_of.pop(expense_id)
+        self.trip_codes[row] = DELETED
+        self.extras.pop(row, None)
+        self.deleted += 1
+        if self.deleted * 2 > len(self.cents):
+            self._squeeze()
+
+    def _squeeze(self):
+        """Rebuilds the columns without the deleted rows."""
+        live = list(self.items())
+        self._clear_rows()
+        for expense_id, expense in live:
+            self._append_row(expense_id, expense)
+
+    # --- Totals ---
+    def converted_cents(self, rates, trip_currency, currency=None):
+        """Returns the live rows' amounts in another currency, in cents.
+
+        The amounts come in row order, as aggregate() and the spend cube
+        read them. Expenses without a currency are in their trip's, as
+        given by trip_currency(trip ID). currency is the one to convert
+        to, or None for each expense's trip's. Returns the cents and a
+        mask of those left unconverted for want of a rate (see
+        RateTable.convert_many).
+        """
+        import numpy as np
+
+        trip_codes = np.frombuffer(self.trip_codes, dtype=np.int32)
+        live = trip_codes != DELETED
+        trip_currencies = [
+            trip_currency(trip_id) for trip_id in self.trip_ids.values
+        ]
+        names = list(self.currencies.values)
+        codes = {name: code for code, name in enumerate(names)}
+        for name in [currency, *trip_currencies]:
+            if name is not None and name not in codes:
+                codes[name] = len(names)
+                names.append(name)
+        trip_targets = np.array(
+            [codes[name] for name in trip_currencies] or [0], dtype=np.int64
+        )[trip_codes[live]]
+        sources = np.frombuffer(
+            self.currency_codes, dtype=np.int32
+        )[live].astype(np.int64)
+        if "" in codes:
+            blank = sources == codes[""]
+            sources[blank] = trip_targets[blank]
+        targets = (
+            trip_targets if currency is None
+            else np.full(len(sources), codes[currency], dtype=np.int64)
+        )
+        return rates.convert_many(
+            np.frombuffer(self.cents, dtype=np.int64)[live], sources,
+            targets, np.frombuffer(self.days, dtype=np.int32)[live], names
+        )
+
+    def aggregate(self, cents=None):
+        """Returns (trip_id, category, total, count) rows.
+
+        Expenses are grouped on a combined trip/category code with one
+        bincount over the arrays. cents can hold the amounts to add up
+        instead of the stored ones, e.g. from converted_cents().
+        """
+        import numpy as np
+
+        if not self.row_of:
+            return []
+        trip_codes = np.frombuffer(self.trip_codes, dtype=np.int32)
+        live = trip_codes != DELETED
+        category_count = len(self.categories)
+        keys = (
+            trip_codes[live].astype(np.int64) * category_count
+            + np.frombuffer(self.category_codes, dtype=np.int32)[live]
+        )
+        if cents is None:
+            cents = np.frombuffer(self.cents, dtype=np.int64)[live]
+        length = len(self.trip_ids) * category_count
+        totals = np.bincount(keys, weights=cents, minlength=length)
+        counts = np.bincount(keys, minlength=length)
+        return [
+            (
+                self.trip_ids.values[key // category_count],
+                self.categories.values[key % category_count],
+                from_cents(int(totals[key])),
+                int(counts[key]),
+            )
+            for key in np.flatnonzero(counts)
+        ]
+
+    def text_rows(self):
+        """Yields (expense ID, trip ID, category, description) per expense.
+
+        Cheaper than items() when only the text fields are needed.
+        """
+        trip_ids, categories = self.trip_ids.values, self.categories.values
+        text = bytes(self.text)
+        for expense_id, row in self.row_of.items():
+            yield (
+                expense_id, trip_ids[self.trip_codes[row]],
+                categories[self.category_codes[row]],
+                text[self.text_starts[row]:self.text_ends[row]].decode(
+                    "utf-8"
+                )
+            )
+
+    def arrays(self):
+        """Returns the live expenses' IDs and numpy columns.
+
+        The columns are trip codes, category codes, cents, day ordinals
+        (0 for none) and description lengths in bytes, one entry per ID.
+        """
+        import numpy as np
+
+        ids = np.array(list(self.row_of), dtype=object)
+        rows = np.fromiter(
+            self.row_of.values(), dtype=np.int64, count=len(ids)
+        )
+        return ids, {
+            "trip_codes": np.frombuffer(self.trip_codes, dtype=np.int32)[rows],
+            "category_codes": np.frombuffer(
+                self.category_codes, dtype=np.int32
+            )[rows],
+            "cents": np.frombuffer(self.cents, dtype=np.int64)[rows],
+            "days": np.frombuffer(self.days, dtype=np.int32)[rows],
+            "text_lengths": (
+                np.frombuffer(self.text_ends, dtype=np.int64)[rows]
+                - np.frombuffer(self.text_starts, dtype=np.int64)[rows]
+            ),
+        }
+
+    def to_frame(self):
+        """Returns the live expenses as a DataFrame keyed by expense ID."""
+        import numpy as np
+        import pandas as pd
+
+        rows = np.fromiter(
+            self.row_of.values(), dtype=np.int64, count=len(self.row_of)
+        )
+        trip_codes = np.frombuffer(self.trip_codes, dtype=np.int32)[rows]
+        category_codes = np.frombuffer(
+            self.category_codes, dtype=np.int32
+        )[rows]
+        text = bytes(self.text)
+        return pd.DataFrame(
+            {
+                "trip_id": np.array(self.trip_ids.values, dtype=object)[
+                    trip_codes
+                ],
+                "amount": np.frombuffer(self.cents, dtype=np.int64)[rows]
+                / 100,
+                "category": np.array(self.categories.values, dtype=object)[
+                    category_codes
+                ],
+                "currency": np.array(
+                    [currency or None for currency in self.currencies.values],
+                    dtype=object
+                )[np.frombuffer(self.currency_codes, dtype=np.int32)[rows]],
+                "description": [
+                    text[self.text_starts[row]:self.text_ends[row]].decode(
+                        "utf-8"
+                    )
+                    for row in rows
+                ],
+            },
+            index=pd.Index(list(self.row_of), dtype=object)
+        )
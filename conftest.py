@@ -0,0 +1,60 @@
+"""Shared fixtures: every test runs in an empty data directory."""
+import pytest
+
+import repository
+from codec import FORMAT_ENV
+from currency import RATES_ENV
+from repository import ID_BLOCK_ENV, Repository, open_store
+from service import PlannerService
+from tenants import TENANT_ENV, TENANT_ROOT_ENV
+
+ENV = (
+    "TRAVEL_PLANNER_DB", TENANT_ROOT_ENV, TENANT_ENV, FORMAT_ENV, RATES_ENV,
+    ID_BLOCK_ENV,
+)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """Works in a fresh directory with no planner settings."""
+    monkeypatch.chdir(tmp_path)
+    for name in ENV:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(repository, "_repository", None)
+    return tmp_path
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, monkeypatch):
+    """Runs a test once on the JSON files and once on SQLite."""
+    if request.param == "sqlite":
+        monkeypatch.setenv("TRAVEL_PLANNER_DB", "planner.db")
+    return request.param
+
+
+@pytest.fixture
+def repo(backend):
+    return Repository(open_store())
+
+
+@pytest.fixture
+def service(repo):
+    return PlannerService(repo)
+
+
+def trip(destination="Lisbon", start="2031-05-01", end="2031-05-10",
+         budget="1000", **fields):
+    """Returns the fields of a valid trip."""
+    return {
+        "destination": destination, "start_date": start, "end_date": end,
+        "budget": budget, **fields,
+    }
+
+
+def expense(trip_id, amount, category="Food", description="Lunch",
+            **fields):
+    """Returns the fields of a valid expense."""
+    return {
+        "trip_id": trip_id, "amount": amount, "category": category,
+        "description": description, **fields,
+    }
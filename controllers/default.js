@@ -1,5 +1,31 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const { spawn } = require('child_process');
+
+// The session server imports the planner once and hands every connection
+// a warm, pre-forked session, so nobody waits for a cold interpreter.
+const SESSION_SOCKET = path.join(os.tmpdir(), 'travel-planner.sock');
+const sessionServer = spawn('python3', ['session_server.py', SESSION_SOCKET], {
+    cwd: process.env.PWD,
+    env: process.env,
+    stdio: 'inherit'
+});
+sessionServer.on('exit', function (code, signal) {
+    // Clients fall back to running the planner themselves
+    console.log("Session server exited: " + (signal || code));
+});
+process.on('exit', function () {
+    sessionServer.kill();
+});
+
+// Every workspace gets a shard of its own under this directory. Setting
+// TRAVEL_PLANNER_TENANT_ROOT makes every session use one; otherwise only
+// sessions opened with ?workspace=NAME do, and the others keep using the
+// data in the working directory, as before workspaces existed
+const TENANT_ROOT = process.env.TRAVEL_PLANNER_TENANT_ROOT;
+const WORKSPACE_ROOT = TENANT_ROOT || path.join(process.env.PWD, 'tenants');
 
 exports.install = function () {
 
@@ -15,13 +41,22 @@ function socket() {
 
     this.on('open', function (client) {
 
+        // The workspace comes from ?workspace=NAME; without one the
+        // session asks for it if TENANT_ROOT is set
+        const env = Object.assign({}, process.env);
+        delete env.TRAVEL_PLANNER_TENANT;
+        if (client.query && client.query.workspace) {
+            env.TRAVEL_PLANNER_TENANT_ROOT = WORKSPACE_ROOT;
+            env.TRAVEL_PLANNER_TENANT = String(client.query.workspace);
+        }
+
         // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
+        client.tty = Pty.spawn('python3', ['session_client.py', SESSION_SOCKET], {
             name: 'xterm-color',
             cols: 80,
             rows: 24,
             cwd: process.env.PWD,
-            env: process.env
+            env: env
         });
 
         client.tty.on('exit', function (code, signal) {
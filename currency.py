@@ -0,0 +1,159 @@
+"""Currencies and the local table of exchange rates.
+
+Trips have a currency (USD unless set), in which their budget and the
+ledger's totals are kept. Expenses are in their trip's currency unless
+they name another one; they are then converted to the trip's currency
+for the budget and the summary, at the rate of the expense's date, or
+the latest rate for an expense without a date. Nothing is fetched from
+the network: the rates are read from a JSON file next to the data
+(rates.json, or the file TRAVEL_PLANNER_RATES names) that looks like:
+
+    {"base": "USD",
+     "rates": {"2030-01-01": {"EUR": 0.91, "GBP": 0.78},
+               "2030-02-01": {"EUR": 0.93}}}
+
+where each rate is the units of the currency one unit of the base buys.
+A currency's rate on a day is the one of the latest date on or before
+it that lists the currency (the earliest one for days before them all).
+
+Rates are looked up once per currency and day and remembered, and whole
+columns of amounts are converted in one numpy pass per distinct
+(currency, currency, day), so conversion costs next to nothing even over
+millions of expenses. Converting an expense to its own trip's currency
+is free.
+
+After changing the rates of past days, `python run.py check-ledger
+--repair` converts the ledger's totals again.
+"""
+import json
+import os
+from bisect import bisect_right
+from datetime import date
+
+DEFAULT_CURRENCY = "USD"
+RATES_ENV = "TRAVEL_PLANNER_RATES"
+RATES_FILE = "rates.json"
+
+# Day used for expenses without a date: after every rate, so the latest
+LATEST = date.max.toordinal()
+
+
+def currency_code(value):
+    """Returns a currency code in upper case, or None if it is invalid."""
+    code = str(value).strip().upper()
+    if len(code) == 3 and code.isascii() and code.isalpha():
+        return code
+    return None
+
+
+def rates_path():
+    """Returns the path of the rate table selected by the environment."""
+    return os.environ.get(RATES_ENV) or RATES_FILE
+
+
+def scale(cents, factor):
+    """Converts cents by a factor, rounding half up like the columns."""
+    return int((cents * factor + 0.5) // 1)
+
+
+class RateTable:
+    """Exchange rates by currency and day, against a base currency."""
+
+    def __init__(self, base=DEFAULT_CURRENCY, rates=None):
+        self.base = currency_code(base) or DEFAULT_CURRENCY
+        by_currency = {}
+        for day, day_rates in sorted((rates or {}).items()):
+            ordinal = date.fromisoformat(day).toordinal()
+            for currency, rate in day_rates.items():
+                days, values = by_currency.setdefault(
+                    currency_code(currency), ([], [])
+                )
+                days.append(ordinal)
+                values.append(float(rate))
+        by_currency.pop(None, None)
+        self.by_currency = by_currency
+        self._rates = {}  # (currency, day ordinal) -> rate or None
+
+    @classmethod
+    def load(cls, path=None):
+        """Reads a rate table file; an empty table if there is none.
+
+        Raises ValueError if the file is not a valid table.
+        """
+        path = path or rates_path()
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return cls()
+        try:
+            return cls(data.get("base", DEFAULT_CURRENCY), data["rates"])
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path} is not a valid rate table: {e!r}")
+
+    def currencies(self):
+        """Returns the currencies the table can convert between."""
+        return {self.base, *self.by_currency}
+
+    def rate(self, currency, day=LATEST):
+        """Returns the base-to-currency rate on a day, or None if unknown.
+
+        day is a day ordinal; LATEST gives the latest rate.
+        """
+        key = (currency, day)
+        if key not in self._rates:
+            if currency == self.base:
+                rate = 1.0
+            elif currency in self.by_currency:
+                days, values = self.by_currency[currency]
+                rate = values[max(bisect_right(days, day) - 1, 0)]
+            else:
+                rate = None
+            self._rates[key] = rate
+        return self._rates[key]
+
+    def factor(self, source, target, day=LATEST):
+        """Returns what one unit of source is worth in target, or None."""
+        if source == target:
+            return 1.0
+        source_rate = self.rate(source, day)
+        target_rate = self.rate(target, day)
+        if not source_rate or target_rate is None:
+            return None
+        return target_rate / source_rate
+
+    def convert_many(self, cents, sources, targets, days, names):
+        """Converts a column of amounts in cents with numpy.
+
+        sources and targets are arrays of codes into names, the currency
+        codes; days are day ordinals (0 for the latest rate). Returns
+        the converted cents and a mask of the amounts left unconverted
+        for want of a rate.
+        """
+        import numpy as np
+
+        converted = cents.copy()
+        unknown = np.zeros(len(cents), dtype=bool)
+        rows = np.flatnonzero(sources != targets)
+        if not len(rows):
+            return converted, unknown
+        # One factor per distinct (source, target, day)
+        count = len(names)
+        keys = (
+            sources[rows].astype(np.int64) * count + targets[rows]
+        ) * (LATEST + 1) + np.where(days[rows] == 0, LATEST, days[rows])
+        found, inverse = np.unique(keys, return_inverse=True)
+        factors = np.empty(len(found))
+        for position, key in enumerate(found.tolist()):
+            pair, day = divmod(key, LATEST + 1)
+            source, target = divmod(pair, count)
+            factor = self.factor(names[source], names[target], day)
+            factors[position] = np.nan if factor is None else factor
+        row_factors = factors[inverse]
+        missing = np.isnan(row_factors)
+        unknown[rows] = missing
+        converted[rows] = np.where(
+            missing, cents[rows],
+            np.floor(cents[rows] * row_factors + 0.5)
+        ).astype(np.int64)
+        return converted, unknown
@@ -0,0 +1,178 @@
+"""Non-interactive bulk import of trips, itinerary entries and expenses.
+
+Rows are streamed from a CSV file (with a header row) or a JSONL file
+(one JSON object per line), checked with the same rules as the menus,
+and saved in batches with one storage write per batch. Rejected rows are
+reported with their line number and reason.
+
+Usage:
+    python run.py import [--collection NAME] [--rejects FILE] FILE
+
+The collection (trips, itinerary or expenses) is taken from the file
+name when --collection is not given, e.g. expenses.csv. Rows with no ID
+are given the next ones from the collection's sequence.
+"""
+import argparse
+import csv
+import json
+import os
+
+from repository import TRIPS, ITINERARY, EXPENSES, get_repository
+from service import (
+    ServiceError, check_expense, check_id, check_itinerary_entry, check_trip,
+    text_field
+)
+
+BATCH_SIZE = 50000
+# Only this many rejected rows are printed; the rest go to --rejects
+MAX_REPORTED_REJECTS = 20
+
+
+def read_rows(file_path, on_reject):
+    """Yields (line number, row) pairs from a CSV or JSONL file.
+
+    JSONL lines that are not JSON objects are passed to on_reject, as
+    import_rows() does with invalid rows, and skipped.
+    """
+    with open(file_path, "r", newline="") as file:
+        if file_path.endswith((".jsonl", ".ndjson")):
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as e:
+                    on_reject(
+                        line_number, line.strip(),
+                        f"Not valid JSON ({e.msg} at column {e.pos + 1})."
+                    )
+                    continue
+                if not isinstance(row, dict):
+                    on_reject(line_number, row, "Not a JSON object.")
+                    continue
+                yield line_number, row
+        else:
+            reader = csv.DictReader(file)
+            # Line 1 is the header, so data starts on line 2
+            for line_number, row in enumerate(reader, start=2):
+                yield line_number, row
+
+
+def row_id(row, collection, records, repo, batch):
+    """Returns a row's ID, or the next free one if it has none."""
+    record_id = text_field(row, "id")
+    if record_id:
+        return check_id(record_id, records, batch)
+    # A batch's worth is reserved at a time rather than one per row
+    record_id = repo.new_id(collection, BATCH_SIZE)
+    while record_id in batch:
+        record_id = repo.new_id(collection, BATCH_SIZE)
+    return record_id
+
+
+def parse_trip(row, repo, batch):
+    """Validates a trip row and returns (trip ID, trip)."""
+    trip = check_trip(row)
+    return row_id(row, TRIPS, repo.trips, repo, batch), trip
+
+
+def parse_itinerary_entry(row, repo, batch):
+    """Validates an itinerary row and returns (itinerary ID, entry)."""
+    entry = check_itinerary_entry(row, repo.trips)
+    return row_id(row, ITINERARY, repo.itinerary, repo, batch), entry
+
+
+def parse_expense(row, repo, batch):
+    """Validates an expense row and returns (expense ID, expense)."""
+    expense = check_expense(row, repo.trips, rates=repo.rates)
+    return row_id(row, EXPENSES, repo.expenses, repo, batch), expense
+
+
+PARSERS = {
+    TRIPS: parse_trip,
+    ITINERARY: parse_itinerary_entry,
+    EXPENSES: parse_expense,
+}
+
+
+def import_rows(collection, rows, repo, on_reject):
+    """Validates and saves rows in batches; returns the number saved.
+
+    on_reject is called with (line number, row, reason) for every row
+    that fails validation.
+    """
+    parse = PARSERS[collection]
+    imported = 0
+    batch = {}
+    for line_number, row in rows:
+        try:
+            record_id, record = parse(row, repo, batch)
+        except ServiceError as e:
+            on_reject(line_number, row, str(e))
+            continue
+        batch[record_id] = record
+        if len(batch) >= BATCH_SIZE:
+            repo.save_many(collection, batch)
+            imported += len(batch)
+            batch = {}
+    if batch:
+        repo.save_many(collection, batch)
+        imported += len(batch)
+    if imported:
+        repo.compact(collection)
+    return imported
+
+
+def guess_collection(file_path):
+    """Returns the collection named by the start of the file name."""
+    name = os.path.basename(file_path).lower()
+    for collection in PARSERS:
+        if name.startswith(collection):
+            return collection
+    return None
+
+
+def import_command(argv):
+    """Runs the import command; returns the process exit status."""
+    parser = argparse.ArgumentParser(
+        prog="run.py import",
+        description="Bulk import trips, itinerary entries or expenses."
+    )
+    parser.add_argument("file", help="CSV or JSONL file to import")
+    parser.add_argument("--collection", choices=sorted(PARSERS))
+    parser.add_argument(
+        "--rejects", help="write every rejected row to this JSONL file"
+    )
+    args = parser.parse_args(argv)
+
+    collection = args.collection or guess_collection(args.file)
+    if collection is None:
+        parser.error("cannot tell the collection from the file name; "
+                     "use --collection")
+
+    rejects_file = open(args.rejects, "w") if args.rejects else None
+    rejected = 0
+
+    def on_reject(line_number, row, reason):
+        nonlocal rejected
+        rejected += 1
+        if rejected <= MAX_REPORTED_REJECTS:
+            print(f"Line {line_number}: {reason}")
+        if rejects_file:
+            rejects_file.write(json.dumps(
+                {"line": line_number, "reason": reason, "row": row}
+            ) + "\n")
+
+    try:
+        imported = import_rows(
+            collection, read_rows(args.file, on_reject), get_repository(),
+            on_reject
+        )
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    if rejected > MAX_REPORTED_REJECTS:
+        print(f"... and {rejected - MAX_REPORTED_REJECTS} more rejected rows.")
+    print(f"Imported {imported} {collection} row(s), rejected {rejected}.")
+    return 1 if rejected else 0
@@ -0,0 +1,295 @@
+"""Integrity check of all the stored data.
+
+The rules the menus apply when data is entered are checked again over
+everything already stored, one vectorized pass per rule: the trips and
+itinerary entries are put in pandas columns and the expenses are read
+straight from their numpy columns (see columnar.py), so millions of
+rows take seconds. The checks are:
+
+- trips: destination given, dates in YYYY-MM-DD format, end date not
+  before the start date, budget (if any) a positive number, currency (if
+  any) a three-letter code
+- itinerary entries: trip exists, date in YYYY-MM-DD format and inside
+  the trip's dates, activity given
+- expenses: trip exists, amount a number and not negative, category
+  and description given, date (if any) in YYYY-MM-DD format and inside
+  the trip's dates, a rate from the currency (if any) to the trip's (see
+  currency.py)
+- the budget ledger matches the trips and expenses (see ledger.py)
+
+Dates in the past are fine here: only new entries must be in the future.
+
+With --repair, records of missing trips are deleted (see vacuum.py),
+trips ending before they start get their dates swapped, and the ledger
+is rebuilt. Anything else is only reported, as it needs a person to
+decide.
+
+Usage:
+    python run.py check [--repair] [--limit N]
+"""
+import argparse
+from collections import Counter, defaultdict, namedtuple
+
+from columnar import DELETED
+from currency import DEFAULT_CURRENCY
+from repository import EXPENSES, ITINERARY, TRIPS, get_repository
+from trip_calendar import parse_day
+
+Violation = namedtuple("Violation", ["collection", "record_id", "problem"])
+
+# Problems --repair fixes
+MISSING_TRIP = "trip does not exist"
+END_BEFORE_START = "end date before start date"
+LEDGER_DIFFERS = "ledger entry does not match the expenses"
+
+
+def _frame(records, fields):
+    """Returns records as a DataFrame of text columns, keyed by ID."""
+    import pandas as pd
+
+    values = records.values()
+    return pd.DataFrame(
+        {
+            field: [
+                "" if record.get(field) is None else str(record[field])
+                for record in values
+            ]
+            for field in fields
+        },
+        index=pd.Index(list(records), dtype=object),
+        dtype=object  # Even when empty, for the .str checks
+    )
+
+
+def _days(column):
+    """Parses a text column of YYYY-MM-DD dates into day ordinals.
+
+    0 where invalid. Each distinct date is parsed once, the way the trip
+    calendar does, so every year from 1 to 9999 is valid; pandas
+    timestamps would only cover 1677 to 2262.
+    """
+    days = {text: parse_day(text) or 0 for text in column.unique()}
+    return column.map(days).astype("int64")
+
+
+def _blank(column):
+    return column.str.strip() == ""
+
+
+def _violations(collection, frame_index, mask, problem):
+    return [
+        Violation(collection, record_id, problem)
+        for record_id in frame_index[mask.to_numpy()]
+    ]
+
+
+def check_trips(trips):
+    """Returns the violations of the trips and their day ordinals."""
+    import pandas as pd
+
+    frame = _frame(
+        trips, ("destination", "start_date", "end_date", "budget", "currency")
+    )
+    starts = _days(frame["start_date"])
+    ends = _days(frame["end_date"])
+    budgets = pd.to_numeric(frame["budget"], errors="coerce")
+    checks = [
+        (_blank(frame["destination"]), "destination is empty"),
+        (starts == 0, "start date is not YYYY-MM-DD"),
+        (ends == 0, "end date is not YYYY-MM-DD"),
+        ((starts != 0) & (ends < starts), END_BEFORE_START),
+        # A missing budget is shown as "Not specified"
+        (
+            (frame["budget"] != "") & ~(budgets > 0),
+            "budget is not a positive number"
+        ),
+        (
+            (frame["currency"] != "")
+            & ~frame["currency"].str.fullmatch("[A-Z]{3}"),
+            "currency is not a three-letter code"
+        ),
+    ]
+    violations = []
+    for mask, problem in checks:
+        violations += _violations(TRIPS, frame.index, mask, problem)
+    return violations, starts, ends
+
+
+def check_itinerary(itinerary, trip_starts, trip_ends):
+    """Returns the violations of the itinerary entries."""
+    frame = _frame(itinerary, ("trip_id", "date", "activity"))
+    dates = _days(frame["date"])
+    exists = frame["trip_id"].isin(trip_starts.index)
+    # Joined on trip ID; entries of missing trips get 0, as do those of
+    # trips with invalid dates
+    starts = frame["trip_id"].map(trip_starts).fillna(0)
+    ends = frame["trip_id"].map(trip_ends).fillna(0)
+    checks = [
+        (~exists, MISSING_TRIP),
+        (dates == 0, "date is not YYYY-MM-DD"),
+        (
+            exists & (dates != 0) & (starts != 0) & (ends != 0)
+            & ((dates < starts) | (dates > ends)),
+            "date outside the trip's dates"
+        ),
+        (_blank(frame["activity"]), "activity is empty"),
+    ]
+    violations = []
+    for mask, problem in checks:
+        violations += _violations(ITINERARY, frame.index, mask, problem)
+    return violations
+
+
+def _ordinals(trip_ids, trip_days):
+    """Returns the day ordinals of some trips' dates; 0 where unknown."""
+    import numpy as np
+
+    return trip_days.reindex(trip_ids, fill_value=0).to_numpy(np.int64)
+
+
+def check_expenses(expenses, trips, trip_starts, trip_ends, rates=None):
+    """Returns the violations of the expenses (ExpenseColumns).
+
+    With a RateTable as rates, the currencies are checked too.
+    """
+    import numpy as np
+
+    if not expenses:
+        return []
+    ids, columns = expenses.arrays()
+    # Rules on interned values are checked once per distinct value
+    trip_known = np.array(
+        [trip_id in trips for trip_id in expenses.trip_ids.values], bool
+    )
+    category_blank = np.array(
+        [not category.strip() for category in expenses.categories.values],
+        bool
+    )
+    starts = _ordinals(expenses.trip_ids.values, trip_starts)
+    ends = _ordinals(expenses.trip_ids.values, trip_ends)
+    trip_codes, days = columns["trip_codes"], columns["days"]
+    checks = [
+        (~trip_known[trip_codes], MISSING_TRIP),
+        (columns["cents"] < 0, "amount is negative"),
+        (category_blank[columns["category_codes"]], "category is empty"),
+        (columns["text_lengths"] == 0, "description is empty"),
+        (
+            (days != 0) & (starts[trip_codes] != 0) & (ends[trip_codes] != 0)
+            & ((days < starts[trip_codes]) | (days > ends[trip_codes])),
+            "date outside the trip's dates"
+        ),
+    ]
+    violations = [
+        Violation(EXPENSES, record_id, problem)
+        for mask, problem in checks
+        for record_id in ids[mask]
+    ]
+    # Amounts that are not numbers and dates that are not days are kept
+    # with the rare extra fields
+    problems = defaultdict(list)  # row -> problems
+    for row, extra in expenses.extras.items():
+        if "amount" in extra:
+            problems[row].append("amount is not a number")
+        if extra.get("date") not in (None, ""):
+            problems[row].append("date is not YYYY-MM-DD")
+    if rates is not None:
+        _, unknown = expenses.converted_cents(
+            rates,
+            lambda trip_id: (
+                trips.get(trip_id) or {}
+            ).get("currency") or DEFAULT_CURRENCY
+        )
+        live_rows = np.flatnonzero(
+            np.frombuffer(expenses.trip_codes, dtype=np.int32) != DELETED
+        )
+        for row in live_rows[unknown].tolist():
+            problems[row].append("no exchange rate for the currency")
+    if problems:
+        violations += [
+            Violation(EXPENSES, record_id, problem)
+            for record_id, row in expenses.row_of.items()
+            for problem in problems.get(row, ())
+        ]
+    return violations
+
+
+def check_data(repo):
+    """Returns every violation in a repository's data."""
+    violations, starts, ends = check_trips(repo.trips)
+    violations += check_itinerary(repo.itinerary, starts, ends)
+    violations += check_expenses(
+        repo.expenses, repo.trips, starts, ends, repo.rates
+    )
+    violations += [
+        Violation("ledger", trip_id, LEDGER_DIFFERS)
+        for trip_id in repo.ledger.differences(repo.rebuild_ledger())
+    ]
+    return violations
+
+
+def repair(repo, violations):
+    """Fixes the violations that can be fixed without a person.
+
+    Returns the number of violations fixed.
+    """
+    problems = Counter(violation.problem for violation in violations)
+    fixed = 0
+    if problems[MISSING_TRIP]:
+        repo.purge_orphans()
+        fixed += problems[MISSING_TRIP]
+    swapped = {
+        trip_id: {
+            **repo.trips[trip_id],
+            "start_date": repo.trips[trip_id]["end_date"],
+            "end_date": repo.trips[trip_id]["start_date"],
+        }
+        for collection, trip_id, problem in violations
+        if problem == END_BEFORE_START
+    }
+    if swapped:
+        repo.save_many(TRIPS, swapped)
+        fixed += len(swapped)
+    # Last, so it also takes in the repairs above
+    if problems[LEDGER_DIFFERS]:
+        repo.replace_ledger(repo.rebuild_ledger())
+        fixed += problems[LEDGER_DIFFERS]
+    return fixed
+
+
+def check_command(argv):
+    """Runs the check command; returns the process exit status."""
+    parser = argparse.ArgumentParser(
+        prog="run.py check",
+        description="Check all the stored data against the planner's rules."
+    )
+    parser.add_argument(
+        "--repair", action="store_true",
+        help="delete records of missing trips, swap reversed trip dates "
+             "and rebuild the ledger"
+    )
+    parser.add_argument(
+        "--limit", type=int, default=20,
+        help="violations to list (all are counted)"
+    )
+    args = parser.parse_args(argv)
+
+    repo = get_repository()
+    violations = check_data(repo)
+    for collection, record_id, problem in violations[:args.limit]:
+        print(f"{collection} {record_id}: {problem}")
+    if not violations:
+        print(f"No problems found in {len(repo.trips)} trip(s), "
+              f"{len(repo.itinerary)} itinerary entry(ies) and "
+              f"{len(repo.expenses)} expense(s).")
+        return 0
+    for problem, count in Counter(
+        violation.problem for violation in violations
+    ).most_common():
+        print(f"{count:>8}  {problem}")
+    if not args.repair:
+        print(f"{len(violations)} problem(s) found; run with --repair to "
+              "fix the ones that can be fixed automatically.")
+        return 1
+    fixed = repair(repo, violations)
+    print(f"Repaired {fixed} of {len(violations)} problem(s).")
+    return 0 if fixed == len(violations) else 1
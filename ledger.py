@@ -0,0 +1,216 @@
+"""Persisted per-trip budget ledger.
+
+The ledger holds, for every trip, its budget, the amount spent, the
+remaining budget, the number of expenses and the totals per category,
+all in integer cents of the trip's currency (expenses in another
+currency are converted, see currency.py). It is stored as its own
+collection and updated in the same store write as the change that
+affects it, so budget warnings and the summary read it instead of
+adding up the expenses again.
+
+A ledger entry looks like:
+    {"budget": 50000, "spent": 15501, "remaining": 34499,
+     "expense_count": 3,
+     "categories": {"Food": {"spent": 5001, "count": 2}, ...}}
+budget and remaining are left out for trips without a valid budget.
+
+Usage:
+    python run.py check-ledger [--repair]
+"""
+import argparse
+
+from columnar import from_cents, to_cents
+
+UNCATEGORISED = "Uncategorised"
+
+
+def category_key(value):
+    """Returns the ledger key of an expense category."""
+    return str(value) if value else UNCATEGORISED
+
+
+def _copy(entry):
+    """Returns a copy of an entry that can be changed independently."""
+    if entry is None:
+        return {"spent": 0, "expense_count": 0, "categories": {}}
+    copy = dict(entry)
+    copy["categories"] = {
+        category: dict(totals)
+        for category, totals in entry.get("categories", {}).items()
+    }
+    return copy
+
+
+def _finish(entry):
+    """Fills in the remaining budget; returns None for an empty entry."""
+    budget = entry.get("budget")
+    if budget is None:
+        entry.pop("remaining", None)
+        if not entry["expense_count"]:
+            return None
+    else:
+        entry["remaining"] = budget - entry["spent"]
+    return entry
+
+
+class Ledger:
+    """Per-trip spending totals, keyed by trip ID.
+
+    Changes are worked out in a pending dict of trip ID to new entry (or
+    None to remove it), which is written to storage before update() puts
+    it in place, so a refused write leaves the ledger unchanged.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    @classmethod
+    def rebuild(cls, trips, aggregates):
+        """Builds a ledger from the trips and expense aggregate rows.
+
+        aggregates holds (trip_id, category, total, count) rows, as
+        returned by Repository.expense_aggregates().
+        """
+        ledger = cls()
+        pending = {}
+        for trip_id, trip in trips.items():
+            ledger.set_budget(pending, trip_id, trip.get("budget"))
+        for trip_id, category, total, count in aggregates:
+            entry = ledger._pending_entry(pending, str(trip_id))
+            cents = to_cents(total) or 0
+            totals = entry["categories"].setdefault(
+                category_key(category), {"spent": 0, "count": 0}
+            )
+            totals["spent"] += cents
+            totals["count"] += count
+            entry["spent"] += cents
+            entry["expense_count"] += count
+        ledger.update(ledger.finish(pending))
+        return ledger
+
+    def _pending_entry(self, pending, trip_id):
+        if trip_id not in pending:
+            pending[trip_id] = _copy(self.entries.get(trip_id))
+        return pending[trip_id]
+
+    def set_budget(self, pending, trip_id, budget):
+        """Records a trip's budget (None or invalid for no budget)."""
+        entry = self._pending_entry(pending, trip_id)
+        cents = None if budget is None else to_cents(budget)
+        if cents is None:
+            entry.pop("budget", None)
+        else:
+            entry["budget"] = cents
+
+    def add_expense(self, pending, expense, sign=1, cents=None):
+        """Adds an expense to its trip's totals (sign=-1 takes it off).
+
+        cents is the amount in the trip's currency, if not the expense's
+        own amount.
+        """
+        entry = self._pending_entry(pending, str(expense.get("trip_id")))
+        if cents is None:
+            cents = to_cents(expense.get("amount", 0)) or 0
+        cents *= sign
+        category = category_key(expense.get("category"))
+        totals = entry["categories"].setdefault(
+            category, {"spent": 0, "count": 0}
+        )
+        totals["spent"] += cents
+        totals["count"] += sign
+        if not totals["count"]:
+            del entry["categories"][category]
+        entry["spent"] += cents
+        entry["expense_count"] += sign
+
+    def finish(self, pending):
+        """Completes pending entries; returns them ready to be written."""
+        return {
+            trip_id: _finish(entry) for trip_id, entry in pending.items()
+        }
+
+    def update(self, changes):
+        """Puts finished changes in place."""
+        for trip_id, entry in changes.items():
+            if entry is None:
+                self.entries.pop(trip_id, None)
+            else:
+                self.entries[trip_id] = entry
+
+    def spent_cents(self, trip_id):
+        """Returns the total spent on a trip, in cents."""
+        return self.entries.get(trip_id, {}).get("spent", 0)
+
+    def budget_cents(self, trip_id):
+        """Returns a trip's budget in cents, or None if it has none."""
+        return self.entries.get(trip_id, {}).get("budget")
+
+    def aggregates(self, trip_ids=None):
+        """Returns (trip_id, category, total, count) rows.
+
+        Only the given trips' rows are returned if trip_ids is set.
+        """
+        entries = self.entries.items() if trip_ids is None else (
+            (trip_id, self.entries[trip_id]) for trip_id in trip_ids
+            if trip_id in self.entries
+        )
+        return [
+            (trip_id, category, from_cents(totals["spent"]), totals["count"])
+            for trip_id, entry in entries
+            for category, totals in entry.get("categories", {}).items()
+        ]
+
+    def differences(self, other):
+        """Returns the trip IDs whose entries differ between two ledgers."""
+        return [
+            trip_id for trip_id in {**self.entries, **other.entries}
+            if self.entries.get(trip_id) != other.entries.get(trip_id)
+        ]
+
+
+def _describe(entry):
+    """Formats an entry's totals for the check report."""
+    if entry is None:
+        return "no entry"
+    budget = entry.get("budget")
+    return (
+        f"spent {from_cents(entry['spent']):.2f} over "
+        f"{entry['expense_count']} expense(s), budget "
+        + ("N/A" if budget is None else f"{from_cents(budget):.2f}")
+    )
+
+
+def check_command(argv):
+    """Runs the ledger check; returns the process exit status."""
+    from repository import get_repository
+
+    parser = argparse.ArgumentParser(
+        prog="run.py check-ledger",
+        description="Rebuild the budget ledger from the expenses and "
+                    "compare it with the stored one."
+    )
+    parser.add_argument(
+        "--repair", action="store_true",
+        help="replace the stored ledger with the rebuilt one"
+    )
+    args = parser.parse_args(argv)
+
+    repo = get_repository()
+    rebuilt = repo.rebuild_ledger()
+    differences = repo.ledger.differences(rebuilt)
+    for trip_id in differences:
+        print(f"Trip {trip_id}: stored "
+              f"{_describe(repo.ledger.entries.get(trip_id))}; expected "
+              f"{_describe(rebuilt.entries.get(trip_id))}.")
+    if not differences:
+        print(f"Ledger is consistent ({len(rebuilt.entries)} trip(s)).")
+        return 0
+    if args.repair:
+        repo.replace_ledger(rebuilt)
+        print(f"Repaired {len(differences)} ledger entr"
+              f"{'y' if len(differences) == 1 else 'ies'}.")
+        return 0
+    print(f"{len(differences)} ledger entr"
+          f"{'y differs' if len(differences) == 1 else 'ies differ'}; "
+          "run with --repair to fix.")
+    return 1
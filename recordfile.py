@@ -0,0 +1,151 @@
+"""Snapshot format with an offset index, read through a memory map.
+
+A record file holds one line per record (the ID and the record as
+compact JSON, separated by a tab) followed by an index of fixed-size
+entries sorted by a hash of the ID, and a footer locating the index.
+Looking up or checking one ID is a binary search over the index that
+reads only the pages it touches, and going through all the records
+decodes them one at a time, so neither holds the collection in memory.
+
+Layout:
+    MAGIC
+    <id JSON> TAB <record JSON> LF        (one line per record)
+    (hash, offset, length) entries         (INDEX_ENTRY each)
+    (index offset, count, MAGIC)           (FOOTER)
+"""
+import mmap
+import struct
+from hashlib import blake2b
+
+import codec
+
+MAGIC = b"TPREC1\n\0"
+INDEX_ENTRY = struct.Struct("<QQI")
+FOOTER = struct.Struct("<QQ8s")
+
+
+def _hash(id_json):
+    return int.from_bytes(blake2b(id_json, digest_size=8).digest(), "little")
+
+
+def encode(records):
+    """Encodes a collection (keyed by record ID) as a record file."""
+    parts = [MAGIC]
+    index = []
+    offset = len(MAGIC)
+    for record_id, record in records.items():
+        id_json = codec.dumps(record_id)
+        line = id_json + b"\t" + codec.dumps(record) + b"\n"
+        parts.append(line)
+        index.append((_hash(id_json), offset, len(line)))
+        offset += len(line)
+    index.sort()
+    parts.extend(INDEX_ENTRY.pack(*entry) for entry in index)
+    parts.append(FOOTER.pack(offset, len(index), MAGIC))
+    return b"".join(parts)
+
+
+def _decode_line(line):
+    id_json, _, record_json = line.partition(b"\t")
+    return codec.loads(id_json), codec.loads(record_json)
+
+
+def decode(content):
+    """Decodes a whole record file held in memory."""
+    index_offset = FOOTER.unpack_from(content, len(content) - FOOTER.size)[0]
+    return dict(
+        _decode_line(line)
+        for line in content[len(MAGIC):index_offset].splitlines()
+    )
+
+
+def is_record_file(path):
+    """Checks if a file is a record file."""
+    try:
+        with open(path, "rb") as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+class RecordFile:
+    """Read-only, memory-mapped access to a record file.
+
+    Behaves like a read-only dict of records; only the pages holding the
+    index entries and records looked at are read from disk.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index_offset, self.count, magic = FOOTER.unpack_from(
+            self.map, len(self.map) - FOOTER.size
+        )
+        if magic != MAGIC:
+            self.map.close()
+            raise ValueError(f"{path} is not a complete record file.")
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, position):
+        return INDEX_ENTRY.unpack_from(
+            self.map, self.index_offset + position * INDEX_ENTRY.size
+        )
+
+    def _find(self, record_id):
+        """Returns the (offset, length) of a record's line, or None."""
+        id_json = codec.dumps(str(record_id))
+        key = _hash(id_json)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        prefix = id_json + b"\t"
+        # Several IDs may share a hash; their lines tell them apart
+        for position in range(low, self.count):
+            entry_hash, offset, length = self._entry(position)
+            if entry_hash != key:
+                break
+            if self.map[offset:offset + len(prefix)] == prefix:
+                return offset, length
+        return None
+
+    def __contains__(self, record_id):
+        return self._find(record_id) is not None
+
+    def get(self, record_id, default=None):
+        found = self._find(record_id)
+        if found is None:
+            return default
+        offset, length = found
+        return _decode_line(self.map[offset:offset + length - 1])[1]
+
+    def __getitem__(self, record_id):
+        record = self.get(record_id)
+        if record is None:
+            raise KeyError(record_id)
+        return record
+
+    def items(self):
+        """Yields (record ID, record) pairs in the collection's order."""
+        position = len(MAGIC)
+        while position < self.index_offset:
+            end = self.map.find(b"\n", position, self.index_offset)
+            yield _decode_line(self.map[position:end])
+            position = end + 1
+
+    def __iter__(self):
+        return (record_id for record_id, _ in self.items())
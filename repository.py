@@ -0,0 +1,764 @@
+"""In-process repository for trips, itinerary entries and expenses.
+
+Each collection is loaded once per session and kept in memory together
+with secondary indexes by trip ID (itinerary and expense IDs) and an
+index of the trips' dates (see trip_calendar.py). Every mutation goes
+through the repository, which writes it to storage and updates the
+indexes in place, so per-trip and per-date lookups never need a scan of
+the whole collection.
+
+Expenses are held column-wise (see columnar.py) with amounts in integer
+cents. Budgets, spending and per-category totals of every trip are kept
+in the persisted ledger (see ledger.py), in the trip's currency, and
+written in the same store write as the trip or expense change behind
+it. Expenses in other currencies are converted with the local rate
+table (see currency.py). The summary of
+every trip is cached until a change touches that trip (see
+summary_cache.py). Deleting a trip deletes its itinerary entries and
+expenses in the same write, found through the trip indexes. The words of
+the records are indexed for search() the first time it is called, and
+the index is kept up to date and saved with the data from then on (see
+search_index.py). Likewise, spending is rolled up by trip, category and
+day the first time spending() is called and kept up to date in memory
+(see spend_cube.py).
+
+New records get their IDs from a persisted sequence per collection (see
+new_id()), so no session has to look through the records for a free
+one; records saved with an ID chosen by hand move the sequence past it.
+
+Several sessions can share the same store. Before each write, and
+whenever get_repository() is called, the repository picks up what other
+sessions stored since it last looked. Writes are compare-and-swap: a
+change is refused with ConflictError if the record it replaces is no
+longer the one the caller read.
+
+The repository works the same on any store: the JSON files by default,
+or SQLite when TRAVEL_PLANNER_DB names a database file, in the shard of
+the session's tenant when the data is split by tenant (see tenants.py).
+"""
+import os
+from collections import defaultdict
+
+import tenants
+from columnar import ExpenseColumns, to_cents, to_day
+from currency import DEFAULT_CURRENCY, LATEST, RateTable, scale
+from ledger import Ledger
+from search_index import SearchIndex, record_text
+from spend_cube import SpendCube
+from storage import ConflictError, JsonStore
+from summary_cache import SummaryCache
+from trip_calendar import TripCalendar
+
+TRIPS = "trips"
+ITINERARY = "itinerary"
+EXPENSES = "expenses"
+LEDGER = "ledger"
+SEQUENCES = "sequences"
+COLLECTIONS = (TRIPS, ITINERARY, EXPENSES, LEDGER, SEQUENCES)
+
+# How many IDs a session takes from a sequence at a time; more than one
+# saves a store write per new record, at the cost of gaps in the IDs
+ID_BLOCK_ENV = "TRAVEL_PLANNER_ID_BLOCK"
+
+# Default for expected: the record as it is in memory when saving
+CURRENT = object()
+
+# The text fields search() looks in (text_rows() gives the expenses'),
+# and the file its index is saved in
+SEARCH_FIELDS = {
+    TRIPS: ("destination",),
+    ITINERARY: ("activity",),
+    EXPENSES: ("category", "description"),
+}
+SEARCH_INDEX_FILE = "search.npz"
+# Changes a loaded search index can catch up on before it is saved again
+SEARCH_SAVE_AFTER = 1000
+
+
+class Repository:
+    """Holds the loaded collections and their per-trip indexes."""
+
+    def __init__(self, store, id_block=None):
+        self.store = store
+        self.id_block = id_block or int(os.environ.get(ID_BLOCK_ENV) or 1)
+        self._id_blocks = {}  # collection -> (next ID, end) reserved
+        self.sequences = store.load(SEQUENCES)
+        self.summary_cache = SummaryCache()
+        self.search_index = None  # built by the first search()
+        self.spend_cube = None  # built by the first spending()
+        self.rates = RateTable.load()
+        self.trips = store.load(TRIPS)
+        self.calendar = TripCalendar()
+        for trip_id, trip in self.trips.items():
+            self.calendar.put(trip_id, trip)
+        self.itinerary = store.load(ITINERARY)
+        self.expenses = ExpenseColumns()
+
+        # The per-trip indexes map IDs to None: dicts keep insertion order
+        self.itinerary_by_trip = defaultdict(dict)
+        self.expenses_by_trip = defaultdict(dict)
+        for itinerary_id, entry in self.itinerary.items():
+            self._index_itinerary_entry(itinerary_id, entry)
+        # Streamed when the store can, so the expenses go straight into
+        # columns without all being held as dicts first
+        stream = getattr(store, "stream", None)
+        expenses = stream(EXPENSES) if stream else store.load(EXPENSES).items()
+        for expense_id, expense in expenses:
+            self._set_expense(expense_id, expense)
+
+        self.ledger = Ledger(store.load(LEDGER))
+        # Data saved before the ledger existed: its ledger is rebuilt
+        # here and only stored with the first change (see _write), so
+        # opening a store does not write to it
+        self._ledger_unsaved = False
+        if not self.ledger.entries and (self.trips or self.expenses):
+            self.ledger = self.rebuild_ledger()
+            self._ledger_unsaved = True
+
+    # --- Sharing the store with other sessions ---
+    def _records(self, collection):
+        return {
+            TRIPS: self.trips,
+            ITINERARY: self.itinerary,
+            EXPENSES: self.expenses,
+            LEDGER: self.ledger.entries,
+            SEQUENCES: self.sequences,
+        }[collection]
+
+    def _trips_touched(self, collection, record_id, record):
+        """Returns the IDs of the trips a change affects."""
+        if collection == SEQUENCES:
+            return []
+        if collection in (TRIPS, LEDGER):
+            return [record_id]
+        old_record = self._records(collection).get(record_id)
+        return [
+            str(changed["trip_id"]) for changed in (old_record, record)
+            if changed is not None
+        ]
+
+    def _set(self, collection, record_id, record):
+        """Puts a stored change in memory; a None record removes it."""
+        self.summary_cache.invalidate(
+            self._trips_touched(collection, record_id, record)
+        )
+        if self.search_index is not None and collection in SEARCH_FIELDS:
+            if record is None:
+                self.search_index.discard(collection, record_id)
+            else:
+                self.search_index.put(collection, record_id, record)
+        if self.spend_cube is not None and collection == EXPENSES:
+            old_expense = self.expenses.get(record_id)
+            if old_expense is not None:
+                self._count_spending(old_expense, -1)
+            if record is not None:
+                self._count_spending(record)
+        elif collection == TRIPS and self.trip_currency(record_id) != (
+            (record or {}).get("currency") or DEFAULT_CURRENCY
+        ):
+            # The trip's expenses are worth something else; built again
+            # when next needed
+            self.spend_cube = None
+        if collection == LEDGER:
+            self.ledger.update({record_id: record})
+        elif collection == SEQUENCES:
+            if record is None:
+                self.sequences.pop(record_id, None)
+            else:
+                self.sequences[record_id] = record
+        elif record is None:
+            {
+                TRIPS: self._drop_trip,
+                ITINERARY: self._drop_itinerary_entry,
+                EXPENSES: self._drop_expense,
+            }[collection](record_id)
+        else:
+            {
+                TRIPS: self._set_trip,
+                ITINERARY: self._set_itinerary_entry,
+                EXPENSES: self._set_expense,
+            }[collection](record_id, record)
+
+    def _catch_up(self, collection):
+        """Applies what other sessions stored to a collection in memory."""
+        changes, data = self.store.catch_up(collection)
+        if collection == LEDGER and self._ledger_unsaved:
+            if not (changes or data):
+                # Still not stored; keep the rebuilt one
+                return
+            # Another session stored it with its first change
+            self._ledger_unsaved = False
+        if data is not None:
+            # The store could only reload it all; keep what differs
+            records = self._records(collection)
+            changes = [
+                (record_id, None) for record_id in records
+                if record_id not in data
+            ] + [
+                (record_id, record) for record_id, record in data.items()
+                if records.get(record_id) != record
+            ]
+        for record_id, record in changes:
+            self._set(collection, record_id, record)
+
+    def refresh(self):
+        """Picks up everything other sessions stored meanwhile."""
+        for collection in COLLECTIONS:
+            self._catch_up(collection)
+
+    def _expected(self, collection, record_id, expected):
+        if expected is CURRENT:
+            expected = self._records(collection).get(record_id)
+        return collection, record_id, expected
+
+    def _write(self, collections, build, expected=(), auto_compact=True):
+        """Stores changes worked out against the latest stored state.
+
+        Holding the store's transaction on the collections, this picks
+        up what other sessions stored, then checks the expected
+        (collection, record ID, record or None) tuples: the records as
+        the caller read them. If any has changed since, ConflictError is
+        raised and nothing is written. Otherwise build(pending) returns
+        the (collection, record ID, record or None) changes to make and
+        fills pending with the ledger entries they change (see
+        Ledger). Memory is only updated once the store has taken the
+        changes. Records expected to be new also move their collection's
+        sequence past their IDs.
+        """
+        created = [
+            (collection, record_id)
+            for collection, record_id, record in expected if record is None
+        ]
+        if created and SEQUENCES not in collections:
+            collections += (SEQUENCES,)
+        if self._ledger_unsaved and LEDGER not in collections:
+            collections += (LEDGER,)
+        with self.store.transaction(collections):
+            for collection in collections:
+                self._catch_up(collection)
+            for collection, record_id, record in expected:
+                if self._records(collection).get(record_id) != record:
+                    raise ConflictError(
+                        f"Record {record_id} in {collection} was changed "
+                        "by another session."
+                    )
+            pending = {}
+            changes = [
+                (LEDGER, trip_id, entry)
+                for trip_id, entry in self.ledger.entries.items()
+            ] if self._ledger_unsaved else []
+            changes += build(pending)
+            for collection, record_id in created:
+                changes += self._sequence_past(collection, [record_id])
+            changes += [
+                (LEDGER, trip_id, entry)
+                for trip_id, entry in self.ledger.finish(pending).items()
+            ]
+            self.store.apply(changes, auto_compact)
+        self._ledger_unsaved = False
+        for change in changes:
+            self._set(*change)
+
+    def save_many(self, collection, records):
+        """Adds or replaces many records of a collection with one write."""
+        def build(pending):
+            changes = self._sequence_past(collection, records)
+            if collection == TRIPS:
+                for trip_id, trip in records.items():
+                    self._ledger_trip(pending, trip_id, trip)
+            else:
+                for record in records.values():
+                    self._require_trip(record)
+            if collection == EXPENSES:
+                for expense_id, expense in records.items():
+                    self._ledger_expense(pending, expense_id, expense)
+            return changes + [
+                (collection, record_id, record)
+                for record_id, record in records.items()
+            ]
+        self._write(
+            (TRIPS, collection, LEDGER, SEQUENCES), build,
+            auto_compact=False
+        )
+
+    def compact(self, collection):
+        """Asks the store to tidy up a collection after bulk writes."""
+        self.store.compact(collection)
+        if collection != ITINERARY:
+            self.store.compact(LEDGER)
+
+    # --- IDs ---
+    def _reserve_ids(self, collection, count):
+        """Takes count IDs from a collection's sequence; returns the first."""
+        first = None
+
+        def build(pending):
+            nonlocal first
+            sequence = self.sequences.get(collection)
+            if sequence is None:
+                # The data predates the sequence: carry on above it
+                first = max(
+                    (int(record_id) for record_id in
+                     self._records(collection) if record_id.isdigit()),
+                    default=0
+                ) + 1
+            else:
+                first = sequence["next"]
+            return [(SEQUENCES, collection, {"next": first + count})]
+        # Starting a sequence needs the collection's records to be current
+        self._write(
+            (SEQUENCES,) if collection in self.sequences
+            else (SEQUENCES, collection), build
+        )
+        return first
+
+    def new_id(self, collection, block=None):
+        """Returns an unused ID for a new record of a collection.
+
+        The session takes block (id_block by default) IDs from the
+        collection's sequence at a time and hands them out until they
+        run out.
+        """
+        block = block or self.id_block
+        records = self._records(collection)
+        while True:
+            next_id, end = self._id_blocks.get(collection, (0, 0))
+            if next_id >= end:
+                next_id = self._reserve_ids(collection, block)
+                end = next_id + block
+            self._id_blocks[collection] = (next_id + 1, end)
+            # Skips IDs someone has chosen by hand meanwhile
+            if str(next_id) not in records:
+                return str(next_id)
+
+    def _sequence_past(self, collection, record_ids):
+        """Returns the change moving a sequence past IDs chosen by hand."""
+        sequence = self.sequences.get(collection)
+        highest = max(
+            (int(record_id) for record_id in record_ids
+             if record_id.isdigit()),
+            default=0
+        )
+        if sequence is None or highest < sequence["next"]:
+            return []
+        return [(SEQUENCES, collection, {"next": highest + 1})]
+
+    # --- Search ---
+    def _load_search_index(self):
+        """Returns the saved search index brought up to date, or None."""
+        path = self.store.cache_path(SEARCH_INDEX_FILE)
+        loaded = SearchIndex.load(path, SEARCH_FIELDS, TRIPS)
+        if loaded is None:
+            return None
+        index, points = loaded
+        caught_up = 0
+        for collection in SEARCH_FIELDS:
+            point = points.get(collection)
+            found = point is not None and self.store.changes_since(
+                collection, point
+            )
+            if not found:
+                return None
+            changes, points[collection] = found
+            # These may go past what this session has read; catching up
+            # on them later puts the same records again
+            for record_id, record in changes:
+                if record is None:
+                    index.discard(collection, record_id)
+                else:
+                    index.put(collection, record_id, record)
+            caught_up += len(changes)
+        if caught_up > SEARCH_SAVE_AFTER:
+            self._save_search_index(index, points)
+        return index
+
+    def _save_search_index(self, index, points):
+        try:
+            index.save(self.store.cache_path(SEARCH_INDEX_FILE), points)
+        except OSError:
+            pass  # Only a cache: the next session builds it again
+
+    def _search_rows(self, collection):
+        """Yields (record ID, trip ID, text) to build the search index."""
+        if collection == EXPENSES:
+            # Straight from the columns, without building records
+            for expense_id, trip_id, *texts in self.expenses.text_rows():
+                yield expense_id, trip_id, " ".join(texts)
+            return
+        for record_id, record in self._records(collection).items():
+            yield (
+                record_id,
+                record_id if collection == TRIPS else record.get("trip_id"),
+                record_text(record, SEARCH_FIELDS[collection])
+            )
+
+    def search(self, query, limit=None):
+        """Returns (collection, record ID) pairs matching a query, best first.
+
+        The index is loaded, or built from the records in memory, the
+        first time.
+        """
+        if self.search_index is None:
+            index = self._load_search_index()
+            if index is None:
+                index = SearchIndex(SEARCH_FIELDS, TRIPS)
+                index.build({
+                    collection: self._search_rows(collection)
+                    for collection in SEARCH_FIELDS
+                })
+                self._save_search_index(index, {
+                    collection: self.store.sync_point(collection)
+                    for collection in SEARCH_FIELDS
+                })
+            self.search_index = index
+        return [
+            (collection, record_id)
+            for collection, record_id in self.search_index.search(
+                query, limit
+            )
+            # The index may have read further than this session
+            if record_id in self._records(collection)
+        ]
+
+    # --- Trips ---
+    # expected is the record as the caller read it (None for a new one);
+    # the save is refused with ConflictError if it has changed since.
+    def _set_trip(self, trip_id, trip):
+        self.trips[trip_id] = trip
+        self.calendar.put(trip_id, trip)
+
+    def _drop_trip(self, trip_id):
+        self.trips.pop(trip_id, None)
+        self.calendar.discard(trip_id)
+
+    def trip_currency(self, trip_id):
+        """Returns the currency of a trip (the default for unknown ones)."""
+        trip = self.trips.get(trip_id) or {}
+        return trip.get("currency") or DEFAULT_CURRENCY
+
+    def _ledger_trip(self, pending, trip_id, trip):
+        """Works out the ledger change of replacing a trip.
+
+        If its currency changes, the trip's expenses are counted again:
+        those without a currency of their own are then in the new one,
+        and the others are converted to it.
+        """
+        self.ledger.set_budget(pending, trip_id, trip.get("budget"))
+        currency = trip.get("currency") or DEFAULT_CURRENCY
+        if currency != self.trip_currency(trip_id):
+            for expense_id in self.expenses_by_trip.get(trip_id, ()):
+                expense = self.expenses[expense_id]
+                self.ledger.add_expense(
+                    pending, expense, -1, self.expense_cents(expense)
+                )
+                self.ledger.add_expense(pending, expense, cents=(
+                    self.expense_cents({
+                        **expense,
+                        "currency": expense.get("currency") or currency
+                    }, currency)
+                ))
+
+    def save_trip(self, trip_id, trip, expected=CURRENT):
+        """Adds or replaces a trip."""
+        def build(pending):
+            self._ledger_trip(pending, trip_id, trip)
+            return [(TRIPS, trip_id, trip)]
+        self._write(
+            (TRIPS, LEDGER), build,
+            [self._expected(TRIPS, trip_id, expected)]
+        )
+
+    def delete_trip(self, trip_id, expected=CURRENT):
+        """Deletes a trip with its itinerary entries and expenses."""
+        def build(pending):
+            changes = self._dependents(pending, [trip_id])
+            self.ledger.set_budget(pending, trip_id, None)
+            return changes + [(TRIPS, trip_id, None)]
+        self._write(
+            (TRIPS, ITINERARY, EXPENSES, LEDGER), build,
+            [self._expected(TRIPS, trip_id, expected)]
+        )
+
+    def _dependents(self, pending, trip_ids):
+        """Returns the changes deleting the records of some trips.
+
+        The trip indexes give the itinerary entries and expenses without
+        looking at anyone else's; they come before the trips' own
+        deletion, as the database's foreign keys need.
+        """
+        changes = []
+        for trip_id in trip_ids:
+            changes += [
+                (ITINERARY, itinerary_id, None)
+                for itinerary_id in self.itinerary_by_trip.get(trip_id, ())
+            ]
+            for expense_id in self.expenses_by_trip.get(trip_id, ()):
+                self._ledger_expense(pending, expense_id, None)
+                changes.append((EXPENSES, expense_id, None))
+        return changes
+
+    def _require_trip(self, record):
+        """Refuses to store a record whose trip has been deleted."""
+        trip_id = str(record.get("trip_id"))
+        if trip_id not in self.trips:
+            raise ConflictError(
+                f"Trip {trip_id} was deleted by another session."
+            )
+
+    def orphaned_trips(self):
+        """Returns the missing trip IDs that records still point at."""
+        return sorted(
+            trip_id
+            for index in (self.itinerary_by_trip, self.expenses_by_trip)
+            for trip_id, record_ids in index.items()
+            if record_ids and trip_id not in self.trips
+        )
+
+    def purge_orphans(self):
+        """Deletes the records of missing trips and compacts the store.
+
+        Returns the number of records deleted per collection.
+        """
+        deleted = defaultdict(int)
+
+        def build(pending):
+            changes = self._dependents(pending, set(self.orphaned_trips()))
+            for collection, _, _ in changes:
+                deleted[collection] += 1
+            return changes
+        self._write(
+            (TRIPS, ITINERARY, EXPENSES, LEDGER), build, auto_compact=False
+        )
+        for collection in COLLECTIONS:
+            self.store.compact(collection)
+        return dict(deleted)
+
+    # --- Itinerary ---
+    def _index_itinerary_entry(self, itinerary_id, entry):
+        trip_id = str(entry.get("trip_id"))
+        self.itinerary_by_trip[trip_id][itinerary_id] = None
+
+    def _unindex_itinerary_entry(self, itinerary_id, entry):
+        trip_id = str(entry.get("trip_id"))
+        self.itinerary_by_trip[trip_id].pop(itinerary_id, None)
+
+    def _set_itinerary_entry(self, itinerary_id, entry):
+        old_entry = self.itinerary.get(itinerary_id)
+        if old_entry is not None:
+            self._unindex_itinerary_entry(itinerary_id, old_entry)
+        self.itinerary[itinerary_id] = entry
+        self._index_itinerary_entry(itinerary_id, entry)
+
+    def _drop_itinerary_entry(self, itinerary_id):
+        entry = self.itinerary.pop(itinerary_id, None)
+        if entry is not None:
+            self._unindex_itinerary_entry(itinerary_id, entry)
+
+    def save_itinerary_entry(self, itinerary_id, entry, expected=CURRENT):
+        """Adds or replaces an itinerary entry."""
+        def build(pending):
+            self._require_trip(entry)
+            return [(ITINERARY, itinerary_id, entry)]
+        self._write(
+            (TRIPS, ITINERARY), build,
+            [self._expected(ITINERARY, itinerary_id, expected)]
+        )
+
+    def delete_itinerary_entry(self, itinerary_id, expected=CURRENT):
+        """Deletes an itinerary entry."""
+        self._write(
+            (ITINERARY,), lambda pending: [(ITINERARY, itinerary_id, None)],
+            [self._expected(ITINERARY, itinerary_id, expected)]
+        )
+
+    def trip_itinerary(self, trip_id):
+        """Returns the itinerary entries of a trip, keyed by ID."""
+        return {
+            itinerary_id: self.itinerary[itinerary_id]
+            for itinerary_id in self.itinerary_by_trip.get(trip_id, ())
+        }
+
+    # --- Expenses ---
+    def _set_expense(self, expense_id, expense):
+        old_expense = self.expenses.get(expense_id)
+        if old_expense is not None:
+            self.expenses_by_trip[old_expense["trip_id"]].pop(expense_id)
+        self.expenses.put(expense_id, expense)
+        self.expenses_by_trip[str(expense.get("trip_id"))][expense_id] = None
+
+    def _drop_expense(self, expense_id):
+        expense = self.expenses.get(expense_id)
+        if expense is not None:
+            self.expenses.delete(expense_id)
+            self.expenses_by_trip[expense["trip_id"]].pop(expense_id)
+
+    def _ledger_expense(self, pending, expense_id, expense):
+        """Works out the ledger change of replacing an expense."""
+        old_expense = self.expenses.get(expense_id)
+        if old_expense is not None:
+            self.ledger.add_expense(
+                pending, old_expense, -1, self.expense_cents(old_expense)
+            )
+        if expense is not None:
+            self.ledger.add_expense(
+                pending, expense, cents=self.expense_cents(expense)
+            )
+
+    def expense_cents(self, expense, currency=None):
+        """Returns an expense's amount in cents of a currency.
+
+        currency defaults to the trip's. Returns None if the rate table
+        cannot convert the amount; the ledger then counts it as it is,
+        as the check commands report.
+        """
+        cents = to_cents(expense.get("amount", 0)) or 0
+        trip_currency = self.trip_currency(str(expense.get("trip_id")))
+        source = expense.get("currency")
+        if not source or not isinstance(source, str):
+            source = trip_currency
+        factor = self.rates.factor(
+            source, currency or trip_currency,
+            to_day(expense.get("date")) or LATEST
+        )
+        return None if factor is None else scale(cents, factor)
+
+    def save_expense(self, expense_id, expense, expected=CURRENT):
+        """Adds or replaces an expense."""
+        def build(pending):
+            self._require_trip(expense)
+            self._ledger_expense(pending, expense_id, expense)
+            return [(EXPENSES, expense_id, expense)]
+        self._write(
+            (TRIPS, EXPENSES, LEDGER), build,
+            [self._expected(EXPENSES, expense_id, expected)]
+        )
+
+    def delete_expense(self, expense_id, expected=CURRENT):
+        """Deletes an expense."""
+        def build(pending):
+            self._ledger_expense(pending, expense_id, None)
+            return [(EXPENSES, expense_id, None)]
+        self._write(
+            (EXPENSES, LEDGER), build,
+            [self._expected(EXPENSES, expense_id, expected)]
+        )
+
+    def trip_expenses(self, trip_id):
+        """Returns the expenses of a trip, keyed by ID."""
+        return {
+            expense_id: self.expenses[expense_id]
+            for expense_id in self.expenses_by_trip.get(trip_id, ())
+        }
+
+    def spent_cents(self, trip_id):
+        """Returns the total amount spent on a trip, in cents."""
+        return self.ledger.spent_cents(trip_id)
+
+    def budget_cents(self, trip_id):
+        """Returns a trip's budget in cents, or None if it has none."""
+        return self.ledger.budget_cents(trip_id)
+
+    def remaining_budget_cents(self, trip_id):
+        """Returns the trip budget minus everything spent on it, in cents."""
+        return (self.budget_cents(trip_id) or 0) - self.spent_cents(trip_id)
+
+    def expense_aggregates(self):
+        """Adds up the expenses into (trip, category, total, count) rows.
+
+        Amounts are in the trip's currency. The totals come from one pass
+        over the expense columns, adding up each expense's amount in
+        cents as the ledger does, on every store: a sum of the stored
+        amounts rounded afterwards can differ by a cent.
+        """
+        # Expenses in other currencies are converted to their trip's
+        cents, _ = self.expenses.converted_cents(
+            self.rates, self.trip_currency
+        )
+        return self.expenses.aggregate(cents)
+
+    def _count_spending(self, expense, sign=1):
+        """Counts an expense in, or out, of the spend cube."""
+        cents = self.expense_cents(expense, DEFAULT_CURRENCY)
+        self.spend_cube.add_expense(
+            expense, sign, cents, left_out=cents is None
+        )
+
+    def spending(self):
+        """Returns the spending rolled up by trip, category and day.
+
+        The SpendCube is built from the expense columns the first time,
+        with the amounts converted to the default currency. Those the
+        rate table cannot convert are left out of the totals and only
+        counted (see SpendCube.left_out_count()).
+        """
+        if self.spend_cube is None:
+            cents, unknown = self.expenses.converted_cents(
+                self.rates, self.trip_currency, DEFAULT_CURRENCY
+            )
+            self.spend_cube = SpendCube.from_columns(
+                self.expenses, cents, unknown
+            )
+        return self.spend_cube
+
+    def trip_summaries(self):
+        """Returns (trip ID, TripResult) pairs for the summary.
+
+        Only the trips changed since the last call are rebuilt.
+        """
+        return self.summary_cache.trip_results(self)
+
+    # --- Ledger ---
+    def rebuild_ledger(self):
+        """Returns a ledger built afresh from the trips and expenses."""
+        return Ledger.rebuild(self.trips, self.expense_aggregates())
+
+    def replace_ledger(self, ledger):
+        """Stores a rebuilt ledger in place of the current one."""
+        def build(pending):
+            return [
+                (LEDGER, trip_id, None) for trip_id in self.ledger.entries
+                if trip_id not in ledger.entries
+            ] + [
+                (LEDGER, trip_id, entry)
+                for trip_id, entry in ledger.entries.items()
+            ]
+        self._write((LEDGER,), build, auto_compact=False)
+        self.store.compact(LEDGER)
+
+
+def open_store(tenant=None):
+    """Opens the store selected by the environment.
+
+    When tenants are enabled (see tenants.py), this is the shard of the
+    given tenant, by default the session's.
+    """
+    data_dir = "."
+    root = tenants.tenant_root()
+    if root is not None:
+        data_dir = tenants.shard_dir(root, tenant or tenants.session_tenant())
+        os.makedirs(data_dir, exist_ok=True)
+    db_path = os.environ.get("TRAVEL_PLANNER_DB")
+    if db_path:
+        # Imported here so the JSON backend never loads sqlite3
+        from sqlite_store import SqliteStore
+        if root is not None:
+            db_path = os.path.join(data_dir, os.path.basename(db_path))
+        return SqliteStore(db_path)
+    return JsonStore(data_dir)
+
+
+_repository = None
+
+
+def get_repository():
+    """Returns the session's repository, up to date with other sessions.
+
+    The first call loads it; later ones pick up what other sessions
+    stored since.
+    """
+    global _repository
+    if _repository is None:
+        _repository = Repository(open_store())
+    else:
+        _repository.refresh()
+    return _repository
@@ -1,10 +1,26 @@
-import json
+import math
 import os
 import re
-import pandas as pd
+import sys
 from datetime import datetime
-import pyfiglet
+from itertools import islice
 from rich.console import Console
+from rich.table import Table
+from columnar import from_cents
+from currency import DEFAULT_CURRENCY, currency_code
+from repository import ITINERARY, TRIPS
+from service import ServiceError, get_service, parse_date
+from storage import StorageError
+from tenants import TENANT_ENV, tenant_root, valid_tenant
+from validation import (
+    validate_date, validate_budget, validate_date_format
+)
+
+# The rendered "bubble" banner is cached here so pyfiglet is only
+# imported when the cache file is missing
+BANNER_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "assets", "banner.txt"
+)
 
 # Create a single console instance for the entire module
 console = Console()
@@ -22,24 +38,27 @@ def print_error(message):
     console.print(message, style="bold red")
 
 
-def display_heading():
-    # Use the global console instance
+def render_banner():
+    """Returns the ASCII-art banner, rendering it if it is not cached."""
+    try:
+        with open(BANNER_FILE, "r", encoding="utf-8") as file:
+            return file.read()
+    except OSError:
+        pass
+    import pyfiglet
     ascii_banner = pyfiglet.figlet_format("Travel Planner!", font="bubble")
-    console.print(f"\n✈ [bold blue]{ascii_banner}[/bold blue] ✈\n")
-
-
-def load_data(file_path):
-    """Loads data from a JSON file."""
-    if os.path.exists(file_path):
-        with open(file_path, "r") as file:
-            return json.load(file)
-    return {}
+    try:
+        with open(BANNER_FILE, "w", encoding="utf-8") as file:
+            file.write(ascii_banner)
+    except OSError:
+        pass  # A read-only install just renders the banner every time
+    return ascii_banner
 
 
-def save_data(file_path, data):
-    """Saves data to a JSON file."""
-    with open(file_path, "w") as file:
-        json.dump(data, file, indent=4)
+def display_heading():
+    # Use the global console instance
+    ascii_banner = render_banner()
+    console.print(f"\n✈ [bold blue]{ascii_banner}[/bold blue] ✈\n")
 
 
 def show_instructions():
@@ -53,7 +72,8 @@ def show_instructions():
 
     Information once entered will be saved automatically.
     Ensure all dates are entered in the YYYY-MM-DD format.
-    Trip IDs, Itinerary IDs, and Expense IDs must be unique.
+    Leave an ID blank to have the next free one assigned;
+    IDs you choose yourself must be unique.
     If you encounter an error, review the details carefully.
     TO BEGIN: Select an Option from the Main Menu and
     input your details carefully.
@@ -63,10 +83,20 @@ def show_instructions():
     print(instructions)
 
 
-# Call the function to display heading
-display_heading()
-# Call the function to display the instructions
-show_instructions()
+def choose_workspace():
+    """Asks which workspace to open when the data is split by tenant.
+
+    A workspace named by the environment (e.g. by ?workspace= in the
+    web terminal) is only asked for again if its name is invalid.
+    """
+    if tenant_root() is None:
+        return
+    name = os.environ.get(TENANT_ENV) or None
+    while name is None or not valid_tenant(name):
+        if name is not None:
+            print_error("Use 1-64 letters, digits, '-' or '_'.")
+        name = input("Enter your workspace name: ").strip()
+    os.environ[TENANT_ENV] = name
 
 
 def manage_itinerary_menu():
@@ -80,7 +110,9 @@ def main_menu():
         console.print("2. Manage Itinerary", style="bold cyan")
         console.print("3. Track Expenses", style="bold cyan")
         console.print("4. Summary", style="bold cyan")
-        console.print("5. Exit", style="bold cyan")
+        console.print("5. Search", style="bold cyan")
+        console.print("6. Analytics", style="bold cyan")
+        console.print("7. Exit", style="bold cyan")
         choice = input("Choose an option: ")
 
         if choice == '1':
@@ -96,13 +128,102 @@ def main_menu():
             print_success("Navigating to Summary...")
             show_summary()
         elif choice == '5':
+            print_success("Navigating to Search...")
+            search_records()
+        elif choice == '6':
+            print_success("Navigating to Analytics...")
+            show_analytics()
+        elif choice == '7':
             print_success("Exiting...")
             break
         else:
             print_error("Invalid option. Please choose again.")
 
 
+# --- List View Helpers ---
+PAGE_SIZE = 20
+
+
+def ask_date_range():
+    """Asks for an optional date range; returns (start, end) or None.
+
+    Either end of the range may be None when left blank.
+    """
+    dates = []
+    for label in ("From", "To"):
+        date_str = input(f"{label} date (YYYY-MM-DD, blank for any): ")
+        date_str = date_str.strip()
+        if date_str and not validate_date_format(date_str):
+            print_error("Invalid format. Please enter the date as YYYY-MM-DD.")
+            return None
+        dates.append(parse_date(date_str) if date_str else None)
+    return tuple(dates)
+
+
+def show_paginated(title, columns, rows):
+    """Shows rows one page at a time, rendered as a single table per page.
+
+    rows can be a lazy iterable: only the pages actually visited are
+    pulled from it, so the first page shows up straight away however
+    many entries there are.
+    """
+    rows = iter(rows)
+    pages = []
+    page = 0
+    while True:
+        # Fetch one page ahead so we know whether there is a next page
+        while len(pages) <= page + 1:
+            chunk = list(islice(rows, PAGE_SIZE))
+            if not chunk:
+                break
+            pages.append(chunk)
+        if not pages:
+            print_warning("No matching entries found.")
+            return
+
+        table = Table(title=f"{title} (page {page + 1})")
+        for column in columns:
+            table.add_column(column)
+        for row in pages[page]:
+            table.add_row(*(str(value) for value in row))
+        console.print(table)
+
+        has_next = page + 1 < len(pages)
+        if not has_next and page == 0:
+            return
+        choice = input(
+            "N = next page, P = previous page, Q or blank = back: "
+        ).strip().lower()
+        if choice == "n" and has_next:
+            page += 1
+        elif choice == "p" and page > 0:
+            page -= 1
+        elif choice in ("q", ""):
+            return
+        else:
+            print_error("No such page. Choose N, P or Q.")
+
+
 # --- Trip Management Functions ---
+# Overlapping trips named in the warning; the rest are only counted
+MAX_OVERLAPS_LISTED = 5
+
+
+def warn_overlaps(service, start_date, end_date, trip_id=None):
+    """Warns about other trips taking place on any of a trip's days."""
+    overlaps = service.overlapping_trips(start_date, end_date, trip_id)
+    if not overlaps:
+        return
+    listed = ", ".join(
+        f"{other_id} ({trip['destination']}, {trip['start_date']} to "
+        f"{trip['end_date']})"
+        for other_id, trip in overlaps[:MAX_OVERLAPS_LISTED]
+    )
+    if len(overlaps) > MAX_OVERLAPS_LISTED:
+        listed += f" and {len(overlaps) - MAX_OVERLAPS_LISTED} more"
+    print_warning(f"Note: these dates overlap trip(s) {listed}.")
+
+
 def manage_trips_menu():
     """Displays the menu for managing trips."""
     while True:
@@ -130,14 +251,16 @@ def manage_trips_menu():
 
 def create_trip():
     """Creates a new trip entry and saves it to trips.json."""
-    file_path = "trips.json"
-    trips = load_data(file_path)
+    service = get_service()
+    trips = service.repo.trips
 
-    # Prompt for a valid trip ID
+    # Prompt for a valid trip ID, or none to have one assigned
     while True:
-        trip_id = input("Enter trip ID: ")
+        trip_id = input("Enter trip ID (leave blank to assign one): ").strip()
 
-        if not trip_id.isdigit() or int(trip_id) <= 0:
+        if not trip_id:
+            break
+        elif not trip_id.isdigit() or int(trip_id) <= 0:
             print_error("Invalid Trip ID. Must be a positive number.")
         elif trip_id in trips:
             print_error("ID already exists. Please choose a different ID.")
@@ -174,6 +297,7 @@ def create_trip():
                 print_error("End date cannot be earlier than the start date.")
         else:
             print_error("Invalid end date. Must be today or a future date.")
+    warn_overlaps(service, start_date, end_date)
 
     # Prompt for a valid budget
     while True:
@@ -183,47 +307,77 @@ def create_trip():
         else:
             print_error("Invalid budget. Please enter a positive number.")
 
+    # Prompt for the currency of the budget and expenses
+    while True:
+        currency = input(
+            f"Enter the currency (e.g. EUR, leave blank for "
+            f"{DEFAULT_CURRENCY}): "
+        ).strip()
+        if not currency or currency_code(currency):
+            break
+        print_error("Invalid currency. Enter a three-letter code.")
+
     new_trip = {
         "destination": destination,
         "start_date": start_date,
         "end_date": end_date,
-        "budget": budget
+        "budget": budget,
+        "currency": currency
     }
 
-    trips[trip_id] = new_trip
-    save_data(file_path, trips)
-    print_success("New trip added successfully!")
+    try:
+        # Refused if another session took the ID meanwhile
+        trip_id, _ = service.add_trip(trip_id, new_trip)
+    except (ServiceError, StorageError) as e:
+        print_error(f"Trip could not be saved: {e}")
+        return
+    print_success(f"New trip {trip_id} added successfully!")
 
 
 def view_trips():
-    """Displays all trips saved in trips.json."""
-    file_path = "trips.json"
-    trips = load_data(file_path)
+    """Displays the trips saved in trips.json, a page at a time."""
+    service = get_service()
 
-    if not trips:
+    if not service.repo.trips:
         print_warning("No trips found.")
-    else:
-        print("\n--- All Trips ---")
-        for trip_id, details in trips.items():
-            # Retrieve budget or set a default if it doesn't exist
-            budget = details.get('budget', 'Not specified')
-            print(f"Trip ID: {trip_id}")
-            print(f"Destination: {details['destination']}")
-            print(f"Start Date: {details['start_date']}")
-            print(f"End Date: {details['end_date']}")
-            print(f"Budget: {budget}")
-            print("")
+        return
+
+    print("Show trips taking place between two dates (optional).")
+    date_range = ask_date_range()
+    if date_range is None:
+        return
+
+    # A trip matches if any of its days falls inside the range. Retrieve
+    # budget or set a default if it doesn't exist
+    rows = (
+        (
+            trip_id, details['destination'], details['start_date'],
+            details['end_date'], details.get('budget', 'Not specified'),
+            details.get('currency', DEFAULT_CURRENCY)
+        )
+        for trip_id, details in service.list_trips(*date_range)
+    )
+    show_paginated(
+        "All Trips",
+        [
+            "Trip ID", "Destination", "Start Date", "End Date", "Budget",
+            "Currency"
+        ],
+        rows
+    )
 
 
 def edit_trip():
     """Edits an existing trip in trips.json."""
-    file_path = "trips.json"
-    trips = load_data(file_path)
+    service = get_service()
+    trips = service.repo.trips
 
     trip_id = input("Enter the Trip ID to edit: ")
 
     if trip_id in trips:
         print("Editing trip details.")
+        # Saving is refused if another session changes the trip meanwhile
+        trip = trips[trip_id]
 
         # Validate destination input
         while True:
@@ -260,6 +414,7 @@ def edit_trip():
                     "Invalid end date. Must be today or a future date, "
                     "and not before the start date."
                 )
+        warn_overlaps(service, start_date, end_date, trip_id)
 
         # Retrieve the budget or set it to a default value if not available
         current_budget = trips[trip_id].get('budget', '0.0')
@@ -274,14 +429,27 @@ def edit_trip():
             else:
                 print_error("Invalid budget. Please enter a positive number.")
 
-        trips[trip_id] = {
-            "destination": destination,
-            "start_date": start_date,
-            "end_date": end_date,
-            "budget": budget
-        }
+        # Expenses without their own currency change with the trip's
+        while True:
+            currency = input(
+                f"Enter new currency "
+                f"(current: {service.repo.trip_currency(trip_id)}): "
+            ).strip() or trip.get('currency', '')
+            if not currency or currency_code(currency):
+                break
+            print_error("Invalid currency. Enter a three-letter code.")
 
-        save_data(file_path, trips)
+        try:
+            service.update_trip(trip_id, {
+                "destination": destination,
+                "start_date": start_date,
+                "end_date": end_date,
+                "budget": budget,
+                "currency": currency
+            }, expected=trip)
+        except (ServiceError, StorageError) as e:
+            print_error(f"Trip could not be updated: {e}")
+            return
         print_success("Trip updated successfully!")
     else:
         print_error("Trip ID not found.")
@@ -289,46 +457,31 @@ def edit_trip():
 
 def delete_trip():
     """Deletes a trip from trips.json."""
-    file_path = "trips.json"
-    trips = load_data(file_path)
+    service = get_service()
+    trips = service.repo.trips
 
     trip_id = input("Enter the Trip ID to delete: ")
 
     if trip_id in trips:
-        del trips[trip_id]
-        save_data(file_path, trips)
+        entries = len(service.repo.itinerary_by_trip.get(trip_id, ()))
+        expenses = len(service.repo.expenses_by_trip.get(trip_id, ()))
+        if entries or expenses:
+            confirm = input(
+                f"This also deletes its {entries} itinerary entry(ies) "
+                f"and {expenses} expense(s). Continue? (y/n): "
+            ).strip().lower()
+            if confirm != "y":
+                print_warning("Trip not deleted.")
+                return
+        try:
+            service.delete_trip(trip_id)
+        except (ServiceError, StorageError) as e:
+            print_error(f"Trip could not be deleted: {e}")
+            return
         print_success("Trip deleted successfully!")
     else:
         print_error("Trip ID not found.")
 
-# --- Helper Functions ---
-
-
-def validate_date(date_str):
-    """Validates if the date is today or a future date."""
-    try:
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        current_date = datetime.now().date()
-
-        if date_obj.date() >= current_date:
-            return True
-        else:
-            return False
-    except ValueError:
-        return False
-
-
-def validate_budget(budget_str):
-    """Validates if the budget is a positive number."""
-    try:
-        budget = float(budget_str)
-        if budget > 0:
-            return True
-        else:
-            return False
-    except ValueError:
-        return False
-
 
 # --- Itinerary Management Functions ---
 def manage_itinerary_menu():
@@ -359,13 +512,15 @@ def manage_itinerary_menu():
 
 def add_itinerary_entry():
     """Adds a new itinerary entry to itinerary.json with input validation."""
-    file_path = "itinerary.json"
-    itinerary = load_data(file_path)
+    service = get_service()
+    itinerary = service.repo.itinerary
 
-    # Validate itinerary ID
+    # Validate itinerary ID, or none to have one assigned
     while True:
-        itinerary_id = input("Enter itinerary ID: ").strip()
-        if (
+        itinerary_id = input(
+            "Enter itinerary ID (leave blank to assign one): "
+        ).strip()
+        if not itinerary_id or (
             itinerary_id.isdigit() and int(itinerary_id) > 0
             and itinerary_id not in itinerary
         ):
@@ -373,20 +528,23 @@ def add_itinerary_entry():
         print_error("Invalid ID or ID already exists. Please try again.")
 
     # Validate trip ID
-    trips = load_data("trips.json")
+    trips = service.repo.trips
     while True:
         trip_id = input("Enter the Trip ID to associate: ").strip()
         if trip_id in trips:
             break
         print_error("Trip ID not found. Please enter an existing Trip ID.")
 
-    # Fetch trip start and end dates for date validation
-    trip_start_date = datetime.strptime(
-        trips[trip_id]['start_date'], "%Y-%m-%d"
-    )
-    trip_end_date = datetime.strptime(
-        trips[trip_id]['end_date'], "%Y-%m-%d"
-    )
+    # The trip's dates, parsed once when the trip was loaded; None if
+    # they are invalid or reversed, leaving no day for the entry
+    trip_dates = service.repo.calendar.dates(trip_id)
+    if trip_dates is None:
+        print_error(
+            f"Trip {trip_id} has invalid dates. Fix them with Edit Trip "
+            "first."
+        )
+        return
+    trip_start_date, trip_end_date = trip_dates
     current_date = datetime.now().date()
 
     # Validate date
@@ -398,15 +556,12 @@ def add_itinerary_entry():
                 print_error(
                     "Date cannot be in the past. Please enter a future date."
                 )
-            elif (
-                trip_start_date.date()
-                <= itinerary_date <= trip_end_date.date()
-            ):
+            elif trip_start_date <= itinerary_date <= trip_end_date:
                 break
             else:
                 print_error(
                     f"Date must be within the trip duration "
-                    f"({trip_start_date.date()} to {trip_end_date.date()})."
+                    f"({trip_start_date} to {trip_end_date})."
                 )
         else:
             print_error("Invalid format. Please enter the date as YYYY-MM-DD.")
@@ -424,32 +579,49 @@ def add_itinerary_entry():
         "activity": activity
     }
 
-    itinerary[itinerary_id] = new_entry
-    save_data(file_path, itinerary)
-    print_success("New itinerary entry added successfully!")
+    try:
+        itinerary_id, _ = service.add_itinerary_entry(
+            itinerary_id, new_entry
+        )
+    except (ServiceError, StorageError) as e:
+        print_error(f"Itinerary entry could not be saved: {e}")
+        return
+    print_success(f"New itinerary entry {itinerary_id} added successfully!")
 
 
 def view_itineraries():
-    """Displays all the itineraries saved in the itinerary.json file."""
-    file_path = "itinerary.json"
-    itinerary = load_data(file_path)
+    """Displays the itinerary entries, filtered and a page at a time."""
+    service = get_service()
 
-    if not itinerary:
+    if not service.repo.itinerary:
         print_warning("No itinerary entries found.")
-    else:
-        print("\n--- All Itinerary Entries ---")
-        for itinerary_id, details in itinerary.items():
-            print(f"Itinerary ID: {itinerary_id}")
-            print(f"Trip ID: {details['trip_id']}")
-            print(f"Date: {details['date']}")
-            print(f"Activity: {details['activity']}")
-            print("")
+        return
+
+    trip_id = input("Filter by Trip ID (leave blank for all): ").strip()
+    date_range = ask_date_range()
+    if date_range is None:
+        return
+
+    rows = (
+        (
+            itinerary_id, details['trip_id'], details['date'],
+            details['activity']
+        )
+        for itinerary_id, details in service.list_itinerary(
+            trip_id, *date_range
+        )
+    )
+    show_paginated(
+        "All Itinerary Entries",
+        ["Itinerary ID", "Trip ID", "Date", "Activity"],
+        rows
+    )
 
 
 def edit_itinerary_entry():
     """Edits an existing itinerary entry in itinerary.json."""
-    file_path = "itinerary.json"
-    itinerary = load_data(file_path)
+    service = get_service()
+    itinerary = service.repo.itinerary
 
     if not itinerary:
         print_warning("No itinerary entries found.")
@@ -460,23 +632,26 @@ def edit_itinerary_entry():
         print_success(
             "Editing itinerary details. Leave blank to keep the current value."
         )
-        entry = itinerary[itinerary_id]
+        # Work on a copy so the loaded entry only changes once saved
+        original = itinerary[itinerary_id]
+        entry = dict(original)
         trip_id = entry['trip_id']
 
-        # Fetch trip start and end dates for date validation
-        trips = load_data("trips.json")
-        trip_start_date = datetime.strptime(
-            trips[trip_id]['start_date'], "%Y-%m-%d"
-        )
-        trip_end_date = datetime.strptime(
-            trips[trip_id]['end_date'], "%Y-%m-%d"
-        )
+        # The trip's dates, parsed once when the trip was loaded
+        trip_dates = service.repo.calendar.dates(trip_id)
         current_date = datetime.now().date()
 
         date = input(
             f"Enter new date (YYYY-MM-DD) (current: {entry['date']}): "
         ).strip()
         if date:
+            if trip_dates is None:
+                print_error(
+                    f"Trip {trip_id} has invalid dates. Fix them with Edit "
+                    "Trip first."
+                )
+                return
+            trip_start_date, trip_end_date = trip_dates
             if validate_date_format(date):
                 itinerary_date = datetime.strptime(date, "%Y-%m-%d").date()
                 if itinerary_date < current_date:
@@ -485,15 +660,12 @@ def edit_itinerary_entry():
                         "current date."
                     )
                     return
-                elif (
-                    trip_start_date.date()
-                    <= itinerary_date <= trip_end_date.date()
-                ):
+                elif trip_start_date <= itinerary_date <= trip_end_date:
                     entry['date'] = date
                 else:
                     print_error(
                         "Date must be within the trip duration ("
-                        f"{trip_start_date.date()} to {trip_end_date.date()})."
+                        f"{trip_start_date} to {trip_end_date})."
                     )
                     return
             else:
@@ -509,7 +681,13 @@ def edit_itinerary_entry():
             "date": entry['date'],
             "activity": activity
         })
-        save_data(file_path, itinerary)
+        try:
+            service.update_itinerary_entry(
+                itinerary_id, entry, expected=original
+            )
+        except (ServiceError, StorageError) as e:
+            print_error(f"Itinerary entry could not be updated: {e}")
+            return
         print_success("Itinerary entry updated successfully!")
     else:
         print_error("Itinerary ID not found.")
@@ -517,8 +695,8 @@ def edit_itinerary_entry():
 
 def delete_itinerary_entry():
     """Deletes an itinerary entry from the itinerary.json file."""
-    file_path = "itinerary.json"
-    itinerary = load_data(file_path)
+    service = get_service()
+    itinerary = service.repo.itinerary
 
     if not itinerary:
         print_warning("No itinerary entries found.")
@@ -526,23 +704,16 @@ def delete_itinerary_entry():
 
     itinerary_id = input("Enter the Itinerary ID to delete: ").strip()
     if itinerary_id in itinerary:
-        del itinerary[itinerary_id]
-        save_data(file_path, itinerary)
+        try:
+            service.delete_itinerary_entry(itinerary_id)
+        except (ServiceError, StorageError) as e:
+            print_error(f"Itinerary entry could not be deleted: {e}")
+            return
         print_success("Itinerary entry deleted successfully!")
     else:
         print_error("Itinerary ID not found.")
 
 
-# Date format validation helper function
-def validate_date_format(date_str):
-    """Validates if the given date string matches the YYYY-MM-DD format."""
-    try:
-        datetime.strptime(date_str, "%Y-%m-%d")
-        return True
-    except ValueError:
-        return False
-
-
 # --- Expenses Management Functions ---
 def manage_expenses_menu():
     """Displays the menu for managing expenses."""
@@ -572,18 +743,21 @@ def manage_expenses_menu():
 
 def add_expense():
     """Adds a new expense to the expenses.json file."""
-    file_path = "expenses.json"
-    trips_path = "trips.json"
-    expenses = load_data(file_path)
-    trips = load_data(trips_path)
+    service = get_service()
+    repo = service.repo
+    expenses = repo.expenses
+    trips = repo.trips
 
-    # Validate expense ID
+    # Validate expense ID, or none to have one assigned
     while True:
         try:
-            expense_id = int(
-                input("Enter expense ID (must be > 0): ").strip()
-            )
-            if expense_id > 0 and str(expense_id) not in expenses:
+            expense_id = input(
+                "Enter expense ID (must be > 0, leave blank to assign one): "
+            ).strip()
+            if not expense_id:
+                break
+            expense_id = str(int(expense_id))
+            if int(expense_id) > 0 and expense_id not in expenses:
                 break
             console.print(
                 "[red]Invalid ID or ID already exists. Please try again.[/red]"
@@ -602,22 +776,41 @@ def add_expense():
             "[red]Trip ID not found. Enter a valid Trip ID that exists.[/red]"
         )
 
-    # Calculate remaining budget for the trip
-    budget = float(trips[trip_id].get("budget", 0))
-    associated_expenses = sum(
-        float(exp.get("amount", 0)) for exp in expenses.values()
-        if exp.get("trip_id") == trip_id
+    # Read the remaining budget from the trip's ledger entry
+    remaining_cents = repo.remaining_budget_cents(trip_id)
+
+    trip_currency = repo.trip_currency(trip_id)
+    console.print(
+        f"Remaining budget for this trip: "
+        f"{from_cents(remaining_cents):.2f} {trip_currency}"
     )
-    remaining_budget = budget - associated_expenses
 
-    console.print(f"Remaining budget for this trip: ${remaining_budget:.2f}")
+    # Validate the currency, which needs a rate to the trip's
+    while True:
+        currency = input(
+            f"Enter the currency (leave blank for {trip_currency}): "
+        ).strip()
+        if not currency:
+            break
+        if currency_code(currency) is None:
+            print_error("Invalid currency. Enter a three-letter code.")
+        elif repo.rates.factor(currency_code(currency), trip_currency):
+            currency = currency_code(currency)
+            break
+        else:
+            print_error(
+                f"No exchange rate from {currency_code(currency)} to "
+                f"{trip_currency}. Add one to the rate table first."
+            )
 
     # Validate amount and check against remaining budget
     while True:
         try:
             amount = float(input("Enter the amount: ").strip())
+            if not math.isfinite(amount):
+                raise ValueError(amount)
             if amount >= 0:
-                if budget > 0 and amount > remaining_budget:
+                if service.over_budget(trip_id, amount, currency or None):
                     console.print(
                         "[yellow]Warning: Adding this expense will exceed the "
                         "trip's budget.[/yellow]"
@@ -641,41 +834,87 @@ def add_expense():
         console.print("[red]Description cannot be empty.[/red]")
         description = input("Enter a description: ").strip()
 
+    # Validate the optional date against the trip's dates; a trip with
+    # invalid or reversed dates has no day to give its expenses
+    trip_dates = repo.calendar.dates(trip_id)
+    date = ""
+    if trip_dates is None:
+        print_warning(
+            f"Trip {trip_id} has invalid dates, so the expense is saved "
+            "without a date. Fix them with Edit Trip to date expenses."
+        )
+    else:
+        trip_start_date, trip_end_date = trip_dates
+    while trip_dates is not None:
+        date = input(
+            "Enter the date (YYYY-MM-DD, leave blank for none): "
+        ).strip()
+        if not date:
+            break
+        if not validate_date_format(date):
+            print_error("Invalid format. Please enter the date as YYYY-MM-DD.")
+        elif trip_start_date <= parse_date(date) <= trip_end_date:
+            break
+        else:
+            print_error(
+                f"Date must be within the trip duration "
+                f"({trip_start_date} to {trip_end_date})."
+            )
+
     new_expense = {
         "trip_id": trip_id,
         "amount": amount,
         "category": category,
-        "description": description
+        "description": description,
+        "date": date,
+        "currency": currency
     }
 
-    expenses[str(expense_id)] = new_expense
-
-    # Save the updated expenses
-    save_data(file_path, expenses)
-    print_success("New expense added successfully!")
+    # Save the new expense
+    try:
+        expense_id, _ = service.add_expense(expense_id, new_expense)
+    except (ServiceError, StorageError) as e:
+        print_error(f"Expense could not be saved: {e}")
+        return
+    print_success(f"New expense {expense_id} added successfully!")
 
 
 def view_expenses():
-    """Displays all the expenses saved in the expenses.json file."""
-    file_path = "expenses.json"
-    expenses = load_data(file_path)
+    """Displays the expenses, filtered and a page at a time."""
+    service = get_service()
 
-    if not expenses:
+    if not service.repo.expenses:
         print_warning("No expenses found.")
-    else:
-        console.print("\n--- All Expenses ---", style="bold green")
-        for expense_id, details in expenses.items():
-            console.print(f"Expense ID: {expense_id}", style="bold")
-            console.print(f"Trip ID: {details['trip_id']}")
-            console.print(f"Amount: {details['amount']}")
-            console.print(f"Category: {details['category']}")
-            console.print(f"Description: {details['description']}\n")
+        return
+
+    trip_id = input("Filter by Trip ID (leave blank for all): ").strip()
+    category = input(
+        "Filter by category (leave blank for all): "
+    ).strip().lower()
+
+    rows = (
+        (
+            expense_id, details['trip_id'],
+            f"{details['amount']} {details.get('currency', '')}".strip(),
+            details['category'], details.get('date', ''),
+            details['description']
+        )
+        for expense_id, details in service.list_expenses(trip_id, category)
+    )
+    show_paginated(
+        "All Expenses",
+        [
+            "Expense ID", "Trip ID", "Amount", "Category", "Date",
+            "Description"
+        ],
+        rows
+    )
 
 
 def edit_expense():
     """Edits an existing expense in the expenses.json file."""
-    file_path = "expenses.json"
-    expenses = load_data(file_path)
+    service = get_service()
+    expenses = service.repo.expenses
 
     expense_id = input("Enter the Expense ID to edit: ").strip()
 
@@ -684,6 +923,8 @@ def edit_expense():
             "Editing expense details. Leave blank to keep the current value.",
             style="bold yellow"
         )
+        # Saving is refused if another session changes it meanwhile
+        expense = expenses[expense_id]
         trip_id = input(
             f"Enter new Trip ID (current: {expenses[expense_id]['trip_id']}): "
         ).strip() or expenses[expense_id]['trip_id']
@@ -694,6 +935,8 @@ def edit_expense():
         if amount:
             try:
                 amount = float(amount)
+                if not math.isfinite(amount):
+                    raise ValueError(amount)
             except ValueError:
                 print_error("Invalid input. Keeping the current amount.")
                 amount = expenses[expense_id]['amount']
@@ -708,14 +951,32 @@ def edit_expense():
             f"Enter descrip (current: {expenses[expense_id]['description']}): "
         ).strip() or expenses[expense_id]['description']
 
-        expenses[expense_id] = {
-            "trip_id": trip_id,
-            "amount": amount,
-            "category": category,
-            "description": description
-        }
+        # "-" clears the date, as expenses need not have one
+        date = input(
+            f"Enter date, or - for none (current: {expense.get('date', '')}): "
+        ).strip() or expense.get('date', '')
+        if date == "-":
+            date = ""
+
+        currency = input(
+            f"Enter currency, or - for the trip's "
+            f"(current: {expense.get('currency', '')}): "
+        ).strip() or expense.get('currency', '')
+        if currency == "-":
+            currency = ""
 
-        save_data(file_path, expenses)
+        try:
+            service.update_expense(expense_id, {
+                "trip_id": trip_id,
+                "amount": amount,
+                "category": category,
+                "description": description,
+                "date": date,
+                "currency": currency
+            }, expected=expense)
+        except (ServiceError, StorageError) as e:
+            print_error(f"Expense could not be updated: {e}")
+            return
         print_success("Expense updated successfully!")
     else:
         print_error("Expense ID not found.")
@@ -723,14 +984,17 @@ def edit_expense():
 
 def delete_expense():
     """Deletes an expense from the expenses.json file."""
-    file_path = "expenses.json"
-    expenses = load_data(file_path)
+    service = get_service()
+    expenses = service.repo.expenses
 
     expense_id = input("Enter the Expense ID to delete: ").strip()
 
     if expense_id in expenses:
-        del expenses[expense_id]
-        save_data(file_path, expenses)
+        try:
+            service.delete_expense(expense_id)
+        except (ServiceError, StorageError) as e:
+            print_error(f"Expense could not be deleted: {e}")
+            return
         print_success("Expense deleted successfully!")
     else:
         print_error("Expense ID not found.")
@@ -740,96 +1004,27 @@ def delete_expense():
 def show_summary():
     """Displays a detailed summary of all trips."""
     try:
-        # Load the JSON data into DataFrames
-        trips_df = pd.read_json('trips.json').T
-        itinerary_df = pd.read_json('itinerary.json').T
-        expenses_df = pd.read_json('expenses.json').T
+        service = get_service()
+        trips = service.repo.trips
+        itinerary = service.repo.itinerary
+        expenses = service.repo.expenses
 
-        # Check if the dataframes are empty
-        if trips_df.empty:
+        # Check if there is anything to summarise
+        if not trips:
             print_warning("No trips found.")
             return
-        if itinerary_df.empty:
+        if not itinerary:
             print_warning("No itinerary data found.")
-        if expenses_df.empty:
+        if not expenses:
             print_warning("No expenses data found.")
 
-        # Convert trip_id to string in all DataFrames to match the type
-        trips_df.index = trips_df.index.astype(str)
-        itinerary_df['trip_id'] = itinerary_df['trip_id'].astype(str)
-        expenses_df['trip_id'] = expenses_df['trip_id'].astype(str)
+        # Only trips changed since it was last shown are worked out again
+        summary = service.summary()
 
-        # Merge the DataFrames
-        merged_df = pd.merge(
-            trips_df, itinerary_df, left_index=True, right_on='trip_id',
-            how='left'
-        )
-        final_df = pd.merge(merged_df, expenses_df, on='trip_id', how='left')
-
-        # Rename columns for clarity
-        final_df.rename(columns={
-            'trip_id': 'Trip ID',
-            'destination': 'Destination',
-            'start_date': 'Start Date',
-            'end_date': 'End Date',
-            'date': 'Activity Date',
-            'activity': 'Activity',
-            'amount': 'Expense Amount',
-            'category': 'Expense Category',
-            'description': 'Expense Description'
-        }, inplace=True)
-
-        # Convert 'Expense Amount' to numeric to enable calculations
-        final_df['Expense Amount'] = pd.to_numeric(
-            final_df['Expense Amount'], errors='coerce'
-        )
-
-        # Display the summary in a vertical format
+        # Display the summary in a vertical format, one write per trip
         print("\n--- Trip Summary ---")
-        for trip_id, trip_data in trips_df.iterrows():
-            print("\n------------------------------")
-            print(f"Trip ID: {trip_id}")
-            print(f"Destination: {trip_data['destination']}")
-            print(f"Start Date: {trip_data['start_date']}")
-            print(f"End Date: {trip_data['end_date']}")
-            print(f"Budget: {trip_data.get('budget', 'N/A')}")
-
-            # Filter expenses and activities for the current trip
-            trip_expenses = final_df[final_df['Trip ID'] == trip_id]
-
-            # Calculate total expenses for the trip
-            total_expenses = trip_expenses['Expense Amount'].sum()
-            print(f"Total Expenses: {total_expenses}")
-
-            # Compare total expenses with the budget
-            budget = trip_data.get('budget')
-            if pd.notna(budget):
-                try:
-                    remaining_budget = float(budget) - total_expenses
-                    print(f"Remaining Budget: {remaining_budget}")
-                except ValueError:
-                    print_error("Invalid budget format.")
-            else:
-                print("Budget: N/A")
-
-            # Display each expense and activity
-            if trip_expenses.empty:
-                print_warning("No itinerary or expenses for this trip.")
-            else:
-                for _, row in trip_expenses.iterrows():
-                    print("\nActivity Date: ", row['Activity Date'] if
-                          pd.notna(row['Activity Date']) else 'N/A')
-                    print("Activity: ", row['Activity'] if
-                          pd.notna(row['Activity']) else 'N/A')
-                    print("Expense Amount: ", row['Expense Amount'] if
-                          pd.notna(row['Expense Amount']) else 'N/A')
-                    print("Expense Category: ", row['Expense Category'] if
-                          pd.notna(row['Expense Category']) else 'N/A')
-                    print("Expense Description: ",
-                          row['Expense Description'] if
-                          pd.notna(row['Expense Description']) else 'N/A')
-
-            print("------------------------------")
+        for _, result in summary:
+            print(result.block)
 
         print("\n")
         print_success("Summary displayed successfully!")
@@ -838,5 +1033,155 @@ def show_summary():
         print_error(f"An error occurred while displaying the summary: {e}")
 
 
-if __name__ == "__main__":
+# Search
+# Matches listed, best first
+MAX_SEARCH_RESULTS = 100
+
+
+def search_result_row(collection, record_id, record):
+    """Returns the table row of a search result."""
+    if collection == TRIPS:
+        return (
+            "Trip", record_id, record_id,
+            f"{record['start_date']} to {record['end_date']}",
+            record['destination']
+        )
+    if collection == ITINERARY:
+        return (
+            "Itinerary", record_id, record['trip_id'], record['date'],
+            record['activity']
+        )
+    return (
+        "Expense", record_id, record['trip_id'], "",
+        f"{record['amount']:.2f} {record['category']}: "
+        f"{record['description']}"
+    )
+
+
+def search_records():
+    """Finds trips, itinerary entries and expenses by their words."""
+    service = get_service()
+    query = input("Search for (e.g. museum, taxi lisbon): ").strip()
+    if not query:
+        print_error("Please enter something to search for.")
+        return
+    results = service.search(query, MAX_SEARCH_RESULTS)
+    if len(results) == MAX_SEARCH_RESULTS:
+        print_warning(f"Showing the best {MAX_SEARCH_RESULTS} matches.")
+    show_paginated(
+        f"Search results for {query}",
+        ["Type", "ID", "Trip ID", "Date", "Details"],
+        (search_result_row(*result) for result in results)
+    )
+
+
+# Analytics
+# Trips listed by spending, biggest first
+MAX_TOP_TRIPS = 10
+
+
+def show_analytics():
+    """Shows spending by category, trip and day, for a trip or all."""
+    service = get_service()
+    trip_id = input("Trip ID (leave blank for all trips): ").strip()
+    category = input("Category (leave blank for all): ").strip()
+    try:
+        total, count = service.spend_total(trip_id, category)
+        left_out = service.spend_left_out(trip_id, category)
+        by_category = service.spend_by("category", trip_id, category)
+        by_trip = service.spend_by("trip", trip_id, category)
+        by_day = service.spend_by("day", trip_id, category)
+    except ServiceError as e:
+        print_error(str(e))
+        return
+    if left_out:
+        print_warning(
+            f"{left_out} expense(s) left out: no exchange rate to "
+            f"{DEFAULT_CURRENCY}. Add one to the rate table to count them."
+        )
+    if not count:
+        print_warning("No matching expenses found.")
+        return
+    console.print(
+        f"Total spent: {total:.2f} {DEFAULT_CURRENCY} over {count} "
+        "expense(s)", style="bold"
+    )
+
+    table = Table(title="Spending by Category")
+    for column in ("Category", "Amount", "Expenses", "Share"):
+        table.add_column(column)
+    for key, amount, expenses in by_category:
+        table.add_row(
+            key, f"{amount:.2f} {DEFAULT_CURRENCY}", str(expenses),
+            f"{amount / total:.1%}" if total else "-"
+        )
+    console.print(table)
+
+    if not trip_id:
+        trips = service.repo.trips
+        table = Table(title=f"Top {MAX_TOP_TRIPS} Trips by Spending")
+        for column in ("Trip ID", "Destination", "Amount", "Expenses"):
+            table.add_column(column)
+        for key, amount, expenses in by_trip[:MAX_TOP_TRIPS]:
+            table.add_row(
+                key, trips.get(key, {}).get("destination", "-"),
+                f"{amount:.2f} {DEFAULT_CURRENCY}", str(expenses)
+            )
+        console.print(table)
+
+    show_paginated(
+        "Spending by Day",
+        ["Date", "Amount", "Expenses"],
+        (
+            (day or "No date", f"{amount:.2f} {DEFAULT_CURRENCY}", expenses)
+            for day, amount, expenses in by_day
+        )
+    )
+
+
+def main():
+    """Shows the heading and instructions, then runs the main menu."""
+    # Call the function to display heading
+    display_heading()
+    # Call the function to display the instructions
+    show_instructions()
+    choose_workspace()
     main_menu()
+
+
+def start():
+    """Runs an interactive session; returns its exit status."""
+    try:
+        main()
+    except StorageError as e:
+        # e.g. no tenant given while the data is split by tenant
+        print_error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        if len(sys.argv) > 1 and sys.argv[1] == "import":
+            from importer import import_command
+            sys.exit(import_command(sys.argv[2:]))
+        if len(sys.argv) > 1 and sys.argv[1] == "check-ledger":
+            from ledger import check_command
+            sys.exit(check_command(sys.argv[2:]))
+        if len(sys.argv) > 1 and sys.argv[1] == "export":
+            from codec import export_command
+            sys.exit(export_command(sys.argv[2:]))
+        if len(sys.argv) > 1 and sys.argv[1] == "check":
+            from integrity import check_command as integrity_command
+            sys.exit(integrity_command(sys.argv[2:]))
+        if len(sys.argv) > 1 and sys.argv[1] == "vacuum":
+            from vacuum import vacuum_command
+            sys.exit(vacuum_command(sys.argv[2:]))
+        if len(sys.argv) > 1 and sys.argv[1] == "tenants":
+            from tenants import tenants_command
+            sys.exit(tenants_command(sys.argv[2:]))
+    except StorageError as e:
+        # e.g. no tenant given while the data is split by tenant
+        print_error(str(e))
+        sys.exit(1)
+    sys.exit(start())
@@ -0,0 +1,474 @@
+"""Full-text index of the trips, itinerary entries and expenses.
+
+Every record is a document made of the words of its text fields (see
+SEARCH_FIELDS in repository.py). Words are lowercased, with accents
+dropped, so "Zürich" is found as "zurich". Each word has the postings of
+the documents holding it, and the words are kept sorted, so a query word
+of three letters or more also finds the words it starts ("mus" finds
+"museum").
+
+A query word matches a record when it is found in the record itself, in
+the destination of its trip, or is the name of its collection, so "taxi
+expenses in lisbon" finds the taxi expenses of the trips to Lisbon.
+Records matching more of the query words come first, then those whose
+matches are rarer (words in fewer documents weigh more); a whole word
+counts more than a prefix, and a word of the record itself more than
+one of its trip.
+
+The postings are held in numpy arrays, one sorted run for every word,
+built in one pass over all the texts. Records changed afterwards get a
+new document with its postings in small arrays on the side, and their
+old document is marked dead; both are folded into the arrays when the
+index is saved, or once the dead documents outnumber the live ones.
+Queries are a few numpy passes over the documents.
+
+The index is saved as a .npz file next to the data, together with the
+store's sync points it is up to date with (see storage.py); a later
+session loads it and replays only the changes stored since.
+"""
+import os
+import re
+import sys
+import unicodedata
+import zipfile
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+import codec
+from columnar import Interner
+
+FORMAT_VERSION = 1
+WORD = re.compile(r"\w+")
+# Words, and the breaks between texts indexed together
+WORD_OR_BREAK = re.compile(r"\w+|\0")
+
+# Shorter query words only match whole words
+MIN_PREFIX = 3
+# Score of a prefix match, a match in the trip and a collection name,
+# against a word of the record itself
+PREFIX_WEIGHT = 0.5
+TRIP_WEIGHT = 0.5
+COLLECTION_WEIGHT = 0.1
+
+# Dead documents kept before folding, whatever the share
+MIN_FOLD = 1024
+
+
+@lru_cache(maxsize=None)
+def _accents():
+    """Returns a str.translate() table dropping combining characters."""
+    return {
+        code: None for code in range(sys.maxunicode + 1)
+        if unicodedata.combining(chr(code))
+    }
+
+
+def fold(text):
+    """Returns a text lowercased and without accents."""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFKD", text).translate(_accents())
+
+
+def words(text):
+    """Returns the words of a text, as they are indexed."""
+    return WORD.findall(fold(str(text)))
+
+
+def record_text(record, fields):
+    """Returns the text of a record's fields, for indexing."""
+    return " ".join(
+        str(record[field]) for field in fields
+        if record.get(field) is not None
+    )
+
+
+def _tokens(texts):
+    """Returns (words, word codes, documents) of the words of texts.
+
+    The codes index the words; documents are positions in texts.
+    """
+    import numpy as np
+
+    joined = "\0".join(texts)
+    if joined.count("\0") != max(len(texts) - 1, 0):
+        joined = "\0".join(text.replace("\0", " ") for text in texts)
+    tokens = WORD_OR_BREAK.findall(fold(joined))
+    found = list(dict.fromkeys(tokens))
+    codes = dict(zip(found, range(len(found))))
+    token_codes = np.fromiter(
+        map(codes.__getitem__, tokens), dtype=np.int64, count=len(tokens)
+    )
+    breaks = token_codes == codes.get("\0", -1)
+    docs = np.cumsum(breaks)
+    return found, token_codes[~breaks], docs[~breaks]
+
+
+class SearchIndex:
+    """Words of the records of some collections, keyed by collection."""
+
+    def __init__(self, fields, trip_collection):
+        self.fields = fields  # collection -> text fields
+        self.trip_collection = trip_collection
+        self.collections = list(fields)
+        # Postings folded into arrays: the documents of self.words[i]
+        # are docs[starts[i]:starts[i + 1]]
+        self.words = []
+        self.starts = self.docs = None
+        # Postings added since, by word
+        self.added = {}
+        self.added_words = []  # sorted
+        self.doc_of = {}  # (collection code, record ID) -> document
+        self.doc_ids = []  # document -> record ID
+        self.live = bytearray()  # document -> 1, or 0 once dead
+        self.doc_collections = array("b")
+        self.doc_trips = array("q")  # trip code + 1, 0 for none
+        self.trip_ids = Interner()
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.doc_of)
+
+    # --- Changes ---
+    def _document(self, code, record_id, trip_id):
+        """Appends a live document for a record; returns its number."""
+        doc = self.doc_of.pop((code, record_id), None)
+        if doc is not None:
+            self.live[doc] = 0
+            self.dead += 1
+        doc = len(self.doc_ids)
+        self.doc_of[code, record_id] = doc
+        self.doc_ids.append(record_id)
+        self.live.append(1)
+        self.doc_collections.append(code)
+        self.doc_trips.append(
+            0 if trip_id is None else self.trip_ids.code(str(trip_id)) + 1
+        )
+        return doc
+
+    def put(self, collection, record_id, record):
+        """Indexes a record, replacing what it had."""
+        trip_id = (
+            record_id if collection == self.trip_collection
+            else record.get("trip_id")
+        )
+        doc = self._document(
+            self.collections.index(collection), record_id, trip_id
+        )
+        for word in set(words(record_text(record, self.fields[collection]))):
+            postings = self.added.get(word)
+            if postings is None:
+                postings = self.added[word] = array("q")
+                insort(self.added_words, word)
+            postings.append(doc)
+        if self.dead > max(MIN_FOLD, len(self.doc_of)):
+            self._fold()
+
+    def discard(self, collection, record_id):
+        """Drops a record from the index."""
+        doc = self.doc_of.pop(
+            (self.collections.index(collection), record_id), None
+        )
+        if doc is not None:
+            self.live[doc] = 0
+            self.dead += 1
+
+    def build(self, rows):
+        """Indexes many records in one pass.
+
+        rows maps collections to iterables of (record ID, trip ID, text)
+        for their records, the text being the record_text().
+        """
+        first = len(self.doc_ids)
+        texts = []
+        for collection, collection_rows in rows.items():
+            code = self.collections.index(collection)
+            record_ids, trip_codes = [], []
+            for record_id, trip_id, text in collection_rows:
+                record_ids.append(record_id)
+                trip_codes.append(
+                    0 if trip_id is None
+                    else self.trip_ids.code(str(trip_id)) + 1
+                )
+                texts.append(text)
+            for record_id in record_ids:
+                self.discard(collection, record_id)
+            self.doc_of.update(zip(
+                zip([code] * len(record_ids), record_ids),
+                range(len(self.doc_ids), len(self.doc_ids) + len(record_ids))
+            ))
+            self.doc_ids += record_ids
+            self.live += b"\1" * len(record_ids)
+            self.doc_collections += array("b", [code]) * len(record_ids)
+            self.doc_trips += array("q", trip_codes)
+        found, word_codes, docs = _tokens(texts)
+        self._fold(found, word_codes, docs + first)
+
+    def _fold(self, new_words=(), word_codes=None, docs=None):
+        """Folds the added postings, and any given, into the arrays.
+
+        Dead documents are dropped and the others renumbered.
+        """
+        import numpy as np
+
+        # (word, document) pairs, words as positions in all_words
+        all_words = list(self.words)
+        pair_words, pair_docs = [], []
+        if self.starts is not None:
+            pair_words.append(np.repeat(
+                np.arange(len(self.words)), np.diff(self.starts)
+            ))
+            pair_docs.append(self.docs)
+        if self.added:
+            pair_words.append(np.repeat(
+                np.arange(len(all_words), len(all_words) + len(self.added)),
+                [len(postings) for postings in self.added.values()]
+            ))
+            pair_docs += [
+                np.frombuffer(postings, dtype=np.int64)
+                for postings in self.added.values()
+            ]
+            all_words += self.added
+        if word_codes is not None:
+            pair_words.append(word_codes + len(all_words))
+            pair_docs.append(docs)
+            all_words += new_words
+        sorted_words = sorted(set(all_words))
+        rank = {word: position for position, word in enumerate(sorted_words)}
+        word_ranks = np.fromiter(
+            (rank[word] for word in all_words), dtype=np.int64,
+            count=len(all_words)
+        )
+        pair_words = word_ranks[np.concatenate(pair_words or [[]]).astype(
+            np.int64
+        )]
+        pair_docs = np.concatenate(pair_docs or [[]]).astype(np.int64)
+
+        live = self._live()
+        keep = live[pair_docs]
+        new_doc = np.cumsum(live) - 1
+        documents = max(int(live.sum()), 1)
+        # Sorted by word, then document, without repeats
+        keys = np.unique(
+            pair_words[keep] * documents + new_doc[pair_docs[keep]]
+        )
+        counts = np.bincount(keys // documents, minlength=len(sorted_words))
+        used = counts > 0
+        self.words = [
+            word for word, found in zip(sorted_words, used.tolist()) if found
+        ]
+        self.starts = np.concatenate(([0], np.cumsum(counts[used])))
+        self.docs = keys % documents
+        self.added, self.added_words = {}, []
+        if self.dead:
+            self.doc_ids = np.array(self.doc_ids, dtype=object)[live].tolist()
+            self.doc_collections = array("b", np.frombuffer(
+                self.doc_collections, dtype=np.int8
+            )[live].tobytes())
+            self.doc_trips = array("q", np.frombuffer(
+                self.doc_trips, dtype=np.int64
+            )[live].tobytes())
+            self._index_documents()
+
+    def _index_documents(self):
+        """Marks every document live and maps records to them."""
+        self.live = bytearray(b"\1" * len(self.doc_ids))
+        self.doc_of = {
+            key: doc for doc, key in enumerate(
+                zip(self.doc_collections, self.doc_ids)
+            )
+        }
+        self.dead = 0
+
+    # --- Queries ---
+    def _live(self):
+        import numpy as np
+
+        return np.frombuffer(self.live, dtype=np.bool_)
+
+    def _word_range(self, sorted_words, query_word):
+        """Returns the positions of the words a query word matches."""
+        first = bisect_left(sorted_words, query_word)
+        if len(query_word) < MIN_PREFIX:
+            return first, first + (
+                sorted_words[first:first + 1] == [query_word]
+            )
+        # Every word with the prefix sorts before this one
+        after = query_word[:-1] + chr(ord(query_word[-1]) + 1)
+        return first, bisect_left(sorted_words, after)
+
+    def _postings(self, query_word):
+        """Returns (documents, weights) of the words a query word matches."""
+        import numpy as np
+
+        documents = max(len(self.doc_of), 1)
+        found_docs, found_weights = [], []
+
+        def add(docs, counts, frequencies, whole):
+            # counts are the postings of each word in docs; rarer words
+            # weigh more, and whole is True for the query word itself
+            weights = np.log1p(documents / frequencies) * np.where(
+                whole, 1.0, PREFIX_WEIGHT
+            )
+            found_docs.append(docs)
+            found_weights.append(np.repeat(weights, counts))
+
+        first, last = self._word_range(self.words, query_word)
+        if last > first:
+            counts = np.diff(self.starts[first:last + 1])
+            add(
+                self.docs[self.starts[first]:self.starts[last]], counts,
+                counts, np.array(self.words[first:last]) == query_word
+            )
+        first, last = self._word_range(self.added_words, query_word)
+        for word in self.added_words[first:last]:
+            docs = np.frombuffer(self.added[word], dtype=np.int64)
+            position = bisect_left(self.words, word)
+            folded = 0
+            if self.words[position:position + 1] == [word]:
+                folded = self.starts[position + 1] - self.starts[position]
+            add(docs, len(docs), len(docs) + folded, word == query_word)
+        if not found_docs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(found_docs), np.concatenate(found_weights)
+
+    def _scores(self, query_word, live):
+        """Returns the score of every document for one query word."""
+        import numpy as np
+
+        collections = np.frombuffer(self.doc_collections, dtype=np.int8)
+        trips = np.frombuffer(self.doc_trips, dtype=np.int64)
+        scores = np.zeros(len(self.doc_ids))
+        docs, weights = self._postings(query_word)
+        if len(docs):
+            np.maximum.at(scores, docs, weights)
+            # A match in a trip counts, less, for everything of the trip
+            trip_docs = np.flatnonzero(
+                (scores > 0) & live & (
+                    collections
+                    == self.collections.index(self.trip_collection)
+                )
+            )
+            by_trip = np.zeros(len(self.trip_ids) + 1)
+            by_trip[trips[trip_docs]] = scores[trip_docs]
+            scores = np.maximum(scores, TRIP_WEIGHT * by_trip[trips])
+        for code, collection in enumerate(self.collections):
+            if len(query_word) >= MIN_PREFIX and (
+                collection.startswith(query_word)
+                or query_word.startswith(collection.rstrip("s"))
+            ):
+                scores[collections == code] += COLLECTION_WEIGHT
+        return scores
+
+    def search(self, query, limit=None):
+        """Returns (collection, record ID) pairs matching a query, best first.
+
+        Records matching more of the query's words come first; records
+        ranked the same come in the order they were indexed.
+        """
+        import numpy as np
+
+        query_words = list(dict.fromkeys(words(query)))
+        if not query_words or not self.doc_of:
+            return []
+        live = self._live()
+        matches = np.zeros(len(self.doc_ids), dtype=np.int64)
+        total = np.zeros(len(self.doc_ids))
+        for query_word in query_words:
+            scores = self._scores(query_word, live)
+            matches += scores > 0
+            total += scores
+        found = np.flatnonzero((matches > 0) & live)
+        if limit is not None and limit < len(found):
+            # Only records matching as many query words as the limit-th
+            # best can be among the best
+            at_least = np.bincount(matches[found])[::-1].cumsum()[::-1]
+            fewest = np.flatnonzero(at_least >= limit)[-1]
+            found = found[matches[found] >= fewest]
+        # No score adds up to a whole extra query word matched
+        rank = matches[found] * (total.max() + 1) + total[found]
+        if limit is not None and limit < len(found):
+            # The best, and of the ones ranked as the last of those, the
+            # first indexed
+            cutoff = np.partition(rank, len(rank) - limit)[len(rank) - limit]
+            better = rank > cutoff
+            tied = np.flatnonzero(rank == cutoff)[:limit - better.sum()]
+            better[tied] = True
+            found, rank = found[better], rank[better]
+        found = found[np.argsort(-rank, kind="stable")]
+        return [
+            (self.collections[self.doc_collections[doc]], self.doc_ids[doc])
+            for doc in found.tolist()
+        ]
+
+    # --- Saving ---
+    def save(self, path, points):
+        """Writes the index with the sync points it is up to date with."""
+        import numpy as np
+
+        if self.starts is None or self.added or self.dead:
+            self._fold()
+        meta = {
+            "version": FORMAT_VERSION, "fields": self.fields,
+            "trip_collection": self.trip_collection, "points": points,
+        }
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(
+                file,
+                meta=np.frombuffer(codec.dumps(meta), dtype=np.uint8),
+                words=np.frombuffer(
+                    "\n".join(self.words).encode("utf-8"), dtype=np.uint8
+                ),
+                starts=self.starts,
+                docs=self.docs,
+                doc_ids=np.frombuffer(
+                    codec.dumps(self.doc_ids), dtype=np.uint8
+                ),
+                doc_collections=np.frombuffer(
+                    self.doc_collections, dtype=np.int8
+                ),
+                doc_trips=np.frombuffer(self.doc_trips, dtype=np.int64),
+                trip_ids=np.frombuffer(
+                    codec.dumps(self.trip_ids.values), dtype=np.uint8
+                ),
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, fields, trip_collection):
+        """Returns (index, sync points) saved at path.
+
+        Returns None if there is no index of these fields there.
+        """
+        import numpy as np
+
+        index = cls(fields, trip_collection)
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                meta = codec.loads(saved["meta"].tobytes())
+                if meta["version"] != FORMAT_VERSION or (
+                    meta["fields"], meta["trip_collection"]
+                ) != (
+                    {name: list(value) for name, value in fields.items()},
+                    trip_collection
+                ):
+                    return None
+                text = saved["words"].tobytes().decode("utf-8")
+                index.words = text.split("\n") if text else []
+                index.starts = saved["starts"]
+                index.docs = saved["docs"]
+                index.doc_ids = codec.loads(saved["doc_ids"].tobytes())
+                index.doc_collections = array(
+                    "b", saved["doc_collections"].tobytes()
+                )
+                index.doc_trips = array("q", saved["doc_trips"].tobytes())
+                for trip_id in codec.loads(saved["trip_ids"].tobytes()):
+                    index.trip_ids.code(trip_id)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Missing, or not a complete index file
+            return None
+        index._index_documents()
+        return index, meta["points"]
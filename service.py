@@ -0,0 +1,473 @@
+"""Trip, itinerary, expense and summary operations.
+
+This is the core every front end goes through: the menus in run.py, the
+bulk importer and the JSON API (api_server.py). It checks input with the
+planner's rules, reads and writes through a Repository and hands back
+plain records, raising ServiceError for invalid requests and
+NotFoundError for unknown IDs. Nothing here prompts or prints.
+"""
+import math
+from datetime import datetime
+
+from columnar import from_cents, to_cents, to_day
+from currency import DEFAULT_CURRENCY, LATEST, currency_code, rates_path
+from ledger import category_key
+from repository import (
+    CURRENT, EXPENSES, ITINERARY, TRIPS, get_repository
+)
+from spend_cube import ALL, DIMENSIONS
+from validation import validate_date, validate_budget, validate_date_format
+
+
+class ServiceError(ValueError):
+    """Raised when a request breaks one of the planner's rules."""
+
+
+class NotFoundError(ServiceError):
+    """Raised when a request names a record that does not exist."""
+
+
+# --- Checks shared with the importer ---
+def text_field(row, field):
+    """Returns a stripped text field of a row, or '' if missing."""
+    value = row.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def parse_date(date_str):
+    """Parses a YYYY-MM-DD string, returning None if it is invalid."""
+    try:
+        return datetime.strptime(str(date_str), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def in_range(date_str, start=None, end=None):
+    """Checks if a date string falls inside an optional date range."""
+    if start is None and end is None:
+        return True
+    date = parse_date(date_str)
+    return (
+        date is not None
+        and (start is None or date >= start)
+        and (end is None or date <= end)
+    )
+
+
+def check_id(record_id, *taken):
+    """Returns a new record ID after checking it is a positive number.
+
+    taken are the collections (or batches) the ID must not be in yet.
+    """
+    record_id = str(record_id).strip()
+    if not record_id.isdigit() or int(record_id) <= 0:
+        raise ServiceError("Invalid ID. Must be a positive number.")
+    if any(record_id in records for records in taken):
+        raise ServiceError("ID already exists.")
+    return record_id
+
+
+def _currency(row):
+    """Returns the row's currency code, None if blank."""
+    currency = text_field(row, "currency")
+    if not currency:
+        return None
+    code = currency_code(currency)
+    if code is None:
+        raise ServiceError(
+            "Invalid currency. Enter a three-letter code such as EUR."
+        )
+    return code
+
+
+def _trip(row, trips):
+    """Returns the row's trip ID and trip after checking it exists."""
+    trip_id = text_field(row, "trip_id")
+    if trip_id not in trips:
+        raise ServiceError(f"Trip ID {trip_id!r} not found.")
+    return trip_id, trips[trip_id]
+
+
+def check_trip(row):
+    """Validates the fields of a trip and returns the trip."""
+    destination = text_field(row, "destination")
+    start_date = text_field(row, "start_date")
+    end_date = text_field(row, "end_date")
+    budget = text_field(row, "budget")
+    if not destination:
+        raise ServiceError("Destination cannot be empty.")
+    if not validate_date(start_date):
+        raise ServiceError(
+            "Invalid start date. Must be today or a future date."
+        )
+    if not validate_date(end_date):
+        raise ServiceError("Invalid end date. Must be today or a future date.")
+    if parse_date(end_date) < parse_date(start_date):
+        raise ServiceError("End date cannot be earlier than the start date.")
+    if not validate_budget(budget):
+        raise ServiceError("Invalid budget. Please enter a positive number.")
+    trip = {
+        "destination": destination,
+        "start_date": start_date,
+        "end_date": end_date,
+        "budget": budget
+    }
+    currency = _currency(row)
+    if currency:
+        trip["currency"] = currency
+    return trip
+
+
+def _check_within(day, trip):
+    """Checks that a date falls within a trip's dates."""
+    start = parse_date(trip.get("start_date"))
+    end = parse_date(trip.get("end_date"))
+    if start is None or end is None:
+        raise ServiceError(
+            "The trip has invalid dates. Fix them with Edit Trip first."
+        )
+    if not start <= day <= end:
+        raise ServiceError(
+            f"Date must be within the trip duration "
+            f"({trip['start_date']} to {trip['end_date']})."
+        )
+
+
+def check_itinerary_entry(row, trips, previous=None):
+    """Validates the fields of an itinerary entry and returns the entry.
+
+    previous is the entry being edited, if any: keeping its date is
+    allowed even once that date has passed.
+    """
+    trip_id, trip = _trip(row, trips)
+    date = text_field(row, "date")
+    activity = text_field(row, "activity")
+    if not validate_date_format(date):
+        raise ServiceError("Invalid format. Enter the date as YYYY-MM-DD.")
+    itinerary_date = parse_date(date)
+    kept = previous is not None and previous.get("date") == date
+    if not kept:
+        if itinerary_date < datetime.now().date():
+            raise ServiceError("Date cannot be in the past.")
+        _check_within(itinerary_date, trip)
+    if not activity:
+        raise ServiceError("Activity cannot be empty.")
+    return {
+        "trip_id": trip_id,
+        "date": date,
+        "activity": activity
+    }
+
+
+def check_expense(row, trips, previous=None, rates=None):
+    """Validates the fields of an expense and returns the expense.
+
+    The date is optional; if given, it must fall within the trip's dates
+    unless it is the date of previous, the expense being edited. So is
+    the currency, the trip's if not given; with a RateTable as rates,
+    there must be a rate from it to the trip's currency.
+    """
+    trip_id, trip = _trip(row, trips)
+    try:
+        amount = float(text_field(row, "amount"))
+    except ValueError:
+        raise ServiceError("Invalid amount. Please enter a valid number.")
+    if not math.isfinite(amount):
+        raise ServiceError("Invalid amount. Please enter a finite number.")
+    if not amount >= 0:
+        raise ServiceError("Amount must be a non-negative number.")
+    category = text_field(row, "category")
+    description = text_field(row, "description")
+    if not category:
+        raise ServiceError("Category cannot be empty.")
+    if not description:
+        raise ServiceError("Description cannot be empty.")
+    expense = {
+        "trip_id": trip_id,
+        "amount": amount,
+        "category": category,
+        "description": description
+    }
+    date = text_field(row, "date")
+    if date:
+        if not validate_date_format(date):
+            raise ServiceError(
+                "Invalid format. Enter the date as YYYY-MM-DD."
+            )
+        if previous is None or previous.get("date") != date:
+            _check_within(parse_date(date), trip)
+        expense["date"] = parse_date(date).isoformat()
+    currency = _currency(row)
+    if currency:
+        trip_currency = trip.get("currency") or DEFAULT_CURRENCY
+        if rates is not None and rates.factor(
+            currency, trip_currency, to_day(expense.get("date")) or LATEST
+        ) is None:
+            raise ServiceError(
+                f"No exchange rate from {currency} to {trip_currency}; "
+                f"add one to {rates_path()}."
+            )
+        expense["currency"] = currency
+    return expense
+
+
+class PlannerService:
+    """The planner's operations on one repository."""
+
+    def __init__(self, repo):
+        self.repo = repo
+
+    def _get(self, records, record_id, name):
+        record = records.get(record_id)
+        if record is None:
+            raise NotFoundError(f"{name} ID {record_id!r} not found.")
+        return record
+
+    def _new_id(self, collection, record_id, records):
+        """Returns the ID for a new record: the one given, or the next one.
+
+        IDs are only chosen by hand when given; a blank ID takes the
+        next one from the collection's sequence.
+        """
+        if not str(record_id).strip():
+            return self.repo.new_id(collection)
+        return check_id(record_id, records)
+
+    @staticmethod
+    def _merge(current, changes, expected):
+        """Returns (fields to check, record expected to be stored)."""
+        if expected is CURRENT:
+            expected = current
+        return {**current, **changes}, expected
+
+    # --- Trips ---
+    # expected is the record as the caller read it (None for a new one);
+    # the change is refused with ConflictError if it has changed since.
+    def list_trips(self, start=None, end=None):
+        """Yields (trip ID, trip) for the trips with a day in a range.
+
+        With a range, trips come in order of their start dates.
+        """
+        trips = self.repo.trips
+        if start is None and end is None:
+            yield from trips.items()
+            return
+        for trip_id in self.repo.calendar.overlapping(start, end):
+            yield trip_id, trips[trip_id]
+
+    def overlapping_trips(self, start_date, end_date, trip_id=None):
+        """Returns (trip ID, trip) for the other trips sharing a day.
+
+        start_date and end_date are YYYY-MM-DD strings; trip_id is the
+        trip being edited, left out of the result.
+        """
+        start, end = parse_date(start_date), parse_date(end_date)
+        if start is None or end is None:
+            return []
+        return [
+            (other_id, trip) for other_id, trip in self.list_trips(start, end)
+            if other_id != trip_id
+        ]
+
+    def get_trip(self, trip_id):
+        """Returns a trip."""
+        return self._get(self.repo.trips, trip_id, "Trip")
+
+    def add_trip(self, trip_id, fields):
+        """Adds a trip; returns (ID, trip)."""
+        trip = check_trip(fields)
+        trip_id = self._new_id(TRIPS, trip_id, self.repo.trips)
+        self.repo.save_trip(trip_id, trip, expected=None)
+        return trip_id, trip
+
+    def update_trip(self, trip_id, changes, expected=CURRENT):
+        """Changes some fields of a trip; returns the new trip."""
+        fields, expected = self._merge(
+            self.get_trip(trip_id), changes, expected
+        )
+        trip = check_trip(fields)
+        self.repo.save_trip(trip_id, trip, expected=expected)
+        return trip
+
+    def delete_trip(self, trip_id, expected=CURRENT):
+        """Deletes a trip with its itinerary entries and expenses."""
+        self.get_trip(trip_id)
+        self.repo.delete_trip(trip_id, expected=expected)
+
+    # --- Itinerary ---
+    def list_itinerary(self, trip_id=None, start=None, end=None):
+        """Yields (itinerary ID, entry), by trip and date if given."""
+        # Use the trip index rather than scanning every entry
+        entries = (
+            self.repo.trip_itinerary(trip_id) if trip_id
+            else self.repo.itinerary
+        )
+        for itinerary_id, entry in entries.items():
+            if in_range(entry["date"], start, end):
+                yield itinerary_id, entry
+
+    def get_itinerary_entry(self, itinerary_id):
+        """Returns an itinerary entry."""
+        return self._get(self.repo.itinerary, itinerary_id, "Itinerary")
+
+    def add_itinerary_entry(self, itinerary_id, fields):
+        """Adds an itinerary entry; returns (ID, entry)."""
+        entry = check_itinerary_entry(fields, self.repo.trips)
+        itinerary_id = self._new_id(
+            ITINERARY, itinerary_id, self.repo.itinerary
+        )
+        self.repo.save_itinerary_entry(itinerary_id, entry, expected=None)
+        return itinerary_id, entry
+
+    def update_itinerary_entry(self, itinerary_id, changes,
+                               expected=CURRENT):
+        """Changes some fields of an itinerary entry; returns the entry."""
+        current = self.get_itinerary_entry(itinerary_id)
+        fields, expected = self._merge(current, changes, expected)
+        entry = check_itinerary_entry(fields, self.repo.trips, current)
+        self.repo.save_itinerary_entry(
+            itinerary_id, entry, expected=expected
+        )
+        return entry
+
+    def delete_itinerary_entry(self, itinerary_id, expected=CURRENT):
+        """Deletes an itinerary entry."""
+        self.get_itinerary_entry(itinerary_id)
+        self.repo.delete_itinerary_entry(itinerary_id, expected=expected)
+
+    # --- Expenses ---
+    def list_expenses(self, trip_id=None, category=None):
+        """Yields (expense ID, expense), by trip and category if given."""
+        # Use the trip index rather than scanning every expense
+        expenses = (
+            self.repo.trip_expenses(trip_id) if trip_id
+            else self.repo.expenses
+        )
+        category = category.lower() if category else None
+        for expense_id, expense in expenses.items():
+            if not category or str(expense["category"]).lower() == category:
+                yield expense_id, expense
+
+    def get_expense(self, expense_id):
+        """Returns an expense."""
+        return self._get(self.repo.expenses, expense_id, "Expense")
+
+    def over_budget(self, trip_id, amount, currency=None):
+        """Checks if spending an amount more would exceed a trip's budget.
+
+        The amount is in the trip's currency unless another is given.
+        """
+        cents = to_cents(amount)
+        if cents is None:
+            raise ServiceError("Invalid amount. Please enter a valid number.")
+        if currency is not None:
+            converted = self.repo.expense_cents({
+                "trip_id": trip_id, "amount": amount, "currency": currency
+            })
+            # Counted as it is when there is no rate, as in the ledger
+            if converted is not None:
+                cents = converted
+        return bool(self.repo.budget_cents(trip_id)) and (
+            cents > self.repo.remaining_budget_cents(trip_id)
+        )
+
+    def add_expense(self, expense_id, fields):
+        """Adds an expense; returns (ID, expense)."""
+        expense = check_expense(
+            fields, self.repo.trips, rates=self.repo.rates
+        )
+        expense_id = self._new_id(EXPENSES, expense_id, self.repo.expenses)
+        self.repo.save_expense(expense_id, expense, expected=None)
+        return expense_id, expense
+
+    def update_expense(self, expense_id, changes, expected=CURRENT):
+        """Changes some fields of an expense; returns the new expense."""
+        current = self.get_expense(expense_id)
+        fields, expected = self._merge(current, changes, expected)
+        expense = check_expense(
+            fields, self.repo.trips, current, self.repo.rates
+        )
+        self.repo.save_expense(expense_id, expense, expected=expected)
+        return expense
+
+    def delete_expense(self, expense_id, expected=CURRENT):
+        """Deletes an expense."""
+        self.get_expense(expense_id)
+        self.repo.delete_expense(expense_id, expected=expected)
+
+    # --- Search ---
+    def search(self, query, limit=None):
+        """Returns (collection, record ID, record) matching a query.
+
+        The best matches come first (see search_index.py).
+        """
+        records = {
+            TRIPS: self.repo.trips,
+            ITINERARY: self.repo.itinerary,
+            EXPENSES: self.repo.expenses,
+        }
+        return [
+            (collection, record_id, records[collection][record_id])
+            for collection, record_id in self.repo.search(query, limit)
+        ]
+
+    # --- Summary ---
+    def summary(self):
+        """Returns (trip ID, TripResult) pairs (see summary.py)."""
+        return self.repo.trip_summaries()
+
+    # --- Analytics ---
+    def _cell(self, trip_id, category):
+        """Returns the cube keys of an optional trip and category."""
+        if trip_id:
+            self.get_trip(trip_id)
+        return (
+            trip_id or ALL, category_key(category) if category else ALL
+        )
+
+    def spend_total(self, trip_id=None, category=None):
+        """Returns (amount, count) of the expenses, filtered if given.
+
+        The amount is in the default currency; expenses that cannot be
+        converted to it are left out (see spend_left_out()).
+        """
+        cents, count = self.repo.spending().total(
+            *self._cell(trip_id, category)
+        )
+        return from_cents(cents), count
+
+    def spend_left_out(self, trip_id=None, category=None):
+        """Returns how many expenses the totals leave out, filtered if given.
+
+        Those are the expenses without a rate to the default currency.
+        """
+        return self.repo.spending().left_out_count(
+            *self._cell(trip_id, category)
+        )
+
+    def spend_by(self, dimension, trip_id=None, category=None):
+        """Returns (key, amount, count) rows of spending over a dimension.
+
+        dimension is "trip" or "category", biggest spending first, or
+        "day", in date order with expenses without a date last.
+        """
+        if dimension not in DIMENSIONS:
+            raise ServiceError(
+                f"Unknown dimension {dimension!r}; use one of "
+                f"{', '.join(DIMENSIONS)}."
+            )
+        cells = self.repo.spending().breakdown(
+            dimension, *self._cell(trip_id, category)
+        )
+        if dimension == "day":
+            order = sorted(cells, key=lambda day: (day is None, day or ""))
+        else:
+            order = sorted(cells, key=lambda key: (-cells[key][0], key))
+        return [
+            (key, from_cents(cells[key][0]), cells[key][1]) for key in order
+        ]
+
+
+def get_service():
+    """Returns the session's service, up to date with other sessions."""
+    return PlannerService(get_repository())
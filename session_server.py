@@ -0,0 +1,230 @@
+"""Warm session server for the web terminal.
+
+Starting ``python3 run.py`` for every websocket connection means every
+user waits for a new interpreter, the rich/pandas imports and the banner
+before the menu shows up. The server does all of that once and keeps a
+small pool of sessions forked from the initialised process, each waiting
+for a terminal.
+
+A client (session_client.py) sends its terminal's file descriptors over
+the server's Unix socket; the server hands them to an idle pooled
+session, which runs the planner on that terminal, and forks a new one to
+take its place. The client gets the session's exit status when it ends,
+and the session is hung up if the client goes away first.
+
+Usage:
+    python3 session_server.py [SOCKET]
+"""
+import io
+import os
+import selectors
+import signal
+import socket
+import sys
+
+from session_client import DEFAULT_SOCKET, decode_header
+
+# Sessions kept forked and waiting for a terminal
+POOL_SIZE = 4
+
+
+def preload():
+    """Imports the planner and everything its sessions need."""
+    import run
+    import summary  # noqa: F401  pandas and numpy, used by the summary
+    banner = run.render_banner()  # Renders and caches it if needed
+    # A first print fills rich's style and markup caches, so sessions
+    # forked afterwards start with them warm
+    run.Console(file=io.StringIO(), force_terminal=True).print(
+        f"\n✈ [bold blue]{banner}[/bold blue] ✈\n", style="bold cyan"
+    )
+    return run
+
+
+def run_session(run, channel):
+    """Waits for a terminal and runs the planner on it; never returns."""
+    code = 1
+    try:
+        message, fds, _, _ = socket.recv_fds(channel, 1 << 20, 3)
+        channel.close()
+        if len(fds) != 3:
+            os._exit(code)
+        cwd, env = decode_header(message)
+
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        # The server's own streams may be block-buffered pipes or logs
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", buffering=1, closefd=False)
+        sys.stderr = open(2, "w", buffering=1, closefd=False)
+        # The console detects the terminal's size and colours when created
+        run.console = run.Console()
+
+        code = run.start()
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except KeyboardInterrupt:
+        code = 128 + signal.SIGINT
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    os._exit(code)
+
+
+class SessionServer:
+    """Accepts clients and hands each one a warm pooled session."""
+
+    def __init__(self, socket_path, pool_size=POOL_SIZE):
+        self.run = preload()
+        self.pool_size = pool_size
+        self.selector = selectors.DefaultSelector()
+        self.idle = {}  # pid -> channel to a session waiting for a client
+        self.sessions = {}  # pid -> connection of the client it serves
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(socket_path)
+        self.listener.listen(64)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+
+        # SIGCHLD wakes up the select loop through this socket pair
+        self.wakeup, self.wakeup_writer = socket.socketpair()
+        self.wakeup.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        signal.set_wakeup_fd(self.wakeup_writer.fileno())
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        self.selector.register(self.wakeup, selectors.EVENT_READ)
+
+        self.fill_pool()
+
+    def fill_pool(self):
+        """Forks sessions until the pool is full."""
+        while len(self.idle) < self.pool_size:
+            self.fork_session()
+
+    def fork_session(self):
+        """Forks a session that waits for a terminal."""
+        channel, child_channel = socket.socketpair()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.setsid()
+            self.selector.close()
+            for sock in (
+                self.listener, self.wakeup, self.wakeup_writer, channel,
+                *self.idle.values(), *self.sessions.values()
+            ):
+                sock.close()
+            run_session(self.run, child_channel)
+        child_channel.close()
+        self.idle[pid] = channel
+
+    def serve_forever(self):
+        """Runs the select loop."""
+        while True:
+            for key, _ in self.selector.select():
+                if key.fileobj is self.listener:
+                    self.accept()
+                elif key.fileobj is self.wakeup:
+                    self.wakeup.recv(4096)
+                    self.reap()
+                elif key.data is None:
+                    self.hand_over(key.fileobj)
+                else:
+                    self.forward(key.fileobj, key.data)
+
+    def accept(self):
+        """Takes a client; its terminal is read once it has arrived.
+
+        Waiting for it here would hold up every other client behind one
+        that is slow to send it.
+        """
+        conn, _ = self.listener.accept()
+        conn.setblocking(False)
+        self.selector.register(conn, selectors.EVENT_READ)
+
+    def hand_over(self, conn):
+        """Passes a client's terminal on to an idle session."""
+        self.selector.unregister(conn)
+        try:
+            message, fds, _, _ = socket.recv_fds(conn, 1 << 20, 3)
+        except OSError:
+            fds = []
+        if not fds:
+            conn.close()  # Gone, or sent no terminal
+            return
+        conn.setblocking(True)
+        if not self.idle:
+            self.fork_session()  # A burst has used up the pool
+        pid, channel = self.idle.popitem()
+        try:
+            socket.send_fds(channel, [message], fds)
+        except OSError:
+            conn.close()  # The session died while idle; reap() collects it
+        else:
+            self.sessions[pid] = conn
+            self.selector.register(conn, selectors.EVENT_READ, pid)
+        finally:
+            channel.close()
+            for fd in fds:
+                os.close(fd)
+        self.fill_pool()
+
+    def forward(self, conn, pid):
+        """Passes a client's signals on, or hangs up on a closed client."""
+        try:
+            data = conn.recv(64)
+        except OSError:
+            data = b""
+        signums = [int(line) for line in data.split()] if data else [
+            signal.SIGHUP
+        ]
+        for signum in signums:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+        if not data:
+            # The connection itself is closed by reap() once the session ends
+            self.selector.unregister(conn)
+
+    def reap(self):
+        """Collects finished sessions and sends their exit status."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.idle:
+                self.idle.pop(pid).close()
+                continue
+            conn = self.sessions.pop(pid, None)
+            if conn is None:
+                continue
+            if conn.fileno() in self.selector.get_map():
+                self.selector.unregister(conn)
+            try:
+                conn.sendall(f"{os.waitstatus_to_exitcode(status)}\n".encode())
+            except OSError:
+                pass
+            conn.close()
+        self.fill_pool()
+
+
+if __name__ == "__main__":
+    SessionServer(
+        sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOCKET
+    ).serve_forever()
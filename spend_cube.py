@@ -0,0 +1,213 @@
+"""Spending rolled up by trip, category and day.
+
+A small OLAP-style cube: every expense adds its amount (in integer
+cents) and a count of one to the cell of its trip, category and day, and
+to the rollups of that cell, in which any of the three is ALL. So the
+eight cells an expense touches answer, by themselves, questions such as
+"food spend per day for trip 3" (the days under trip 3 and food) or
+"top categories across all trips" (the categories under ALL trips and
+ALL days), whatever the number of expenses.
+
+Categories are keyed as in the ledger and the summary (see ledger.py),
+so the totals of each category agree with theirs.
+Expenses without a date count on day None. Amounts are converted to one
+currency (see currency.py), so trips in different currencies add up.
+Expenses the rate table cannot convert are left out of the totals and
+counted in cells of their own, so reports can say how many are missing.
+
+The repository builds the cube from the expense columns in one numpy
+pass the first time it is asked for, then updates it with every expense
+change, made in this session or picked up from another.
+"""
+from datetime import date
+
+from columnar import DELETED, to_cents, to_day
+from ledger import category_key
+
+
+class _All:
+    """The rollup over every trip, category or day."""
+
+    def __repr__(self):
+        return "ALL"
+
+
+ALL = _All()
+DIMENSIONS = ("trip", "category", "day")
+
+
+def _roll_up(cells, codes, names, cents):
+    """Fills cells with every rollup of some expenses, with numpy.
+
+    codes are the expenses' trip, category and day codes into names,
+    whose code 0 stands for ALL.
+    """
+    import numpy as np
+
+    sizes = [len(values) for values in names]
+    for rolled in range(8):
+        keys = np.zeros(len(cents), dtype=np.int64)
+        for dimension in range(3):
+            keys *= sizes[dimension]
+            if not rolled & (4 >> dimension):
+                keys += codes[dimension] + 1
+        found, inverse = np.unique(keys, return_inverse=True)
+        totals = np.bincount(inverse, weights=cents).astype(np.int64)
+        counts = np.bincount(inverse)
+        found, day_codes = np.divmod(found, sizes[2])
+        trip_codes, category_codes = np.divmod(found, sizes[1])
+        for trip_id, category, day, total, count in zip(
+            names[0][trip_codes].tolist(),
+            names[1][category_codes].tolist(),
+            names[2][day_codes].tolist(),
+            totals.tolist(), counts.tolist()
+        ):
+            cells.setdefault(trip_id, {}).setdefault(
+                category, {}
+            )[day] = (total, count)
+
+
+class SpendCube:
+    """Cells of (cents, count) keyed by trip ID, category and day.
+
+    cells[trip][category][day] is the cell, any key of which may be ALL.
+    Days are YYYY-MM-DD strings, or None for expenses without a date.
+    left_out holds the same cells for the expenses left unconverted for
+    want of a rate, with their amounts in their own currencies.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.left_out = {}
+
+    @staticmethod
+    def _add(cells, trip_id, category, day, cents, count):
+        """Adds to a cell and every rollup of it."""
+        for trip_key in (trip_id, ALL):
+            by_category = cells.setdefault(trip_key, {})
+            for category_of in (category, ALL):
+                by_day = by_category.setdefault(category_of, {})
+                for day_key in (day, ALL):
+                    cell_cents, cell_count = by_day.get(day_key, (0, 0))
+                    if cell_count + count:
+                        by_day[day_key] = (
+                            cell_cents + cents, cell_count + count
+                        )
+                    else:
+                        by_day.pop(day_key, None)
+                if not by_day:
+                    del by_category[category_of]
+            if not by_category:
+                del cells[trip_key]
+
+    def add_expense(self, expense, sign=1, cents=None, left_out=False):
+        """Counts an expense in, or out with sign -1.
+
+        cents is the converted amount, if not the expense's own. An
+        expense left_out for want of a rate only counts in left_out.
+        """
+        day = to_day(expense.get("date"))
+        if cents is None:
+            cents = to_cents(expense.get("amount", 0)) or 0
+        self._add(
+            self.left_out if left_out else self.cells,
+            str(expense.get("trip_id")),
+            category_key(expense.get("category", "")),
+            None if day is None else expense["date"], sign * cents, sign
+        )
+
+    @classmethod
+    def from_columns(cls, expenses, cents=None, left_out=None):
+        """Builds the cube of an ExpenseColumns with numpy.
+
+        The expenses are grouped once per rollup level, so the work in
+        Python is per cell rather than per expense. cents can hold the
+        live rows' converted amounts, and left_out the mask of those
+        left unconverted (see converted_cents()).
+        """
+        import numpy as np
+
+        cube = cls()
+        trip_codes = np.frombuffer(expenses.trip_codes, dtype=np.int32)
+        live = trip_codes != DELETED
+        if not live.any():
+            return cube
+        # Categories are interned as stored; group them as the cube keys
+        category_keys = list(dict.fromkeys(
+            category_key(category) for category in expenses.categories.values
+        ))
+        key_codes = {key: code for code, key in enumerate(category_keys)}
+        category_codes = np.array([
+            key_codes[category_key(category)]
+            for category in expenses.categories.values
+        ], dtype=np.int64)[
+            np.frombuffer(expenses.category_codes, dtype=np.int32)[live]
+        ]
+        ordinals, day_codes = np.unique(
+            np.frombuffer(expenses.days, dtype=np.int32)[live],
+            return_inverse=True
+        )
+        days = [
+            date.fromordinal(ordinal).isoformat() if ordinal else None
+            for ordinal in ordinals.tolist()
+        ]
+        codes = (
+            trip_codes[live].astype(np.int64),
+            category_codes,
+            day_codes.astype(np.int64),
+        )
+        # Names by code, where code 0 stands for ALL and the others are
+        # shifted by one
+        names = [
+            np.array([ALL, *values], dtype=object)
+            for values in (expenses.trip_ids.values, category_keys, days)
+        ]
+        if cents is None:
+            cents = np.frombuffer(expenses.cents, dtype=np.int64)[live]
+        if left_out is None:
+            left_out = np.zeros(len(cents), dtype=bool)
+        for cells, rows in (
+            (cube.cells, ~left_out), (cube.left_out, left_out)
+        ):
+            if rows.any():
+                _roll_up(
+                    cells, [column[rows] for column in codes], names,
+                    cents[rows]
+                )
+        return cube
+
+    # --- Queries ---
+    def total(self, trip_id=ALL, category=ALL, day=ALL):
+        """Returns the (cents, count) of a cell; (0, 0) if empty."""
+        return self.cells.get(trip_id, {}).get(category, {}).get(
+            day, (0, 0)
+        )
+
+    def left_out_count(self, trip_id=ALL, category=ALL, day=ALL):
+        """Returns how many expenses of a cell were left unconverted."""
+        return self.left_out.get(trip_id, {}).get(category, {}).get(
+            day, (0, 0)
+        )[1]
+
+    def breakdown(self, dimension, trip_id=ALL, category=ALL, day=ALL):
+        """Returns {key: (cents, count)} over one dimension of a cell.
+
+        dimension is "trip", "category" or "day"; the filter of that
+        dimension is ignored.
+        """
+        if dimension == "day":
+            by_day = self.cells.get(trip_id, {}).get(category, {})
+            return {
+                key: cell for key, cell in by_day.items() if key is not ALL
+            }
+        if dimension == "category":
+            found = self.cells.get(trip_id, {}).items()
+        else:
+            found = (
+                (key, by_category.get(category, {}))
+                for key, by_category in self.cells.items()
+            )
+        return {
+            key: by_day[day] for key, by_day in found
+            if key is not ALL and day in by_day
+        }
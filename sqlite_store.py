@@ -0,0 +1,350 @@
+"""SQLite storage backend for the planner.
+
+An optional alternative to the JSON files, using only the standard
+library. Trips, itinerary entries and expenses live in their own tables,
+with foreign keys to trips, indexes on trip_id and date, and WAL
+journaling. Every change is numbered in a changelog table (filled by
+triggers), which lets each session pick up what other sessions changed
+since it last looked. Values are stored without type affinity so a JSON import
+followed by an export gives back the same data, and any field that has
+no column of its own is kept in the ``extra`` JSON column.
+
+Usage:
+    python sqlite_store.py import travel.db [data_dir]
+    python sqlite_store.py export travel.db [data_dir]
+
+Set TRAVEL_PLANNER_DB=travel.db to run the planner on the database.
+"""
+import json
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+from storage import StorageError, load_data, save_data
+
+# Columns of each table besides the record ID and the extra JSON column
+COLUMNS = {
+    "trips": ["destination", "start_date", "end_date", "budget"],
+    "itinerary": ["trip_id", "date", "activity"],
+    "expenses": ["trip_id", "amount", "category", "description"],
+    "ledger": ["budget", "spent", "remaining", "expense_count"],
+    "sequences": ["next"],
+}
+# The collections the JSON files hold; the planner derives the ledger and
+# sequences from them
+JSON_COLLECTIONS = ("trips", "itinerary", "expenses")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    id TEXT PRIMARY KEY,
+    destination,
+    start_date,
+    end_date,
+    budget,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS itinerary (
+    id TEXT PRIMARY KEY,
+    trip_id TEXT NOT NULL REFERENCES trips(id),
+    date,
+    activity,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id TEXT PRIMARY KEY,
+    trip_id TEXT NOT NULL REFERENCES trips(id),
+    amount,
+    category,
+    description,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    id TEXT PRIMARY KEY,
+    budget,
+    spent,
+    remaining,
+    expense_count,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS sequences (
+    id TEXT PRIMARY KEY,
+    next,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trips_dates ON trips(start_date, end_date);
+CREATE INDEX IF NOT EXISTS idx_itinerary_trip ON itinerary(trip_id);
+CREATE INDEX IF NOT EXISTS idx_itinerary_date ON itinerary(date);
+CREATE INDEX IF NOT EXISTS idx_expenses_trip ON expenses(trip_id);
+CREATE TABLE IF NOT EXISTS changelog (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    record_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_changelog_collection
+    ON changelog(collection, seq);
+""" + "".join(
+    f"""
+CREATE TRIGGER IF NOT EXISTS {collection}_{event.lower()}d
+AFTER {event} ON {collection} BEGIN
+    INSERT INTO changelog (collection, record_id)
+    VALUES ('{collection}', {row}.id);
+END;"""
+    for collection in COLUMNS
+    for event, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+)
+
+# Changelog entries kept when compacting; sessions further behind than
+# this reload the whole collection
+CHANGELOG_KEEP = 100000
+
+
+class SqliteStore:
+    """Keeps the planner's collections in a SQLite database."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # The API server uses a store from its worker threads, one
+        # request at a time per workspace (see api_server.py)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self._seen = {}  # collection -> last changelog seq picked up
+
+    def close(self):
+        """Closes the database connection."""
+        self.conn.close()
+
+    def _row_values(self, collection, record_id, record):
+        """Splits a record into its column values and extra JSON."""
+        columns = COLUMNS[collection]
+        extra = {
+            key: value for key, value in record.items()
+            if key not in columns
+        }
+        return (
+            [record_id]
+            + [record.get(column) for column in columns]
+            + [json.dumps(extra) if extra else None]
+        )
+
+    def _upsert_sql(self, collection):
+        columns = ["id"] + COLUMNS[collection] + ["extra"]
+        updates = ", ".join(
+            f"{column} = excluded.{column}" for column in columns[1:]
+        )
+        # An upsert keeps the rowid, so edited records keep their position
+        return (
+            f"INSERT INTO {collection} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates}"
+        )
+
+    def _record(self, collection, row):
+        """Builds a record from an (id, columns..., extra) row."""
+        record = {
+            column: value
+            for column, value in zip(COLUMNS[collection], row[1:-1])
+            if value is not None
+        }
+        if row[-1]:
+            record.update(json.loads(row[-1]))
+        return record
+
+    def _select_sql(self, collection):
+        return (
+            f"SELECT id, {', '.join(COLUMNS[collection])}, extra "
+            f"FROM {collection}"
+        )
+
+    @contextmanager
+    def _reading(self):
+        """Reads from one consistent state of the database."""
+        if self.conn.in_transaction:
+            yield
+            return
+        self.conn.execute("BEGIN")
+        try:
+            yield
+        finally:
+            self.conn.execute("COMMIT")
+
+    def _last_seq(self):
+        return self.conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM changelog"
+        ).fetchone()[0]
+
+    def load(self, collection):
+        """Loads a whole collection, keyed by record ID."""
+        with self._reading():
+            self._seen[collection] = self._last_seq()
+            cursor = self.conn.execute(
+                self._select_sql(collection) + " ORDER BY rowid"
+            )
+            return {row[0]: self._record(collection, row) for row in cursor}
+
+    def catch_up(self, collection):
+        """Returns what other sessions stored since the last load or sync.
+
+        Returns (changes, None) with the (record ID, record or None)
+        changes, or (None, data) with the whole collection when the
+        changelog no longer goes back far enough.
+        """
+        seen = self._seen.get(collection)
+        found = seen is not None and self.changes_since(collection, seen)
+        if not found:
+            return None, self.load(collection)
+        changes, self._seen[collection] = found
+        return changes, None
+
+    def sync_point(self, collection):
+        """Returns the last changelog seq picked up for a collection."""
+        return self._seen.get(collection)
+
+    def changes_since(self, collection, seen):
+        """Returns what was stored since a sync_point().
+
+        Returns (changes, point reached), or None when the changelog no
+        longer goes back far enough.
+        """
+        with self._reading():
+            oldest = self.conn.execute(
+                "SELECT MIN(seq) FROM changelog"
+            ).fetchone()[0]
+            if oldest is not None and oldest > seen + 1:
+                return None
+            last_seq = self._last_seq()
+            record_ids = [
+                row[0] for row in self.conn.execute(
+                    "SELECT record_id FROM changelog "
+                    "WHERE collection = ? AND seq > ? "
+                    "GROUP BY record_id ORDER BY MAX(seq)",
+                    (collection, seen)
+                )
+            ]
+            changes = []
+            for record_id in record_ids:
+                row = self.conn.execute(
+                    self._select_sql(collection) + " WHERE id = ?",
+                    (record_id,)
+                ).fetchone()
+                changes.append(
+                    (record_id, row and self._record(collection, row))
+                )
+            return changes, last_seq
+
+    def cache_path(self, name):
+        """Returns the path of a file derived from the data, e.g. an index."""
+        return f"{self.db_path}.{name}"
+
+    def put_many(self, collection, records):
+        """Adds or replaces several records in one transaction."""
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    self._upsert_sql(collection),
+                    (
+                        self._row_values(collection, record_id, record)
+                        for record_id, record in records.items()
+                    )
+                )
+        except sqlite3.IntegrityError as e:
+            raise StorageError(f"Cannot save records: {e}")
+
+    @contextmanager
+    def transaction(self, collections):
+        """Runs a catch_up() and apply() sequence as one transaction.
+
+        The write lock is taken up front, so nothing can change between
+        catching up and writing.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def apply(self, changes, auto_compact=True):
+        """Writes (collection, record ID, record or None) changes.
+
+        Must be called in a transaction(), after catch_up(). A None
+        record deletes.
+        """
+        try:
+            for collection, record_id, record in changes:
+                if record is None:
+                    self.conn.execute(
+                        f"DELETE FROM {collection} WHERE id = ?",
+                        (record_id,)
+                    )
+                else:
+                    self.conn.execute(
+                        self._upsert_sql(collection),
+                        self._row_values(collection, record_id, record)
+                    )
+        except sqlite3.IntegrityError as e:
+            raise StorageError(f"Change refused by the database: {e}")
+        # Our own changes have been picked up already
+        last_seq = self._last_seq()
+        for collection, _, _ in changes:
+            self._seen[collection] = last_seq
+
+    def compact(self, collection):
+        """Trims the changelog and checkpoints the WAL journal."""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM changelog WHERE seq <= ?",
+                (self._last_seq() - CHANGELOG_KEEP,)
+            )
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def import_json(store, data_dir="."):
+    """Copies the JSON collections into the database.
+
+    Itinerary entries and expenses whose trip does not exist cannot be
+    stored under the foreign keys, so they are skipped and returned.
+    """
+    trips = load_data(os.path.join(data_dir, "trips.json"))
+    store.put_many("trips", trips)
+    skipped = {}
+    for collection in ("itinerary", "expenses"):
+        records = load_data(os.path.join(data_dir, collection + ".json"))
+        valid = {}
+        for record_id, record in records.items():
+            if str(record.get("trip_id")) in trips:
+                valid[record_id] = record
+            else:
+                skipped.setdefault(collection, []).append(record_id)
+        store.put_many(collection, valid)
+    return skipped
+
+
+def export_json(store, data_dir="."):
+    """Writes the database back out as plain, indented JSON files."""
+    for collection in JSON_COLLECTIONS:
+        save_data(
+            os.path.join(data_dir, collection + ".json"),
+            store.load(collection), "pretty"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4) or sys.argv[1] not in ("import", "export"):
+        print(__doc__)
+        sys.exit(1)
+    command, db_path = sys.argv[1], sys.argv[2]
+    target_dir = sys.argv[3] if len(sys.argv) == 4 else "."
+    sqlite_store = SqliteStore(db_path)
+    if command == "import":
+        for name, ids in import_json(sqlite_store, target_dir).items():
+            print(f"Skipped {len(ids)} {name} row(s) with no trip: {ids}")
+        print(f"Imported JSON data into {db_path}.")
+    else:
+        export_json(sqlite_store, target_dir)
+        print(f"Exported {db_path} to JSON files.")
+    sqlite_store.close()
@@ -0,0 +1,446 @@
+"""Append-only storage for the planner's JSON collections.
+
+Each collection is kept as a snapshot file (e.g. trips.json) plus a
+write-ahead log next to it (e.g. trips.json.wal). Mutations append one
+line to the log, so a write costs the size of the record rather than the
+size of the collection. Once the log grows past the snapshot it is
+compacted back into a fresh snapshot with an atomic replace.
+
+Several sessions can share the files. Each collection has its own lock
+file (e.g. trips.json.lock): writers hold it exclusively while they
+catch up with the log, check and append, and readers share it, so
+writers to different collections never wait for each other. Every
+session remembers how far into the log it has read; catching up reads
+only the entries appended since. Compaction keeps the folded log as
+trips.json.wal.old, so a session that had read part of it can still
+pick up the rest.
+
+Snapshots are written in the format chosen in codec.py, compact by
+default; log lines are compact JSON. Snapshots in the record format (see
+recordfile.py) are read through a memory map, so a whole collection can
+be streamed without loading it all.
+"""
+import fcntl
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+
+import codec
+import recordfile
+
+# Logs smaller than this are never compacted, however small the snapshot
+MIN_COMPACT_BYTES = 64 * 1024
+
+# How far a session has read a collection: the identities of the
+# snapshot and log files it read, and the offset reached in the log.
+# Every log starts with a "begin" entry holding a random ID, which tells
+# logs apart even when the file system reuses an inode.
+SyncPoint = namedtuple("SyncPoint", ["snapshot", "log", "offset"])
+
+
+def wal_path(file_path):
+    """Returns the path of the write-ahead log for a collection."""
+    return file_path + ".wal"
+
+
+def old_wal_path(file_path):
+    """Returns the path the log is moved to when it is compacted."""
+    return wal_path(file_path) + ".old"
+
+
+def _identity(path):
+    """Returns what identifies a snapshot file version, or None."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _plain(point):
+    """Returns a SyncPoint as JSON data (lists for the tuples)."""
+    return [
+        list(value) if isinstance(value, tuple) else value
+        for value in point
+    ]
+
+
+def _log_id(log):
+    """Returns the ID of an open log (read from its begin entry)."""
+    log.seek(0)
+    first = log.readline()
+    if first.endswith(b"\n"):
+        entry = codec.loads(first)
+        if entry["op"] == "begin":
+            return entry["log"]
+    # Logs written before begin entries existed
+    stat = os.fstat(log.fileno())
+    return stat.st_dev, stat.st_ino
+
+
+def log_id(log_path):
+    """Returns the ID of a log file, or None if there is none."""
+    try:
+        with open(log_path, "rb") as log:
+            return _log_id(log)
+    except FileNotFoundError:
+        return None
+
+
+def _load_snapshot(file_path):
+    """Loads the snapshot part of a collection."""
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as file:
+            return codec.decode(file.read())
+    return {}
+
+
+def _apply(data, entry):
+    """Applies a single log entry to the loaded data."""
+    if entry["op"] == "put":
+        data[entry["id"]] = entry["record"]
+    elif entry["op"] == "put_many":
+        data.update(entry["records"])
+    elif entry["op"] == "del":
+        data.pop(entry["id"], None)
+
+
+def _changes(entries):
+    """Turns log entries into (record ID, record or None) changes."""
+    for entry in entries:
+        if entry["op"] == "put":
+            yield entry["id"], entry["record"]
+        elif entry["op"] == "put_many":
+            yield from entry["records"].items()
+        elif entry["op"] == "del":
+            yield entry["id"], None
+
+
+def _read_log(log_path, offset=0):
+    """Reads the complete log entries from an offset on.
+
+    Returns (entries, offset reached, log ID). A torn last line left by
+    a crashed writer is not read; the next writer drops it.
+    """
+    try:
+        log = open(log_path, "rb")
+    except FileNotFoundError:
+        return [], 0, None
+    with log:
+        identity = _log_id(log)
+        log.seek(offset)
+        content = log.read()
+    end = content.rfind(b"\n") + 1
+    entries = [
+        codec.loads(line) for line in content[:end].splitlines()
+        if line.strip()
+    ]
+    return entries, offset + end, identity
+
+
+def load_data(file_path):
+    """Loads data from a JSON file and its write-ahead log."""
+    data = _load_snapshot(file_path)
+    for entry in _read_log(wal_path(file_path))[0]:
+        _apply(data, entry)
+    return data
+
+
+def _fsync_dir(file_path):
+    """Flushes a directory entry change (rename/unlink) to disk."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def save_data(file_path, data, format_name=None):
+    """Saves data to a snapshot file atomically and retires its log.
+
+    format_name is the codec format to write, by default the one set
+    for snapshots (see codec.py).
+    """
+    tmp_path = file_path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(codec.encode(data, format_name))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, file_path)
+    # Replaying the old log over the new snapshot is harmless, so the log
+    # is only moved away once the snapshot is safely in place. It is kept
+    # for sessions that had only read part of it.
+    if os.path.exists(wal_path(file_path)):
+        os.replace(wal_path(file_path), old_wal_path(file_path))
+    _fsync_dir(file_path)
+
+
+def _append(file_path, entries):
+    """Appends entries to the log in one write; returns the log size."""
+    payload = b"".join(codec.dumps(entry) + b"\n" for entry in entries)
+    with open(wal_path(file_path), "ab+") as log:
+        size = log.seek(0, os.SEEK_END)
+        if size:
+            log.seek(-1, os.SEEK_END)
+            if log.read(1) != b"\n":
+                # A crash mid-append left a torn last line; drop it so
+                # this append starts on a clean line
+                log.seek(0)
+                size = log.read().rfind(b"\n") + 1
+                log.truncate(size)
+        if not size:
+            begin = {"op": "begin", "log": os.urandom(8).hex()}
+            payload = codec.dumps(begin) + b"\n" + payload
+        log.write(payload)
+        log.flush()
+        os.fsync(log.fileno())
+        return log.tell()
+
+
+def _snapshot_size(file_path):
+    """Returns the size of the snapshot file in bytes."""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def _entries(changes):
+    """Turns (record ID, record or None) changes into log entries.
+
+    Consecutive puts are grouped into a single put_many entry.
+    """
+    entries = []
+    for record_id, record in changes:
+        if record is None:
+            entries.append({"op": "del", "id": record_id})
+        elif entries and entries[-1]["op"] == "put_many":
+            entries[-1]["records"][record_id] = record
+        else:
+            entries.append({"op": "put_many", "records": {record_id: record}})
+    return entries
+
+
+def compact(file_path):
+    """Folds the write-ahead log into a fresh snapshot."""
+    save_data(file_path, load_data(file_path))
+
+
+class StorageError(Exception):
+    """Raised when a store refuses a change (e.g. a broken reference)."""
+
+
+class ConflictError(StorageError):
+    """Raised when a record was changed by another session meanwhile."""
+
+
+class JsonStore:
+    """Keeps each collection in a JSON file in the data directory."""
+
+    def __init__(self, data_dir="."):
+        self.data_dir = data_dir
+        self._synced = {}  # collection -> SyncPoint
+        self._locked = set()  # collections locked by this store
+
+    def path(self, collection):
+        """Returns the path of a collection's snapshot file."""
+        return os.path.join(self.data_dir, collection + ".json")
+
+    @contextmanager
+    def _lock(self, collections, mode):
+        """Holds the lock files of several collections.
+
+        Locks are always taken in name order, so two sessions locking
+        overlapping collections cannot deadlock.
+        """
+        files = []
+        try:
+            for collection in sorted(set(collections) - self._locked):
+                file = open(self.path(collection) + ".lock", "a")
+                files.append(file)
+                fcntl.flock(file, mode)
+            yield
+        finally:
+            for file in files:
+                file.close()  # Closing the file releases its lock
+
+    @contextmanager
+    def transaction(self, collections):
+        """Locks collections for a catch_up() and apply() sequence."""
+        collections = set(collections) - self._locked
+        with self._lock(collections, fcntl.LOCK_EX):
+            self._locked |= collections
+            try:
+                yield
+            finally:
+                self._locked -= collections
+
+    def load(self, collection):
+        """Loads a whole collection, keyed by record ID."""
+        with self._lock([collection], fcntl.LOCK_SH):
+            return self._load(collection)
+
+    def _load(self, collection):
+        path = self.path(collection)
+        snapshot = _identity(path)
+        data = _load_snapshot(path)
+        entries, offset, log = _read_log(wal_path(path))
+        for entry in entries:
+            _apply(data, entry)
+        self._synced[collection] = SyncPoint(snapshot, log, offset)
+        return data
+
+    def catch_up(self, collection):
+        """Returns what other sessions stored since the last load or sync.
+
+        Returns (changes, None) with the (record ID, record or None)
+        changes, or (None, data) with the whole collection when the
+        changes cannot be told apart any more (e.g. after two
+        compactions).
+        """
+        with self._lock([collection], fcntl.LOCK_SH):
+            point = self._synced.get(collection)
+            found = point and self._changes_since(collection, point)
+            if found is None:
+                return None, self._load(collection)
+            changes, self._synced[collection] = found
+            return changes, None
+
+    def _changes_since(self, collection, point):
+        """Returns (changes, SyncPoint reached) from a point, or None."""
+        path = self.path(collection)
+        changes = []
+        log_offset = point.offset
+        if _identity(path) != point.snapshot:
+            # Compacted since: the rest of the log we were reading was
+            # kept as the old log
+            old_path = old_wal_path(path)
+            if point.log is None or log_id(old_path) != point.log:
+                return None
+            entries = _read_log(old_path, point.offset)[0]
+            changes.extend(_changes(entries))
+            log_offset = 0
+        elif log_id(wal_path(path)) != point.log:
+            log_offset = 0  # The log was created since
+        entries, offset, log = _read_log(wal_path(path), log_offset)
+        changes.extend(_changes(entries))
+        return changes, SyncPoint(_identity(path), log, offset)
+
+    def sync_point(self, collection):
+        """Returns how far this session has read a collection, or None.
+
+        The point is plain JSON data, so it can be kept in a file and
+        handed back to changes_since() by a later session.
+        """
+        point = self._synced.get(collection)
+        return point and _plain(point)
+
+    def changes_since(self, collection, point):
+        """Returns what was stored since a sync_point().
+
+        Returns (changes, point reached), or None when the changes
+        cannot be told apart any more. This session's own position is
+        left alone.
+        """
+        snapshot, log, offset = point
+        point = SyncPoint(
+            snapshot and tuple(snapshot),
+            tuple(log) if isinstance(log, list) else log, offset
+        )
+        with self._lock([collection], fcntl.LOCK_SH):
+            found = self._changes_since(collection, point)
+        if found is None:
+            return None
+        changes, point = found
+        return changes, _plain(point)
+
+    def cache_path(self, name):
+        """Returns the path of a file derived from the data, e.g. an index."""
+        return os.path.join(self.data_dir, name)
+
+    def apply(self, changes, auto_compact=True):
+        """Writes (collection, record ID, record or None) changes.
+
+        Must be called in a transaction() holding every collection
+        changed, after catch_up(). A None record deletes. Each
+        collection's changes are appended to its log in one write, in
+        the order the collections first appear; a crash between two
+        collections can leave the later one behind, which is what the
+        ledger check is for. Bulk writes pass auto_compact=False and call
+        compact() when done.
+        """
+        by_collection = {}
+        for collection, record_id, record in changes:
+            by_collection.setdefault(collection, []).append(
+                (record_id, record)
+            )
+        for collection, records in by_collection.items():
+            path = self.path(collection)
+            log_size = _append(path, _entries(records))
+            # Everything up to our own entries has been caught up on
+            self._synced[collection] = SyncPoint(
+                _identity(path), log_id(wal_path(path)), log_size
+            )
+            if (
+                auto_compact and log_size > MIN_COMPACT_BYTES
+                and log_size > _snapshot_size(path)
+            ):
+                compact(path)
+                self._synced[collection] = SyncPoint(_identity(path), None, 0)
+
+    def stream(self, collection):
+        """Yields a collection's (record ID, record) pairs, like load().
+
+        A record-format snapshot is decoded one record at a time, so the
+        whole collection is never held as dicts at once.
+        """
+        with self._lock([collection], fcntl.LOCK_SH):
+            path = self.path(collection)
+            data = None
+            if not recordfile.is_record_file(path):
+                data = self._load(collection)
+            else:
+                snapshot = _identity(path)
+                records = recordfile.RecordFile(path)
+                entries, offset, log = _read_log(wal_path(path))
+                self._synced[collection] = SyncPoint(snapshot, log, offset)
+        if data is not None:
+            yield from data.items()
+            return
+        # The map still reads the same file if it is compacted meanwhile
+        with records:
+            # Replay the log the way _apply() would change a loaded dict:
+            # replaced records keep their place, new ones go at the end
+            replaced = {}  # record ID -> record, or None if deleted
+            added = {}
+            for record_id, record in _changes(entries):
+                if record_id in added:
+                    if record is None:
+                        del added[record_id]
+                    else:
+                        added[record_id] = record
+                elif record is None:
+                    replaced[record_id] = None
+                elif (
+                    replaced.get(record_id, True) is not None
+                    and record_id in records
+                ):
+                    replaced[record_id] = record
+                else:
+                    added[record_id] = record
+            for record_id, record in records.items():
+                record = replaced.get(record_id, record)
+                if record is not None:
+                    yield record_id, record
+            yield from added.items()
+
+    def compact(self, collection):
+        """Folds a collection's log into its snapshot."""
+        with self._lock([collection], fcntl.LOCK_EX):
+            compact(self.path(collection))
@@ -0,0 +1,202 @@
+"""Per-trip aggregation and rendering for the Summary screen.
+
+Expenses and itinerary entries are grouped by trip independently, so the
+work grows with the size of each collection rather than with the product
+of the two (which is what merging them on trip_id used to produce).
+Totals, remaining budgets and the printed text are all built with
+column-wise pandas operations; nothing loops over individual rows.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from currency import DEFAULT_CURRENCY
+
+TRIP_COLUMNS = ["destination", "start_date", "end_date", "budget", "currency"]
+EXPENSE_COLUMNS = ["trip_id", "amount", "category", "description", "currency"]
+ITINERARY_COLUMNS = ["trip_id", "date", "activity"]
+SEPARATOR = "------------------------------"
+
+# trips is indexed by trip ID and has total_expenses, expense_count and
+# remaining_budget columns besides the trip fields
+Summary = namedtuple(
+    "Summary", ["trips", "category_totals", "itinerary", "expenses"]
+)
+
+# What the summary shows of one trip: its fields and totals as a plain
+# dict (with "categories" mapping category to total) and its printable
+# block
+TripResult = namedtuple("TripResult", ["record", "block"])
+
+
+def to_frame(data, columns):
+    """Builds a DataFrame from a collection, keyed by record ID."""
+    if hasattr(data, "to_frame"):
+        # Column stores build the frame straight from their arrays
+        return data.to_frame()
+    # Building it column by column is several times faster than
+    # DataFrame.from_dict(orient="index") on a dict of dicts
+    records = data.values()
+    df = pd.DataFrame(
+        {
+            column: [record.get(column) for record in records]
+            for column in columns
+        },
+        index=pd.Index([str(key) for key in data], dtype=object)
+    )
+    if "trip_id" in columns:
+        df["trip_id"] = df["trip_id"].astype(str)
+    return df
+
+
+def aggregate_expenses(expenses_df):
+    """Sums and counts expenses per trip and per category in one pass."""
+    amounts = pd.to_numeric(expenses_df["amount"], errors="coerce")
+    categories = expenses_df["category"].fillna("Uncategorised")
+    by_category = amounts.groupby(
+        [expenses_df["trip_id"], categories], sort=False
+    ).agg(["sum", "size"])
+    return _split_totals(by_category)
+
+
+def aggregates_from_rows(rows):
+    """Builds the aggregates from (trip, category, sum, count) rows.
+
+    This is the shape returned by stores that aggregate by themselves,
+    such as the SQLite backend's GROUP BY query.
+    """
+    by_category = pd.DataFrame(
+        rows, columns=["trip_id", "category", "sum", "size"]
+    ).astype({"sum": float, "size": int})
+    by_category["trip_id"] = by_category["trip_id"].astype(str)
+    return _split_totals(by_category.set_index(["trip_id", "category"]))
+
+
+def _split_totals(by_category):
+    """Returns per-trip totals and per-category sums."""
+    totals = by_category.groupby(level=0, sort=False).sum()
+    return totals, by_category["sum"]
+
+
+def _text(column):
+    """Formats a column for printing, showing N/A for missing values."""
+    return column.astype(object).where(column.notna(), "N/A").astype(str)
+
+
+def _join_by_trip(lines, trip_ids, index):
+    """Concatenates text lines per trip, aligned to the trips' index."""
+    if lines.empty:
+        return pd.Series("", index=index)
+    joined = lines.groupby(trip_ids, sort=False).agg("".join)
+    return joined.reindex(index, fill_value="")
+
+
+def build_summary(trips, itinerary, expenses, aggregates=None):
+    """Returns the Summary of every trip.
+
+    aggregates can hold precomputed (trip, category, sum, count) rows;
+    otherwise the expenses are aggregated here.
+    """
+    trips_df = to_frame(trips, TRIP_COLUMNS)
+    itinerary_df = to_frame(itinerary, ITINERARY_COLUMNS)
+    expenses_df = to_frame(expenses, EXPENSE_COLUMNS)
+    if aggregates is None:
+        totals, category_totals = aggregate_expenses(expenses_df)
+    else:
+        totals, category_totals = aggregates_from_rows(aggregates)
+
+    # Totals and budgets are in the trip's currency (see ledger.py)
+    trips_df["currency"] = trips_df["currency"].fillna(DEFAULT_CURRENCY)
+    totals = totals.reindex(trips_df.index)
+    trips_df["total_expenses"] = totals["sum"].fillna(0.0).astype(float)
+    trips_df["expense_count"] = totals["size"].fillna(0).astype(int)
+    budget = pd.to_numeric(trips_df["budget"], errors="coerce")
+    trips_df["remaining_budget"] = budget - trips_df["total_expenses"]
+    return Summary(trips_df, category_totals, itinerary_df, expenses_df)
+
+
+def render_summary(summary):
+    """Returns the printable summary block of every trip.
+
+    Each block holds everything shown for one trip (details, totals,
+    spending by category, activities and expenses), so it can be written
+    with a single call.
+    """
+    summary_df = summary.trips
+    itinerary_df = summary.itinerary
+    expenses_df = summary.expenses
+    index = summary_df.index
+
+    activity_text = _join_by_trip(
+        "\nActivity Date:  " + _text(itinerary_df["date"])
+        + "\nActivity:  " + _text(itinerary_df["activity"]) + "\n",
+        itinerary_df["trip_id"], index
+    )
+    # Amounts in another currency than the trip's are shown with it
+    currency = expenses_df["currency"]
+    expense_text = _join_by_trip(
+        "\nExpense Amount:  " + _text(expenses_df["amount"])
+        + (" " + currency.fillna("")).where(currency.notna(), "")
+        + "\nExpense Category:  " + _text(expenses_df["category"])
+        + "\nExpense Description:  " + _text(expenses_df["description"])
+        + "\n",
+        expenses_df["trip_id"], index
+    )
+    categories_df = summary.category_totals.rename_axis(
+        ["trip_id", "category"]
+    ).reset_index(name="sum")
+    category_text = _join_by_trip(
+        "  " + categories_df["category"].astype(str)
+        + ": " + categories_df["sum"].astype(str) + "\n",
+        categories_df["trip_id"], index
+    )
+    category_text = category_text.where(
+        category_text == "", "Spending by Category:\n" + category_text
+    )
+
+    budget = summary_df["budget"]
+    remaining = summary_df["remaining_budget"]
+    budget_line = np.where(
+        budget.isna(), "Budget: N/A\n",
+        np.where(
+            remaining.isna(), "Invalid budget format.\n",
+            "Remaining Budget: " + remaining.astype(str) + "\n"
+        )
+    )
+    empty_line = np.where(
+        (activity_text == "") & (expense_text == ""),
+        "No itinerary or expenses for this trip.\n", ""
+    )
+
+    return (
+        "\n" + SEPARATOR
+        + "\nTrip ID: " + index.to_series(index=index)
+        + "\nDestination: " + _text(summary_df["destination"])
+        + "\nStart Date: " + _text(summary_df["start_date"])
+        + "\nEnd Date: " + _text(summary_df["end_date"])
+        + "\nBudget: " + _text(budget)
+        + "\nCurrency: " + _text(summary_df["currency"])
+        + "\nTotal Expenses: " + summary_df["total_expenses"].astype(str)
+        + "\nNumber of Expenses: " + summary_df["expense_count"].astype(str)
+        + "\n" + budget_line + category_text + empty_line
+        + activity_text + expense_text + SEPARATOR
+    )
+
+
+def trip_results(summary):
+    """Returns the TripResult of every trip, keyed by trip ID."""
+    categories = {}
+    for (trip_id, category), total in summary.category_totals.items():
+        categories.setdefault(str(trip_id), {})[category] = float(total)
+    # object columns hold plain Python values, with None for missing ones
+    trips = summary.trips.astype(object)
+    trips = trips.where(trips.notna(), None)
+    return {
+        trip_id: TripResult(
+            {**record, "categories": categories.get(trip_id, {})}, block
+        )
+        for trip_id, record, block in zip(
+            trips.index, trips.to_dict("records"), render_summary(summary)
+        )
+    }
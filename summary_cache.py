@@ -0,0 +1,55 @@
+"""Per-trip cache of the summary.
+
+The repository marks a trip stale whenever the trip, its ledger entry or
+one of its itinerary entries or expenses changes, in this session or in
+another one. Showing the summary again only rebuilds the stale trips, so
+it costs the rows that changed rather than the whole data set.
+"""
+
+# Past this share of stale trips, rebuilding everything in one pass over
+# the whole collections is faster than picking out the trips' rows
+FULL_REBUILD_SHARE = 0.5
+
+
+class SummaryCache:
+    """Keeps the TripResult of every trip (see summary.py)."""
+
+    def __init__(self):
+        self.results = {}  # trip ID -> TripResult
+
+    def invalidate(self, trip_ids):
+        """Marks trips stale."""
+        for trip_id in trip_ids:
+            self.results.pop(trip_id, None)
+
+    def trip_results(self, repo):
+        """Returns (trip ID, TripResult) pairs, in trip order."""
+        stale = [
+            trip_id for trip_id in repo.trips if trip_id not in self.results
+        ]
+        if stale:
+            # pandas is only imported the first time a summary is built
+            from summary import build_summary, trip_results
+
+            if len(stale) > FULL_REBUILD_SHARE * len(repo.trips):
+                summary = build_summary(
+                    repo.trips, repo.itinerary, repo.expenses,
+                    repo.ledger.aggregates()
+                )
+            else:
+                summary = build_summary(
+                    {trip_id: repo.trips[trip_id] for trip_id in stale},
+                    {
+                        itinerary_id: entry for trip_id in stale
+                        for itinerary_id, entry
+                        in repo.trip_itinerary(trip_id).items()
+                    },
+                    {
+                        expense_id: expense for trip_id in stale
+                        for expense_id, expense
+                        in repo.trip_expenses(trip_id).items()
+                    },
+                    repo.ledger.aggregates(stale)
+                )
+            self.results.update(trip_results(summary))
+        return [(trip_id, self.results[trip_id]) for trip_id in repo.trips]
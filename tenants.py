@@ -0,0 +1,123 @@
+"""Per-tenant partitioning of the planner's data.
+
+When TRAVEL_PLANNER_TENANT_ROOT is set, each session works on the shard
+of one tenant (a user or workspace) named by TRAVEL_PLANNER_TENANT: a
+directory of its own holding its JSON collections, or its own SQLite
+database when TRAVEL_PLANNER_DB is set (only the file name is used).
+Loads and saves only ever touch that shard, so they cost the same however
+many tenants there are. Shards are spread over 256 bucket directories by
+a hash of the tenant name, which keeps every directory small.
+
+Usage:
+    python run.py tenants list
+    python run.py tenants compact [TENANT ...]
+"""
+import argparse
+import hashlib
+import os
+import re
+
+from storage import StorageError
+
+TENANT_ROOT_ENV = "TRAVEL_PLANNER_TENANT_ROOT"
+TENANT_ENV = "TRAVEL_PLANNER_TENANT"
+TENANT_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def tenant_root():
+    """Returns the directory of the tenant shards, or None if disabled."""
+    return os.environ.get(TENANT_ROOT_ENV) or None
+
+
+def valid_tenant(name):
+    """Checks that a tenant name is safe to use as a directory name."""
+    return bool(TENANT_NAME.fullmatch(name))
+
+
+def session_tenant():
+    """Returns the tenant of this session."""
+    name = os.environ.get(TENANT_ENV, "")
+    if not valid_tenant(name):
+        raise StorageError(
+            f"Set {TENANT_ENV} to a tenant name of 1-64 letters, digits, "
+            "'-' or '_'."
+        )
+    return name
+
+
+def shard_dir(root, tenant):
+    """Returns the directory holding a tenant's data."""
+    bucket = hashlib.sha1(tenant.encode("utf-8")).hexdigest()[:2]
+    return os.path.join(root, bucket, tenant)
+
+
+def list_tenants(root):
+    """Yields (tenant, shard directory) pairs, in no particular order."""
+    try:
+        buckets = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for bucket in buckets:
+        if bucket.is_dir():
+            for shard in os.scandir(bucket.path):
+                if shard.is_dir() and valid_tenant(shard.name):
+                    yield shard.name, shard.path
+
+
+def shard_usage(path):
+    """Returns (files, bytes, last modification time) of a shard."""
+    files = size = modified = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            stat = entry.stat()
+            files += 1
+            size += stat.st_size
+            modified = max(modified, stat.st_mtime)
+    return files, size, modified
+
+
+def tenants_command(argv):
+    """Runs the tenant admin command; returns the process exit status."""
+    from datetime import datetime
+
+    from repository import COLLECTIONS, open_store
+
+    parser = argparse.ArgumentParser(
+        prog="run.py tenants", description="List or compact tenant shards."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list every tenant and its shard size")
+    compact_parser = commands.add_parser(
+        "compact", help="compact the shards of some or all tenants"
+    )
+    compact_parser.add_argument("tenant", nargs="*")
+    args = parser.parse_args(argv)
+
+    root = tenant_root()
+    if root is None:
+        print(f"Tenants are disabled; set {TENANT_ROOT_ENV} first.")
+        return 1
+    shards = dict(list_tenants(root))
+
+    if args.command == "list":
+        for tenant in sorted(shards):
+            files, size, modified = shard_usage(shards[tenant])
+            changed = datetime.fromtimestamp(modified).strftime(
+                "%Y-%m-%d %H:%M"
+            ) if modified else "never"
+            print(f"{tenant:<24} {files:>4} file(s) {size:>12,} bytes  "
+                  f"last change {changed}")
+        print(f"{len(shards)} tenant(s).")
+        return 0
+
+    tenants = args.tenant or sorted(shards)
+    unknown = [tenant for tenant in tenants if tenant not in shards]
+    if unknown:
+        print(f"Unknown tenant(s): {', '.join(unknown)}")
+        return 1
+    for tenant in tenants:
+        store = open_store(tenant)
+        for collection in COLLECTIONS:
+            store.compact(collection)
+        print(f"Compacted {tenant}.")
+    return 0
@@ -0,0 +1,24 @@
+"""Tests of the asyncio JSON API server."""
+import asyncio
+import json
+
+from api_server import ApiServer
+from conftest import trip
+
+
+def test_requests_run_on_any_worker_thread(backend):
+    server = ApiServer()
+
+    async def requests():
+        created = await server.respond(
+            "POST", "/trips", {}, json.dumps(trip()).encode()
+        )
+        # Enough requests that they land on other threads of the pool
+        found = await asyncio.gather(*(
+            server.respond("GET", "/trips/1", {}, b"") for _ in range(20)
+        ))
+        return created, found
+
+    created, found = asyncio.run(requests())
+    assert created == (201, {"id": "1", **trip()})
+    assert found == [(200, {"id": "1", **trip()})] * 20
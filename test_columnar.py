@@ -0,0 +1,69 @@
+"""Tests of the column-wise expense store."""
+from datetime import date
+
+from columnar import ExpenseColumns, to_cents, to_day
+from conftest import expense
+
+
+def test_to_cents_rounds_half_up():
+    assert to_cents("12.345") == 1235
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents("abc") is None
+    assert to_cents("nan") is None
+
+
+def test_to_day_takes_only_calendar_days():
+    assert to_day("2031-05-01") == date(2031, 5, 1).toordinal()
+    assert to_day("1111-12-24") is not None
+    assert to_day("2031-W01-1") is None
+    assert to_day("2031-02-30") is None
+    assert to_day(None) is None
+
+
+def test_records_round_trip():
+    records = {
+        "1": expense("1", 12.5, date="2031-05-02"),
+        "2": expense("1", 3, currency="EUR", note="kept"),
+        "3": expense("2", 7.25, date="soon"),
+    }
+    columns = ExpenseColumns(records)
+    assert dict(columns.items()) == {
+        "1": records["1"],
+        "2": {**records["2"], "amount": 3.0},
+        "3": records["3"],
+    }
+
+
+def test_values_the_columns_cannot_hold_round_trip():
+    records = {
+        "1": expense("1", "abc", category=None),
+        "2": expense("1", "Infinity", description=5),
+        "3": {"trip_id": "1"},
+    }
+    columns = ExpenseColumns(records)
+    assert dict(columns.items()) == records
+    assert columns.cents.tolist() == [0, 0, 0]
+
+
+def test_deleted_rows_are_squeezed_out():
+    columns = ExpenseColumns({
+        str(number): expense("1", number) for number in range(1, 5)
+    })
+    for expense_id in ("1", "2", "3"):
+        columns.delete(expense_id)
+    assert list(columns) == ["4"]
+    assert len(columns.cents) == 1
+    assert columns["4"]["amount"] == 4.0
+
+
+def test_aggregate_groups_by_trip_and_category():
+    columns = ExpenseColumns({
+        "1": expense("1", 10),
+        "2": expense("1", 2.5),
+        "3": expense("1", 4, category="Hotel"),
+        "4": expense("2", 1),
+    })
+    columns.delete("4")
+    assert sorted(columns.aggregate()) == [
+        ("1", "Food", 12.5, 2), ("1", "Hotel", 4.0, 1)
+    ]
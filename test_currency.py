@@ -0,0 +1,58 @@
+"""Tests of the exchange rate table."""
+import json
+
+import numpy as np
+import pytest
+
+from currency import LATEST, RateTable, scale
+from trip_calendar import parse_day
+
+RATES = {
+    "2031-01-01": {"EUR": 0.5, "GBP": 0.8},
+    "2031-02-01": {"EUR": 0.4},
+}
+
+
+def test_rates_by_day():
+    rates = RateTable("USD", RATES)
+    assert rates.rate("EUR", parse_day("2030-06-01")) == 0.5
+    assert rates.rate("EUR", parse_day("2031-01-31")) == 0.5
+    assert rates.rate("EUR", parse_day("2031-02-01")) == 0.4
+    assert rates.rate("EUR") == 0.4
+    assert rates.rate("USD") == 1.0
+    assert rates.rate("JPY") is None
+    assert rates.factor("EUR", "GBP", parse_day("2031-01-15")) == 1.6
+    assert rates.factor("JPY", "USD") is None
+
+
+def test_convert_many_matches_one_at_a_time():
+    rates = RateTable("USD", RATES)
+    names = ["USD", "EUR", "GBP", "JPY"]
+    chance = np.random.default_rng(3)
+    cents = chance.integers(0, 100000, 500)
+    sources = chance.integers(0, 4, 500)
+    targets = chance.integers(0, 4, 500)
+    days = chance.choice(
+        [0, parse_day("2031-01-10"), parse_day("2031-03-01")], 500
+    )
+    converted, unknown = rates.convert_many(
+        cents, sources, targets, days, names
+    )
+    for row in range(500):
+        factor = rates.factor(
+            names[sources[row]], names[targets[row]],
+            int(days[row]) or LATEST
+        )
+        assert unknown[row] == (factor is None)
+        assert converted[row] == (
+            cents[row] if factor is None else scale(cents[row], factor)
+        )
+
+
+def test_load(data_dir):
+    assert RateTable.load().currencies() == {"USD"}
+    (data_dir / "rates.json").write_text(json.dumps({"rates": RATES}))
+    assert RateTable.load().currencies() == {"USD", "EUR", "GBP"}
+    (data_dir / "rates.json").write_text("[]")
+    with pytest.raises(ValueError):
+        RateTable.load()
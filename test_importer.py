@@ -0,0 +1,93 @@
+"""Tests of the bulk importer."""
+import json
+
+import pytest
+
+import importer
+from conftest import trip
+
+
+def import_file(path, collection, repo):
+    rejects = []
+
+    def on_reject(line_number, row, reason):
+        rejects.append((line_number, reason))
+
+    imported = importer.import_rows(
+        collection, importer.read_rows(str(path), on_reject), repo,
+        on_reject
+    )
+    return imported, rejects
+
+
+def test_csv_rows_are_checked_and_saved(repo, data_dir):
+    path = data_dir / "trips.csv"
+    path.write_text(
+        "id,destination,start_date,end_date,budget\n"
+        "5,Lisbon,2031-05-01,2031-05-10,100\n"
+        ",Porto,2031-06-01,2031-06-03,50\n"
+        "5,Faro,2031-07-01,2031-07-03,50\n"
+        ",,2031-07-01,2031-07-03,50\n"
+    )
+    assert import_file(path, "trips", repo) == (2, [
+        (4, "ID already exists."), (5, "Destination cannot be empty."),
+    ])
+    assert repo.trips == {
+        "5": trip(start="2031-05-01", end="2031-05-10", budget="100"),
+        "1": trip("Porto", "2031-06-01", "2031-06-03", "50"),
+    }
+
+
+def test_import_command(repo, data_dir, capsys):
+    repo.save_trip("1", trip())
+    path = data_dir / "expenses-may.jsonl"
+    path.write_text(
+        '{"trip_id": "1", "amount": 10, "category": "Food",'
+        ' "description": "Lunch"}\n'
+        "\n"
+        '{"trip_id": "2", "amount": 10, "category": "Food",'
+        ' "description": "Lunch"}\n'
+    )
+    assert importer.import_command([str(path)]) == 1
+    assert capsys.readouterr().out.splitlines() == [
+        "Line 3: Trip ID '2' not found.",
+        "Imported 1 expenses row(s), rejected 1.",
+    ]
+
+
+def test_malformed_jsonl_lines_are_rejected(repo, data_dir):
+    repo.save_trip("1", trip())
+    path = data_dir / "expenses.jsonl"
+    path.write_text(
+        '{"trip_id": "1", "amount": 10, "category": "Food",'
+        ' "description": "Lunch"}\n'
+        '{"trip_id": "1", "amount": \n'
+        '["not", "an", "object"]\n'
+        '{"trip_id": "1", "amount": 5, "category": "Food",'
+        ' "description": "Dinner"}\n'
+    )
+    assert import_file(path, "expenses", repo) == (2, [
+        (2, "Not valid JSON (Expecting value at column 29)."),
+        (3, "Not a JSON object."),
+    ])
+    assert repo.spent_cents("1") == 1500
+
+
+def test_rejects_file_keeps_malformed_lines(repo, data_dir):
+    repo.save_trip("1", trip())
+    path = data_dir / "expenses.jsonl"
+    path.write_text("{oops\n")
+    rejects = data_dir / "rejects.jsonl"
+    assert importer.import_command([str(path), "--rejects", str(rejects)])
+    assert json.loads(rejects.read_text()) == {
+        "line": 1, "reason": "Not valid JSON (Expecting property name "
+        "enclosed in double quotes at column 2).", "row": "{oops",
+    }
+
+
+@pytest.mark.parametrize("name, collection", [
+    ("trips.csv", "trips"), ("Expenses-2031.jsonl", "expenses"),
+    ("data.csv", None),
+])
+def test_guess_collection(name, collection):
+    assert importer.guess_collection(name) == collection
@@ -0,0 +1,126 @@
+"""Tests of the integrity check of all the stored data."""
+import integrity
+import repository
+from conftest import expense, trip
+from storage import JsonStore, save_data
+
+
+def problems(repo):
+    return sorted(
+        (collection, record_id, problem)
+        for collection, record_id, problem in integrity.check_data(repo)
+    )
+
+
+def test_empty_collections_pass(repo, capsys):
+    assert problems(repo) == []
+    repo.save_trip("1", trip())
+    assert problems(repo) == []
+    repo.save_trip("2", {
+        field: value for field, value in trip().items() if field != "budget"
+    })
+    assert problems(repo) == []
+    assert integrity.check_command([]) == 0
+    assert "No problems found in 2 trip(s)" in capsys.readouterr().out
+
+
+def load(trips, itinerary=None, expenses=None, ledger=None):
+    """Opens a repository on data written as it is, unchecked."""
+    for collection, records in (
+        ("trips", trips), ("itinerary", itinerary),
+        ("expenses", expenses), ("ledger", ledger),
+    ):
+        save_data(collection + ".json", records or {})
+    return repository.Repository(JsonStore())
+
+
+def test_violations_are_found_and_repaired():
+    repo = load(
+        {
+            "1": trip(start="2031-05-10", end="2031-05-01"),
+            "2": trip(destination="", budget="-5", currency="euro"),
+        },
+        {
+            "1": {"trip_id": "2", "date": "2031-06-01", "activity": ""},
+            "2": {"trip_id": "9", "date": "2031-05-02", "activity": "Zoo"},
+        },
+        {
+            "1": expense("2", -1, category=" ", description=""),
+            "2": expense("2", 1, date="2031-13-01"),
+            "3": expense("9", 1),
+        },
+        {"2": {"spent": 1, "expense_count": 1, "categories": {}}},
+    )
+    assert problems(repo) == [
+        ("expenses", "1", "amount is negative"),
+        ("expenses", "1", "category is empty"),
+        ("expenses", "1", "description is empty"),
+        ("expenses", "2", "date is not YYYY-MM-DD"),
+        ("expenses", "3", integrity.MISSING_TRIP),
+        ("itinerary", "1", "activity is empty"),
+        ("itinerary", "1", "date outside the trip's dates"),
+        ("itinerary", "2", integrity.MISSING_TRIP),
+        ("ledger", "1", integrity.LEDGER_DIFFERS),
+        ("ledger", "2", integrity.LEDGER_DIFFERS),
+        ("ledger", "9", integrity.LEDGER_DIFFERS),
+        ("trips", "1", integrity.END_BEFORE_START),
+        ("trips", "2", "budget is not a positive number"),
+        ("trips", "2", "currency is not a three-letter code"),
+        ("trips", "2", "destination is empty"),
+    ]
+    repository._repository = repo
+    assert integrity.check_command(["--repair"]) == 1
+    assert [
+        problem for problem in problems(repo)
+        if problem[2] in (
+            integrity.MISSING_TRIP, integrity.END_BEFORE_START,
+            integrity.LEDGER_DIFFERS,
+        )
+    ] == []
+
+
+def test_dates_outside_the_pandas_range():
+    repo = load(
+        {
+            "1": trip(start="1111-12-24", end="1111-12-26"),
+            "2": trip(start="2300-01-01", end="2300-01-05"),
+            "3": trip(start="2300-01-05", end="1111-12-24"),
+        },
+        {
+            "1": {"trip_id": "2", "date": "2300-01-02", "activity": "Zoo"},
+            "2": {"trip_id": "2", "date": "2300-02-01", "activity": "Zoo"},
+        },
+        {
+            "1": expense("1", 1, date="1111-12-25"),
+            "2": expense("1", 1, date="1111-12-30"),
+        },
+    )
+    assert problems(repo) == [
+        ("expenses", "2", "date outside the trip's dates"),
+        ("itinerary", "2", "date outside the trip's dates"),
+        ("trips", "3", integrity.END_BEFORE_START),
+    ]
+
+
+def test_values_the_columns_cannot_hold_are_found():
+    repo = load(
+        {"1": trip()},
+        expenses={
+            "1": expense("1", "abc"),
+            "2": expense("1", None, category=None),
+            "3": expense("1", "Infinity", description=None),
+            "4": {"trip_id": "1"},
+        },
+    )
+    assert [
+        problem for problem in problems(repo) if problem[0] == "expenses"
+    ] == [
+        ("expenses", "1", "amount is not a number"),
+        ("expenses", "2", "amount is not a number"),
+        ("expenses", "2", "category is empty"),
+        ("expenses", "3", "amount is not a number"),
+        ("expenses", "3", "description is empty"),
+        ("expenses", "4", "amount is not a number"),
+        ("expenses", "4", "category is empty"),
+        ("expenses", "4", "description is empty"),
+    ]
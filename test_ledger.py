@@ -0,0 +1,96 @@
+"""Tests of the persisted budget ledger."""
+import json
+
+import pytest
+
+import ledger
+from conftest import expense, trip
+from repository import Repository, open_store
+
+
+def test_tracks_spending_and_budget(service):
+    service.add_trip("1", trip(budget="100"))
+    service.add_expense("1", expense("1", 30))
+    service.add_expense("2", expense("1", 20, category="Hotel"))
+    service.update_expense("1", {"amount": "35"})
+    service.delete_expense("2")
+    entry = service.repo.ledger.entries["1"]
+    assert entry["spent"] == 3500
+    assert entry["remaining"] == 6500
+    assert entry["expense_count"] == 1
+    assert entry["categories"] == {"Food": {"spent": 3500, "count": 1}}
+    assert service.over_budget("1", 65.01)
+    assert not service.over_budget("1", 65)
+
+
+def test_matches_a_rebuild(service):
+    service.add_trip("1", trip())
+    service.add_trip("2", trip(budget="50"))
+    for number, amount in enumerate((1, 2.5, 0.1, 99.99), start=1):
+        service.add_expense(str(number), expense(str(number % 2 + 1), amount))
+    service.delete_trip("2")
+    repo = service.repo
+    assert repo.ledger.differences(repo.rebuild_ledger()) == []
+
+
+def test_rebuild_rounds_each_expense_like_the_ledger(service, capsys):
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", "12.345"))
+    service.add_expense("2", expense("1", "12.345"))
+    repo = service.repo
+    assert repo.spent_cents("1") == 2470
+    assert repo.rebuild_ledger().entries == repo.ledger.entries
+    assert ledger.check_command([]) == 0
+    assert "Ledger is consistent" in capsys.readouterr().out
+
+
+def test_is_loaded_by_a_new_session(service):
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", 12.5))
+    assert Repository(open_store()).ledger.entries == (
+        service.repo.ledger.entries
+    )
+
+
+def test_is_rebuilt_for_data_saved_without_one(service):
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", 12.5))
+    entries = dict(service.repo.ledger.entries)
+    service.repo.replace_ledger(ledger.Ledger())
+    repo = Repository(open_store())
+    assert repo.ledger.entries == entries
+    # Stored with the first change, not when the store is opened
+    assert open_store().load("ledger") == {}
+    repo.save_itinerary_entry("1", {
+        "trip_id": "1", "date": "2031-05-02", "activity": "Zoo",
+    })
+    assert open_store().load("ledger") == entries
+
+
+def test_follows_a_change_of_trip_currency(service, data_dir):
+    (data_dir / "rates.json").write_text(json.dumps(
+        {"base": "USD", "rates": {"2031-01-01": {"EUR": 0.5}}}
+    ))
+    repo = Repository(open_store())
+    service.repo = repo
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", 10))
+    service.add_expense("2", expense("1", 10, currency="EUR"))
+    assert repo.spent_cents("1") == 3000
+    service.update_trip("1", {"currency": "EUR"})
+    # Expenses without a currency are in their trip's, now EUR
+    assert repo.spent_cents("1") == 2000
+    assert repo.ledger.differences(repo.rebuild_ledger()) == []
+
+
+@pytest.mark.parametrize("repair", [False, True])
+def test_check_command_repairs_a_stale_ledger(service, capsys, repair):
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", 10))
+    repo = service.repo
+    stale = {"1": {**repo.ledger.entries["1"], "spent": 1}}
+    repo.replace_ledger(ledger.Ledger(stale))
+    argv = ["--repair"] if repair else []
+    assert ledger.check_command(argv) == (0 if repair else 1)
+    assert "Trip 1: stored spent 0.01" in capsys.readouterr().out
+    assert ledger.check_command([]) == (0 if repair else 1)
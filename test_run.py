@@ -0,0 +1,115 @@
+"""Tests of the interactive front end."""
+import os
+
+import pytest
+
+import run
+from conftest import trip
+from storage import StorageError, save_data
+from tenants import TENANT_ENV, TENANT_ROOT_ENV
+
+
+def answer(monkeypatch, *answers):
+    """Feeds answers to the prompts, failing on any prompt more."""
+    answers = iter(answers)
+    monkeypatch.setattr("builtins.input", lambda prompt: next(answers))
+
+
+def test_invalid_workspace_from_the_environment_is_asked_again(
+    monkeypatch, capsys
+):
+    monkeypatch.setenv(TENANT_ROOT_ENV, "tenants")
+    monkeypatch.setenv(TENANT_ENV, "bad/name")
+    answer(monkeypatch, "", "../up", "team-1")
+    run.choose_workspace()
+    assert os.environ[TENANT_ENV] == "team-1"
+    assert capsys.readouterr().out.count("Use 1-64 letters") == 3
+
+
+def test_valid_workspace_from_the_environment_is_kept(monkeypatch):
+    monkeypatch.setenv(TENANT_ROOT_ENV, "tenants")
+    monkeypatch.setenv(TENANT_ENV, "team-1")
+    answer(monkeypatch)
+    run.choose_workspace()
+    assert os.environ[TENANT_ENV] == "team-1"
+
+
+@pytest.fixture
+def bad_trip():
+    """A stored trip whose dates cannot be parsed."""
+    save_data("trips.json", {"1": trip(start="soon", end="2031-05-10")})
+    save_data("itinerary.json", {
+        "1": {"trip_id": "1", "date": "2031-05-02", "activity": "Zoo"}
+    })
+
+
+def test_itinerary_of_a_trip_with_invalid_dates(
+    bad_trip, monkeypatch, capsys
+):
+    answer(monkeypatch, "", "1")
+    run.add_itinerary_entry()
+    answer(monkeypatch, "1", "2031-05-03")
+    run.edit_itinerary_entry()
+    assert capsys.readouterr().out.count(
+        "Trip 1 has invalid dates. Fix them with Edit Trip first."
+    ) == 2
+    answer(monkeypatch, "1", "", "Museum")
+    run.edit_itinerary_entry()
+    assert run.get_service().repo.itinerary == {
+        "1": {"trip_id": "1", "date": "2031-05-02", "activity": "Museum"}
+    }
+
+
+def test_expense_of_a_trip_with_invalid_dates_has_no_date(
+    bad_trip, monkeypatch, capsys
+):
+    answer(monkeypatch, "", "1", "", "10", "Food", "Lunch")
+    run.add_expense()
+    assert "Trip 1 has invalid dates" in capsys.readouterr().out
+    assert dict(run.get_service().repo.expenses.items()) == {
+        "1": {
+            "trip_id": "1", "amount": 10.0, "category": "Food",
+            "description": "Lunch",
+        }
+    }
+
+
+def test_analytics_are_labelled_with_the_currency_code(
+    bad_trip, monkeypatch, capsys
+):
+    answer(monkeypatch, "", "1", "", "12.5", "Food", "Lunch")
+    run.add_expense()
+    capsys.readouterr()
+    answer(monkeypatch, "", "")
+    run.show_analytics()
+    out = capsys.readouterr().out
+    assert "Total spent: 12.50 USD over 1 expense(s)" in out
+    assert "$" not in out
+
+
+def test_analytics_report_expenses_left_out(monkeypatch, capsys):
+    save_data("trips.json", {"1": trip(currency="EUR")})
+    answer(monkeypatch, "", "1", "", "12.5", "Food", "Lunch", "")
+    run.add_expense()
+    capsys.readouterr()
+    answer(monkeypatch, "", "")
+    run.show_analytics()
+    out = capsys.readouterr().out
+    assert "1 expense(s) left out: no exchange rate to USD." in out
+    assert "No matching expenses found." in out
+
+
+def test_expense_amount_must_be_finite(monkeypatch, capsys):
+    save_data("trips.json", {"1": trip(budget="100")})
+    answer(monkeypatch, "", "1", "", "inf", "10", "Food", "Lunch", "")
+    run.add_expense()
+    assert "Please enter a valid number." in capsys.readouterr().out
+    assert run.get_service().repo.spent_cents("1") == 1000
+
+
+def test_storage_errors_end_a_session_cleanly(monkeypatch, capsys):
+    def main():
+        raise StorageError("Set a tenant")
+    monkeypatch.setattr(run, "main", main)
+    assert run.start() == 1
+    assert "Set a tenant" in capsys.readouterr().out
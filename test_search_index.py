@@ -0,0 +1,41 @@
+"""Tests of full-text search."""
+from conftest import expense, trip
+from repository import Repository, open_store
+from search_index import fold, words
+
+
+def test_words_are_folded():
+    assert fold("Café") == "cafe"
+    assert words("Crème brûlée, São Paulo!") == [
+        "creme", "brulee", "sao", "paulo"
+    ]
+
+
+def test_search_follows_changes(service):
+    service.add_trip("1", trip(destination="Lisbon"))
+    service.add_trip("2", trip(destination="Porto"))
+    service.add_expense("1", expense("1", 10, description="Pastéis"))
+    assert [
+        (collection, record_id)
+        for collection, record_id, _ in service.search("pasteis")
+    ] == [("expenses", "1")]
+    service.update_expense("1", {"description": "Tram ticket"})
+    service.add_expense("2", expense("2", 4, description="Port tasting"))
+    assert service.search("pasteis") == []
+    assert ("expenses", "2") in [
+        (collection, record_id)
+        for collection, record_id, _ in service.search("port")
+    ]
+    service.delete_trip("2")
+    assert service.search("port") == []
+
+
+def test_saved_index_catches_up(service):
+    service.add_trip("1", trip(destination="Lisbon"))
+    assert service.search("lisbon")
+    other = Repository(open_store())
+    service.add_trip("2", trip(destination="Lisbon coast"))
+    other.refresh()
+    assert sorted(
+        record_id for _, record_id in other.search("lisbon")
+    ) == ["1", "2"]
@@ -0,0 +1,97 @@
+"""Tests of the planner's rules and the JSON API routes."""
+import pytest
+
+from api_server import HttpError, handle
+from conftest import expense, trip
+from service import NotFoundError, ServiceError
+
+
+@pytest.mark.parametrize("fields, message", [
+    (trip(destination=" "), "Destination cannot be empty."),
+    (trip(start="2020-01-01"), "Invalid start date"),
+    (trip(end="2031-04-30"), "End date cannot be earlier"),
+    (trip(budget="-1"), "Invalid budget"),
+    (trip(currency="EURO"), "Invalid currency"),
+])
+def test_invalid_trips_are_refused(service, fields, message):
+    with pytest.raises(ServiceError, match=message):
+        service.add_trip("1", fields)
+    assert not service.repo.trips
+
+
+def test_expenses_are_checked_against_their_trip(service):
+    service.add_trip("1", trip())
+    with pytest.raises(ServiceError, match="not found"):
+        service.add_expense("1", expense("2", 10))
+    with pytest.raises(ServiceError, match="within the trip duration"):
+        service.add_expense("1", expense("1", 10, date="2031-06-01"))
+    with pytest.raises(ServiceError, match="No exchange rate"):
+        service.add_expense("1", expense("1", 10, currency="EUR"))
+    with pytest.raises(NotFoundError):
+        service.get_expense("1")
+
+
+@pytest.mark.parametrize("amount", ["inf", "-Infinity", "nan", "1e999"])
+def test_amounts_must_be_finite(service, amount):
+    service.add_trip("1", trip())
+    with pytest.raises(ServiceError, match="Invalid amount"):
+        service.add_expense("1", expense("1", amount))
+    with pytest.raises(ServiceError, match="Invalid amount"):
+        service.over_budget("1", float(amount))
+    assert not service.repo.expenses
+
+
+def test_dates_cannot_fall_within_invalid_trip_dates(service):
+    service.repo.save_trip("1", trip(start="soon"))
+    with pytest.raises(ServiceError, match="The trip has invalid dates"):
+        service.add_expense("1", expense("1", 10, date="2031-05-02"))
+    service.add_expense("1", expense("1", 10))
+
+
+def test_deleting_a_trip_deletes_its_records(service):
+    service.add_trip("1", trip())
+    service.add_trip("2", trip())
+    service.add_itinerary_entry(
+        "1", {"trip_id": "1", "date": "2031-05-02", "activity": "Museum"}
+    )
+    service.add_expense("1", expense("1", 10))
+    service.add_expense("2", expense("2", 10))
+    service.delete_trip("1")
+    assert not service.repo.itinerary
+    assert list(service.repo.expenses) == ["2"]
+    assert list(service.repo.ledger.entries) == ["2"]
+
+
+def test_trips_by_date_range(service):
+    service.add_trip("1", trip(start="2031-05-01", end="2031-05-10"))
+    service.add_trip("2", trip(start="2031-05-08", end="2031-05-20"))
+    service.add_trip("3", trip(start="2031-06-01", end="2031-06-02"))
+    assert [trip_id for trip_id, _ in service.overlapping_trips(
+        "2031-05-09", "2031-06-01"
+    )] == ["1", "2", "3"]
+    assert [trip_id for trip_id, _ in service.overlapping_trips(
+        "2031-05-15", "2031-05-31", trip_id="2"
+    )] == []
+
+
+def test_api_routes(service):
+    assert handle(service, "POST", "/trips", {}, trip()) == (
+        201, {"id": "1", **trip()}
+    )
+    status, created = handle(
+        service, "POST", "/expenses", {}, expense("1", "12.5")
+    )
+    assert status == 201 and created["amount"] == 12.5
+    assert handle(
+        service, "PATCH", "/expenses/1", {}, {"amount": "20"}
+    )[1]["amount"] == 20.0
+    assert handle(service, "GET", "/expenses", {"trip_id": "1"}, None)[1] == [
+        {"id": "1", **expense("1", 20.0)}
+    ]
+    assert handle(service, "GET", "/analytics", {}, None)[1] == {
+        "amount": 20.0, "count": 1, "left_out": 0,
+        "by": [{"category": "Food", "amount": 20.0, "count": 1}],
+    }
+    assert handle(service, "DELETE", "/expenses/1", {}, None) == (204, None)
+    with pytest.raises(HttpError):
+        handle(service, "GET", "/nowhere", {}, None)
@@ -0,0 +1,125 @@
+"""Tests of the spending rollups."""
+import json
+import random
+
+from columnar import ExpenseColumns, from_cents
+from api_server import handle
+from conftest import expense, trip
+from repository import Repository, open_store
+from spend_cube import ALL, SpendCube
+
+CATEGORIES = ("Food", "food ", "Hotel", "")
+DAYS = (None, "2031-05-01", "2031-05-02")
+
+
+def random_expenses(count, seed=1):
+    chance = random.Random(seed)
+    expenses = {}
+    for number in range(count):
+        record = expense(
+            str(chance.randint(1, 3)), chance.randint(0, 9999) / 100,
+            category=chance.choice(CATEGORIES)
+        )
+        day = chance.choice(DAYS)
+        if day:
+            record["date"] = day
+        expenses[str(number)] = record
+    return expenses
+
+
+def test_built_cube_matches_one_built_expense_by_expense():
+    expenses = random_expenses(300)
+    columns = ExpenseColumns(expenses)
+    for expense_id in list(expenses)[::7]:
+        columns.delete(expense_id)
+        del expenses[expense_id]
+    incremental = SpendCube()
+    for record in expenses.values():
+        incremental.add_expense(record)
+    assert SpendCube.from_columns(columns).cells == incremental.cells
+
+
+def test_expenses_counted_out_leave_no_cells():
+    cube = SpendCube()
+    record = expense("1", 5, date="2031-05-01")
+    cube.add_expense(record)
+    cube.add_expense(record, -1)
+    assert cube.cells == {}
+
+
+def test_rollups():
+    cube = SpendCube.from_columns(ExpenseColumns({
+        "1": expense("1", 10, date="2031-05-01"),
+        "2": expense("1", 5),
+        "3": expense("2", 2.5, category="Hotel", date="2031-05-01"),
+    }))
+    assert cube.total() == (1750, 3)
+    assert cube.total("1", "Food") == (1500, 2)
+    assert cube.total(day="2031-05-01") == (1250, 2)
+    assert cube.breakdown("category") == {
+        "Food": (1500, 2), "Hotel": (250, 1)
+    }
+    assert cube.breakdown("day", "1") == {
+        "2031-05-01": (1000, 1), None: (500, 1)
+    }
+    assert cube.breakdown("trip", category="Hotel") == {"2": (250, 1)}
+    assert ALL not in cube.breakdown("trip")
+
+
+def test_categories_are_keyed_as_in_the_ledger(service):
+    service.add_trip("1", trip())
+    for number, category in enumerate(("Food", "food", "Food"), start=1):
+        service.add_expense(str(number), expense("1", 1, category=category))
+    service.repo.save_expense("4", expense("1", 1, category=None))
+    assert {
+        category: (from_cents(entry["spent"]), entry["count"])
+        for category, entry in service.repo.ledger.entries["1"][
+            "categories"
+        ].items()
+    } == {
+        category: (amount, count)
+        for category, amount, count in service.spend_by("category")
+    } == {"Food": (2.0, 2), "food": (1.0, 1), "Uncategorised": (1.0, 1)}
+
+
+def test_service_keeps_the_cube_up_to_date(service):
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", 10))
+    assert service.spend_total() == (10.0, 1)
+    service.add_expense("2", expense("1", 5, category="Hotel"))
+    service.update_expense("1", {"amount": "12"})
+    assert service.spend_by("category") == [
+        ("Food", 12.0, 1), ("Hotel", 5.0, 1)
+    ]
+    service.delete_trip("1")
+    assert service.spend_total() == (0.0, 0)
+
+
+def test_unconvertible_amounts_are_left_out(service, data_dir):
+    service.add_trip("1", trip(currency="EUR"))
+    service.add_trip("2", trip())
+    service.add_expense("1", expense("1", 10))
+    service.spend_total()  # Builds the cube, kept up to date from here
+    service.add_expense("2", expense("1", 5, category="Hotel"))
+    service.add_expense("3", expense("2", 2))
+    # No rate from EUR to USD: the EUR expenses are only counted
+    assert service.spend_total() == (2.0, 1)
+    assert service.spend_left_out() == 2
+    assert service.spend_left_out("1", "Hotel") == 1
+    assert service.spend_by("trip") == [("2", 2.0, 1)]
+    assert handle(service, "GET", "/analytics", {}, None)[1] == {
+        "amount": 2.0, "count": 1, "left_out": 2,
+        "by": [{"category": "Food", "amount": 2.0, "count": 1}],
+    }
+    cube = service.repo.spending()
+    built = Repository(open_store()).spending()
+    assert (built.cells, built.left_out) == (cube.cells, cube.left_out)
+    service.delete_expense("2")
+    assert service.spend_left_out() == 1
+
+    (data_dir / "rates.json").write_text(json.dumps(
+        {"base": "USD", "rates": {"2031-01-01": {"EUR": 0.5}}}
+    ))
+    service.repo = Repository(open_store())
+    assert service.spend_total() == (22.0, 2)
+    assert service.spend_left_out() == 0
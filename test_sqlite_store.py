@@ -0,0 +1,50 @@
+"""Tests of the SQLite backend."""
+import json
+
+from conftest import expense, trip
+from sqlite_store import SqliteStore, export_json, import_json
+from storage import save_data
+
+TRIPS = {"1": trip(), "2": trip("Porto", currency="EUR", note="kept")}
+EXPENSES = {
+    "1": expense("1", 12.5, date="2031-05-02"),
+    "2": expense("2", 3, currency="GBP"),
+}
+
+
+def test_json_files_round_trip(data_dir):
+    save_data("trips.json", TRIPS)
+    save_data("itinerary.json", {
+        "1": {"trip_id": "1", "date": "2031-05-02", "activity": "Zoo"},
+        "2": {"trip_id": "9", "date": "2031-05-02", "activity": "Zoo"},
+    })
+    save_data("expenses.json", EXPENSES)
+    store = SqliteStore("planner.db")
+    assert import_json(store) == {"itinerary": ["2"]}
+    (data_dir / "out").mkdir()
+    export_json(store, "out")
+    store.close()
+    for name, records in (("trips", TRIPS), ("expenses", EXPENSES)):
+        # Plain JSON, whatever the snapshot format
+        with open(data_dir / "out" / (name + ".json")) as file:
+            assert json.load(file) == records
+    with open(data_dir / "out" / "itinerary.json") as file:
+        assert list(json.load(file)) == ["1"]
+    assert sorted(path.name for path in (data_dir / "out").iterdir()) == [
+        "expenses.json", "itinerary.json", "trips.json"
+    ]
+
+
+def test_sessions_pick_up_changes_from_the_changelog():
+    first, second = SqliteStore("planner.db"), SqliteStore("planner.db")
+    assert second.load("trips") == {}
+    with first.transaction(["trips"]):
+        first.catch_up("trips")
+        first.apply([("trips", "1", TRIPS["1"]), ("trips", "2", TRIPS["2"])])
+    with first.transaction(["trips"]):
+        first.catch_up("trips")
+        first.apply([("trips", "1", None)])
+    changes, data = second.catch_up("trips")
+    assert data is None
+    assert dict(changes) == {"1": None, "2": TRIPS["2"]}
+    assert second.catch_up("trips") == ([], None)
@@ -0,0 +1,64 @@
+"""Tests of the stores and snapshot formats."""
+import pytest
+
+import codec
+from conftest import expense, trip
+from repository import Repository, open_store
+from storage import ConflictError, JsonStore, load_data, save_data
+
+RECORDS = {
+    "1": {"trip_id": "1", "amount": 12.5, "category": "Food"},
+    "2": {"trip_id": "1", "amount": 3, "note": "é"},
+    "3": {"destination": "Lisbon"},
+}
+
+
+@pytest.mark.parametrize("name", sorted(codec.ENCODERS))
+def test_formats_round_trip(name):
+    assert codec.decode(codec.encode(RECORDS, name)) == RECORDS
+
+
+@pytest.mark.parametrize("name", sorted(codec.ENCODERS))
+def test_log_is_replayed_over_any_snapshot(name, monkeypatch):
+    monkeypatch.setenv(codec.FORMAT_ENV, name)
+    store = JsonStore()
+    save_data(store.path("expenses"), RECORDS)
+    with store.transaction(["expenses"]):
+        store.catch_up("expenses")
+        store.apply([
+            ("expenses", "2", None), ("expenses", "4", {"amount": 1}),
+        ])
+    expected = {"1": RECORDS["1"], "3": RECORDS["3"], "4": {"amount": 1}}
+    assert JsonStore().load("expenses") == expected
+    assert dict(JsonStore().stream("expenses")) == expected
+    store.compact("expenses")
+    assert load_data(store.path("expenses")) == expected
+
+
+def test_sessions_see_each_others_changes(service):
+    other = Repository(open_store())
+    service.add_trip("1", trip())
+    service.add_expense("1", expense("1", 10))
+    other.refresh()
+    assert other.trips == service.repo.trips
+    assert dict(other.expenses.items()) == dict(service.repo.expenses.items())
+    assert other.ledger.entries == service.repo.ledger.entries
+
+
+def test_stale_writes_are_refused(service):
+    other = Repository(open_store())
+    service.add_trip("1", trip())
+    other.refresh()
+    service.update_trip("1", {"budget": "500"})
+    with pytest.raises(ConflictError):
+        other.save_trip("1", trip(budget="700"), expected=trip())
+    assert service.repo.trips["1"]["budget"] == "500"
+
+
+def test_ids_come_from_a_sequence(service):
+    first, _ = service.add_trip("", trip())
+    second, _ = service.add_trip("", trip())
+    service.add_trip("10", trip())
+    third, _ = service.add_trip("", trip())
+    assert (first, second, third) == ("1", "2", "11")
+    assert Repository(open_store()).new_id("trips") == "12"
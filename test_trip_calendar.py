@@ -0,0 +1,53 @@
+"""Tests of the index of trip dates."""
+import random
+from datetime import date, timedelta
+
+import trip_calendar
+from trip_calendar import TripCalendar, parse_day
+
+
+def test_parse_day():
+    assert parse_day("2031-05-01") == date(2031, 5, 1).toordinal()
+    assert parse_day("2031-5-1") == date(2031, 5, 1).toordinal()
+    assert parse_day("1111-12-24") == date(1111, 12, 24).toordinal()
+    assert parse_day("") is None
+    assert parse_day(None) is None
+
+
+def test_invalid_and_reversed_trips_are_left_out():
+    calendar = TripCalendar()
+    calendar.put("1", {"start_date": "2031-05-10", "end_date": "2031-05-01"})
+    calendar.put("2", {"start_date": "soon", "end_date": "2031-05-01"})
+    assert calendar.dates("1") is None
+    assert calendar.dates("2") is None
+    assert calendar.overlapping() == []
+
+
+def test_queries_match_a_scan(monkeypatch):
+    monkeypatch.setattr(trip_calendar, "MIN_CHANGED", 4)
+    monkeypatch.setattr(trip_calendar, "LEAF_SIZE", 2)
+    chance = random.Random(2)
+    first = date(2031, 1, 1)
+    calendar, trips = TripCalendar(), {}
+    for number in range(400):
+        trip_id = str(chance.randint(1, 150))
+        if chance.random() < 0.2:
+            calendar.discard(trip_id)
+            trips.pop(trip_id, None)
+            continue
+        start = first + timedelta(chance.randint(0, 300))
+        end = start + timedelta(chance.randint(0, 20))
+        calendar.put(trip_id, {
+            "start_date": start.isoformat(), "end_date": end.isoformat()
+        })
+        trips[trip_id] = (start, end)
+        low = first + timedelta(chance.randint(0, 320))
+        high = low + timedelta(chance.randint(0, 10))
+        assert set(calendar.overlapping(low, high)) == {
+            other_id for other_id, (start, end) in trips.items()
+            if start <= high and end >= low
+        }
+        assert set(calendar.active_on(low)) == {
+            other_id for other_id, (start, end) in trips.items()
+            if start <= low <= end
+        }
@@ -0,0 +1,190 @@
+"""Index of the days every trip covers.
+
+Answers which trips overlap a date range, or are under way on a day, in
+O(log n + k) for k trips found, and gives a trip's dates without
+parsing them again. Dates are held as day ordinals, parsed once when a
+trip is put in.
+
+The index is a centered interval tree (for the trips under way on the
+first day asked about) plus the trips sorted by start (for those
+starting later in the range), built with numpy. Both are rebuilt only
+when the trips changed since the last build outgrow the square root of
+the total; until then, queries check those few changed trips one by
+one.
+"""
+from datetime import date, datetime
+from itertools import chain
+
+# Changed trips checked one by one before the index is rebuilt
+MIN_CHANGED = 64
+# Tree nodes with this few trips are searched directly
+LEAF_SIZE = 32
+
+
+def parse_day(text):
+    """Returns the ordinal of a YYYY-MM-DD string, or None if invalid."""
+    text = str(text)
+    try:
+        if len(text) == 10 and text[4] == text[7] == "-":
+            return date.fromisoformat(text).toordinal()
+        return datetime.strptime(text, "%Y-%m-%d").toordinal()
+    except ValueError:
+        return None
+
+
+class _Node:
+    """Trips covering the center day, with the earlier and later ones.
+
+    Trips are positions in the start-sorted arrays of the index.
+    """
+
+    __slots__ = (
+        "center", "leaf", "starts", "by_start", "neg_ends", "by_end",
+        "left", "right"
+    )
+
+    def __init__(self, positions, starts, ends):
+        # positions are in start order, which the masks below keep
+        self.leaf = len(positions) <= LEAF_SIZE
+        if self.leaf:
+            self.by_start = positions
+            return
+        middle = positions[len(positions) // 2]
+        center = self.center = (starts[middle] + ends[middle]) // 2
+        position_starts = starts[positions]
+        position_ends = ends[positions]
+        before = position_ends < center
+        after = position_starts > center
+        here = positions[~(before | after)]
+        self.by_start = here
+        self.starts = starts[here]
+        self.by_end = here[(-ends[here]).argsort(kind="stable")]
+        self.neg_ends = -ends[self.by_end]
+        self.left = _Node(positions[before], starts, ends) if (
+            before.any()
+        ) else None
+        self.right = _Node(positions[after], starts, ends) if (
+            after.any()
+        ) else None
+
+    def under_way(self, day, starts, ends):
+        """Returns arrays of the positions of the trips covering a day."""
+        found = []
+        node = self
+        while node is not None:
+            if node.leaf:
+                positions = node.by_start
+                found.append(positions[
+                    (starts[positions] <= day) & (ends[positions] >= day)
+                ])
+                break
+            if day < node.center:
+                found.append(node.by_start[
+                    :node.starts.searchsorted(day, "right")
+                ])
+                node = node.left
+            elif day > node.center:
+                found.append(node.by_end[
+                    :node.neg_ends.searchsorted(-day, "right")
+                ])
+                node = node.right
+            else:
+                found.append(node.by_start)
+                break
+        return found
+
+
+class TripCalendar:
+    """The date range of every trip with valid dates, keyed by trip ID."""
+
+    def __init__(self):
+        self.ranges = {}  # trip ID -> (start, end) ordinals
+        self._changed = set()  # trips changed since the last build
+        self._root = None
+        self._starts = self._ends = None  # start-sorted numpy arrays
+        self._ids = []
+
+    def put(self, trip_id, trip):
+        """Indexes a trip's dates, replacing any it had."""
+        start = parse_day(trip.get("start_date"))
+        end = parse_day(trip.get("end_date"))
+        if start is None or end is None or end < start:
+            self.ranges.pop(trip_id, None)
+        else:
+            self.ranges[trip_id] = (start, end)
+        self._changed.add(trip_id)
+
+    def discard(self, trip_id):
+        """Drops a trip from the index."""
+        self.ranges.pop(trip_id, None)
+        self._changed.add(trip_id)
+
+    def dates(self, trip_id):
+        """Returns a trip's (start, end) dates, or None if not indexed."""
+        days = self.ranges.get(trip_id)
+        if days is None:
+            return None
+        return date.fromordinal(days[0]), date.fromordinal(days[1])
+
+    def _build(self):
+        import numpy as np
+
+        ids = list(self.ranges)
+        days = np.fromiter(
+            chain.from_iterable(self.ranges.values()), "int64",
+            2 * len(ids)
+        ).reshape(-1, 2)
+        order = np.lexsort((days[:, 1], days[:, 0]))
+        self._starts = days[order, 0]
+        self._ends = days[order, 1]
+        self._ids = list(map(ids.__getitem__, order.tolist()))
+        self._root = _Node(
+            np.arange(len(ids)), self._starts, self._ends
+        ) if ids else None
+        self._changed = set()
+
+    def overlapping(self, start=None, end=None):
+        """Returns the IDs of the trips with a day in a date range.
+
+        Either end of the range may be None for no limit. Trips come in
+        order of their start dates.
+        """
+        if self._starts is None or len(self._changed) > max(
+            MIN_CHANGED, len(self.ranges) ** 0.5
+        ):
+            self._build()
+        first = start.toordinal() if start is not None else None
+        last = end.toordinal() if end is not None else None
+        if first is not None and last is not None and last < first:
+            return []
+        # The trips starting inside the range, after its first day...
+        low = 0 if first is None else int(
+            self._starts.searchsorted(first, "right")
+        )
+        high = len(self._ids) if last is None else max(
+            low, int(self._starts.searchsorted(last, "right"))
+        )
+        positions = list(range(low, high))
+        # ...and the ones already under way on it
+        if first is not None and self._root is not None:
+            for found in self._root.under_way(
+                first, self._starts, self._ends
+            ):
+                positions += found.tolist()
+        ids, changed = self._ids, self._changed
+        found = [
+            ids[position] for position in positions
+            if ids[position] not in changed
+        ]
+        for trip_id in changed:
+            days = self.ranges.get(trip_id)
+            if days is not None and (
+                (last is None or days[0] <= last)
+                and (first is None or days[1] >= first)
+            ):
+                found.append(trip_id)
+        return sorted(found, key=lambda trip_id: self.ranges[trip_id])
+
+    def active_on(self, day):
+        """Returns the IDs of the trips under way on a day."""
+        return self.overlapping(day, day)
@@ -0,0 +1,42 @@
+"""Removal of records left behind by deleted trips.
+
+Trips used to be deleted on their own, leaving their itinerary entries
+and expenses in the data files. This finds the trips those records
+still point at, through the per-trip indexes, deletes the records in
+one write and compacts every collection, so the files no longer carry
+them or the log of their changes.
+
+Usage:
+    python run.py vacuum [--dry-run]
+"""
+import argparse
+
+from repository import get_repository
+
+
+def vacuum_command(argv):
+    """Runs the vacuum command; returns the process exit status."""
+    parser = argparse.ArgumentParser(
+        prog="run.py vacuum",
+        description="Delete itinerary entries and expenses of deleted "
+                    "trips and compact the data files."
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="only report what would be deleted"
+    )
+    args = parser.parse_args(argv)
+
+    repo = get_repository()
+    orphaned = repo.orphaned_trips()
+    for trip_id in orphaned:
+        print(f"Trip {trip_id} is missing but has "
+              f"{len(repo.itinerary_by_trip.get(trip_id, ()))} itinerary "
+              f"entry(ies) and "
+              f"{len(repo.expenses_by_trip.get(trip_id, ()))} expense(s).")
+    if args.dry_run:
+        return 0
+    deleted = repo.purge_orphans()
+    print(f"Deleted {deleted.get('itinerary', 0)} itinerary entry(ies) and "
+          f"{deleted.get('expenses', 0)} expense(s); data files compacted.")
+    return 0
@@ -0,0 +1,37 @@
+"""Input validation rules shared by the menus and the batch importer."""
+from datetime import datetime
+
+
+def validate_date(date_str):
+    """Validates if the date is today or a future date."""
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        current_date = datetime.now().date()
+
+        if date_obj.date() >= current_date:
+            return True
+        else:
+            return False
+    except ValueError:
+        return False
+
+
+def validate_budget(budget_str):
+    """Validates if the budget is a positive number."""
+    try:
+        budget = float(budget_str)
+        if budget > 0:
+            return True
+        else:
+            return False
+    except ValueError:
+        return False
+
+
+def validate_date_format(date_str):
+    """Validates if the given date string matches the YYYY-MM-DD format."""
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False